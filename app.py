@@ -5,22 +5,102 @@ A Socratic tutoring system that helps students improve their argumentative writi
 through targeted questions, not direct answers.
 """
 
+import contextlib
+import time
+
 import streamlit as st
+import tracing
 from core_engine import SocraticEngine
-from passage_config import (
-    PASSAGE_TITLE, PASSAGE_TEXT, WRITING_PROMPT, 
-    VALUE_RUBRIC, DIMENSION_ORDER, TARGET_SCORE
-)
+from passage_config import DIMENSION_ORDER, TARGET_SCORE
+from passage_registry import DEFAULT_PASSAGE_ID
+from rate_limiter import expected_wait, set_session
+from session_snapshot import capture, rebuild
+from session_store import STORE_ERRORS, VersionConflict, get_session_store
 from session_logger import (
     get_session_id, log_phase_transition, log_complete_session,
     build_export_json
 )
 
 
+def new_engine() -> SocraticEngine:
+    """Engine for the assignment in the URL (?passage=<id>), else the default passage."""
+    passage_id = st.query_params.get("passage") or DEFAULT_PASSAGE_ID
+    try:
+        return SocraticEngine(passage_id)
+    except (KeyError, ValueError):
+        st.warning(f"Assignment '{passage_id}' isn't available — showing the default passage.")
+        return SocraticEngine()
+
+
+# App state saved with the session, next to the engine's own
+UI_STATE = ("phase", "show_passage", "messages", "validation_result", "draft_text", "session_logged")
+
+
+def adopt_state(version: int, state: dict) -> bool:
+    """Replace this run's session with a stored one."""
+    try:
+        st.session_state.engine = rebuild(state)
+    except (KeyError, ValueError, TypeError):
+        return False  # e.g. its assignment was removed
+    for key, value in state.get("ui", {}).items():
+        if key in UI_STATE:
+            st.session_state[key] = value
+    st.session_state.state_version = version
+    st.session_state.saved_state = dict(state, saved_at=None, version=None)
+    return True
+
+
+def sync_session() -> bool:
+    """Load the session from the store when this process doesn't have its latest state.
+
+    That's the session named in the URL (?session=<id>) after a restart, a
+    reconnect or a move to another replica, and any session another tab (or,
+    with a shared store, another replica) has saved since this one did.
+    """
+    store = get_session_store()
+    session_id = st.session_state.get("session_id") or st.query_params.get("session")
+    if not session_id:
+        return False
+    known = 'engine' in st.session_state
+    try:
+        if known and store.version(session_id) == st.session_state.get("state_version", 0):
+            return False
+        stored = store.load(session_id)
+    except STORE_ERRORS:
+        return False
+    if stored is None or not adopt_state(*stored):
+        return False
+    st.session_state.session_id = session_id
+    if known:
+        st.info("This session was updated in another window — showing the latest version.")
+    return True
+
+
+def checkpoint_session():
+    """Save the session if this run changed it; runs at the end of every run."""
+    if 'engine' not in st.session_state or 'session_id' not in st.session_state:
+        return
+    ui = {key: st.session_state.get(key) for key in UI_STATE}
+    try:
+        state = capture(st.session_state.engine, ui)
+        unchanged = dict(state, saved_at=None, version=None)
+        if unchanged == st.session_state.get("saved_state"):
+            return
+        st.session_state.state_version = get_session_store().save(
+            st.session_state.session_id, state, st.session_state.get("state_version", 0))
+        st.session_state.saved_state = unchanged
+    except VersionConflict:
+        # Saved elsewhere first; the next run loads that version
+        st.warning("This session was changed in another window, so this step wasn't saved. "
+                   "Your next action continues from that window's latest version.")
+    except STORE_ERRORS + (TypeError,):
+        pass  # Never break the session over persistence
+
+
 def init_session():
     """Initialize session state."""
-    if 'engine' not in st.session_state:
-        st.session_state.engine = SocraticEngine()
+    if not sync_session() and 'engine' not in st.session_state:
+        st.session_state.engine = new_engine()
     if 'phase' not in st.session_state:
         st.session_state.phase = 'read'
     if 'show_passage' not in st.session_state:
@@ -31,17 +111,64 @@ def init_session():
         st.session_state.validation_result = None
     if 'draft_text' not in st.session_state:
         st.session_state.draft_text = ""
-    # Initialize session ID for logging
-    get_session_id()
+    # Initialize session ID for logging; the rate limiter queues this session's calls under it
+    session_id = get_session_id()
+    set_session(session_id)
+    # Keep the ID in the URL so a reload, reconnect or another replica resumes this session
+    if st.query_params.get("session") != session_id:
+        st.query_params["session"] = session_id
+
+
+def stream_renderer(placeholder, min_interval: float = 0.05):
+    """Return an on_delta callback that renders streamed text into placeholder.
+
+    Redraws are throttled so a fast stream doesn't re-render markdown per token.
+    """
+    chunks = []
+    last_draw = [0.0]
+    
+    def on_delta(text: str):
+        chunks.append(text)
+        now = time.monotonic()
+        if now - last_draw[0] >= min_interval:
+            placeholder.markdown("".join(chunks) + " ▌")
+            last_draw[0] = now
+    
+    return on_delta
+
+
+def busy_spinner(message: str, task: str) -> str:
+    """Spinner text, with the expected wait when the class is queued up for the API."""
+    wait = expected_wait(task)
+    if wait < 3:
+        return message
+    return f"{message} (lots of students are submitting right now — about {wait:.0f}s)"
+
+
+@contextlib.contextmanager
+def student_action(name: str, message: str, task: str):
+    """Spinner for a student action, traced as the root span of that action.
+
+    The action ends in st.rerun(); the next run picks up trace_parent so the
+    re-render joins the same trace.
+    """
+    with tracing.span(f"action.{name}", session_id=get_session_id(),
+                      phase=st.session_state.get("phase")) as action:
+        try:
+            with st.spinner(busy_spinner(message, task)):
+                yield action
+        finally:
+            if action.sampled:
+                st.session_state.trace_parent = action.context()
 
 
-def render_scores(scores: dict):
+def render_scores(scores: dict, rubric: dict):
     """Render score display."""
     cols = st.columns(5)
     for i, dim in enumerate(DIMENSION_ORDER):
         with cols[i]:
             score = scores[dim]['score']
-            name = VALUE_RUBRIC[dim]['name']
+            name = rubric[dim]['name']
             
             if score >= TARGET_SCORE:
                 color = "🟢"
@@ -204,8 +331,8 @@ At the end, you'll answer a few short questions about your experience. This isn'
         st.markdown("## Step 1: Read the Passage")
         st.info("Take your time reading. You'll need to reference specific details in your response.")
         
-        st.markdown(f"### {PASSAGE_TITLE}")
-        st.markdown(PASSAGE_TEXT)
+        st.markdown(f"### {engine.bundle.title}")
+        st.markdown(engine.bundle.passage_text)
         
         if st.button("I've read it — let me write!", type="primary", use_container_width=True):
             st.session_state.phase = 'write'
@@ -216,9 +343,9 @@ At the end, you'll answer a few short questions about your experience. This isn'
         st.markdown("## Step 2: Write Your Response")
         
         with st.expander("📖 View passage again"):
-            st.markdown(PASSAGE_TEXT)
+            st.markdown(engine.bundle.passage_text)
         
-        st.markdown(WRITING_PROMPT)
+        st.markdown(engine.bundle.writing_prompt)
 
         st.markdown("")
         st.markdown("""
@@ -263,20 +390,22 @@ At the end, you'll answer a few short questions about your experience. This isn'
         st.session_state.draft_text = essay
 
         col1, col2 = st.columns(2)
+        live_reply = st.empty()
         
         with col1:
             if st.button("🔍 Check my draft first", type="secondary", use_container_width=True) and essay.strip():
-                with st.spinner("Checking your draft..."):
+                with student_action("validate", "Checking your draft...", "validation"):
                     result = engine.validator.validate(essay.strip())
                     st.session_state.validation_result = result
+                    log_phase_transition('validate', engine, {"action": "draft_check", "tier": result.get("tier")})
                     st.session_state.phase = 'validate'
                     st.rerun()
         
         with col2:
             if st.button("📝 Submit for feedback", type="primary", use_container_width=True) and essay.strip():
-                with st.spinner("📝 Scoring your essay and preparing coaching feedback..."):
+                with student_action("submit", "📝 Scoring your essay and preparing coaching feedback...", "scoring"):
                     st.session_state.draft_text = essay.strip()
-                    result = engine.process_initial_essay(essay)
+                    result = engine.process_initial_essay(essay, on_delta=stream_renderer(live_reply))
                     st.session_state.phase = result['phase']
                     st.session_state.messages.append({
                         'type': 'scores',
@@ -391,6 +520,7 @@ When you're ready:
             """, unsafe_allow_html=True)
             
             col1, col2 = st.columns(2)
+            live_reply = st.empty()
             
             with col1:
                 st.markdown("""
@@ -399,9 +529,10 @@ Made some changes? Check how it looks now
 </div>
                 """, unsafe_allow_html=True)
                 if st.button("🔍 Check my draft again", type="secondary", use_container_width=True) and revised_draft.strip():
-                    with st.spinner("Checking your draft..."):
+                    with student_action("validate", "Checking your draft...", "validation"):
                         new_result = engine.validator.validate(revised_draft.strip())
                         st.session_state.validation_result = new_result
+                        log_phase_transition('validate', engine, {"action": "draft_check", "tier": new_result.get("tier")})
                         st.rerun()
             
             with col2:
@@ -412,9 +543,9 @@ Ready for formal scoring and Socratic coaching
                 """, unsafe_allow_html=True)
                 submit_label = "✅ Submit for scoring" if overall_ready else "⚠️ Submit anyway"
                 if st.button(submit_label, type="primary", use_container_width=True):
-                    with st.spinner("📝 Scoring your essay and preparing coaching feedback..."):
+                    with student_action("submit", "📝 Scoring your essay and preparing coaching feedback...", "scoring"):
                         essay = st.session_state.draft_text
-                        result = engine.process_initial_essay(essay)
+                        result = engine.process_initial_essay(essay, on_delta=stream_renderer(live_reply))
                         st.session_state.phase = result['phase']
                         st.session_state.messages.append({
                             'type': 'scores',
@@ -450,7 +581,7 @@ Ready for formal scoring and Socratic coaching
         
         if latest_scores:
             st.markdown("### Your Scores")
-            render_scores(latest_scores)
+            render_scores(latest_scores, engine.bundle.rubric)
             
             # Show improvement if there are previous scores
             if prev_scores:
@@ -504,7 +635,7 @@ Ready for formal scoring and Socratic coaching
         """, unsafe_allow_html=True)
         
         with st.expander("📖 View passage"):
-            st.markdown(PASSAGE_TEXT)
+            st.markdown(engine.bundle.passage_text)
         
         revision = st.text_area(
             "Your revised draft:",
@@ -514,10 +645,11 @@ Ready for formal scoring and Socratic coaching
             label_visibility="collapsed"
         )
         
+        live_reply = st.empty()
         if st.button("Submit revision", type="primary", use_container_width=True) and revision.strip():
-            with st.spinner("📝 Scoring your revision and preparing coaching feedback..."):
+            with student_action("revise", "📝 Scoring your revision and preparing coaching feedback...", "scoring"):
                 st.session_state.draft_text = revision.strip()
-                result = engine.process_revision(revision)
+                result = engine.process_revision_concurrent(revision, on_delta=stream_renderer(live_reply))
                 st.session_state.phase = result['phase']
                 st.session_state.messages.append({
                     'type': 'scores',
@@ -560,7 +692,7 @@ We want to hear about YOUR experience — what worked, what didn't, and what cou
             for dim in DIMENSION_ORDER:
                 first = first_scores[dim]['score']
                 final = final_scores[dim]['score']
-                name = VALUE_RUBRIC[dim]['name']
+                name = engine.bundle.dimension_name(dim)
                 
                 if final > first:
                     st.markdown(f"**{name}:** {first} → {final} ⬆️")
@@ -582,15 +714,14 @@ We want to hear about YOUR experience — what worked, what didn't, and what cou
         reflection_turn = engine.memory.reflection_turn
         if reflection_turn < len(engine.memory.reflection_responses):
             # Show previous responses
-            from passage_config import REFLECTION_PROMPTS
             for i, resp in enumerate(engine.memory.reflection_responses):
-                st.markdown(f"**{REFLECTION_PROMPTS[i]['question']}**")
+                st.markdown(f"**{engine.bundle.reflection_prompts[i]['question']}**")
                 st.markdown(f"> {resp}")
         
         # Show current question or prompt for response
-        from passage_config import REFLECTION_PROMPTS
-        if reflection_turn < len(REFLECTION_PROMPTS):
-            current_q = REFLECTION_PROMPTS[reflection_turn]['question']
+        reflection_prompts = engine.bundle.reflection_prompts
+        if reflection_turn < len(reflection_prompts):
+            current_q = reflection_prompts[reflection_turn]['question']
             st.markdown(f"### {current_q}")
             
             reflection = st.text_area(
@@ -600,9 +731,10 @@ We want to hear about YOUR experience — what worked, what didn't, and what cou
                 key=f"reflection_{reflection_turn}"
             )
             
+            live_reply = st.empty()
             if st.button("Submit", type="primary", use_container_width=True) and reflection.strip():
-                with st.spinner("🪞 Processing your reflection..."):
-                    result = engine.process_reflection(reflection)
+                with student_action("reflect", "🪞 Processing your reflection...", "reflection"):
+                    result = engine.process_reflection(reflection, on_delta=stream_renderer(live_reply))
                     st.session_state.phase = result['phase']
                     st.session_state.messages.append({
                         'type': 'coaching',
@@ -671,16 +803,32 @@ We want to hear about YOUR experience — what worked, what didn't, and what cou
         
         if st.button("✅ I'm Finished — Start a New Session", type="primary", use_container_width=True):
             # Reset everything
-            st.session_state.engine = SocraticEngine()
+            st.session_state.engine = new_engine()
             st.session_state.phase = 'read'
             st.session_state.messages = []
             st.session_state.validation_result = None
             st.session_state.draft_text = ""
             st.session_state.session_logged = False
             if 'session_id' in st.session_state:
+                try:
+                    get_session_store().delete(st.session_state.session_id)
+                except STORE_ERRORS:
+                    pass
                 del st.session_state.session_id
+            st.session_state.pop('state_version', None)
+            st.session_state.pop('saved_state', None)
             st.rerun()
 
 
 if __name__ == "__main__":
-    main()
+    # The run after a traced action renders its result: part of the same trace
+    parent = st.session_state.pop("trace_parent", None)
+    with tracing.span("app.rerender", parent=parent) if parent else tracing.NOOP:
+        try:
+            main()
+        finally:
+            # Also on st.rerun()/st.stop(): every transition is saved before the next run,
+            # which may be served by another replica
+            traced = st.session_state.get("trace_parent") or parent
+            with tracing.span("session.checkpoint", parent=traced) if traced else tracing.NOOP:
+                checkpoint_session()
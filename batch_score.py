@@ -0,0 +1,228 @@
+"""
+Offline Batch Scoring for Socratic Writing Tutor
+
+Re-scores a corpus of archived essays with SocraticEngine.score_essay, e.g.
+after a rubric or prompt change. Runs outside Streamlit:
+
+    python batch_score.py essays.jsonl scores.jsonl --concurrency 8
+    python batch_score.py essays.csv scores.jsonl --id-field student_id --text-field response
+
+- Input: JSON Lines or CSV (by file extension), one essay per record
+- Bounded-concurrency worker pool. Calls go through the tutor's own
+  resilience policy and the process-wide rate limiter (rate_limiter.py) in
+  the "batch" class: a 429 pauses every worker for retry-after, and --rpm
+  caps the limiter
+- Results are streamed to the output as JSON Lines, one per essay, flushed as
+  they finish. The output doubles as the checkpoint: re-running the same
+  command skips essays already scored in it, so an interrupted run resumes
+  and essays that failed (error rows) are tried again
+- Essay IDs must be unique; a file with duplicates is rejected up front
+- Throughput (essays/minute) is reported while running and at the end
+
+With --batch-api the essays go through provider batch jobs instead
+(message_batches.py): cheaper, no per-minute limits, results within hours.
+
+    python batch_score.py essays.jsonl scores.jsonl --batch-api --first-try
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import rate_limiter
+from core_engine import SocraticEngine
+from message_batches import reject_duplicate_ids, run_message_batches
+from resilience import UpstreamUnavailable, backoff_delay
+
+
+def read_essays(path: str, id_field: str = "id", text_field: str = "essay"):
+    """Yield (essay_id, text) from a .jsonl or .csv file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for n, record in enumerate(records, start=1):
+            text = (record.get(text_field) or "").strip()
+            essay_id = record.get(id_field)
+            if text:
+                yield str(n if essay_id in (None, "") else essay_id), text
+
+
+def completed_ids(output_path: str) -> set:
+    """IDs already scored in the output file (error rows and torn last lines are ignored)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                if "scores" in row:
+                    done.add(str(row["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return done
+
+
+def score_one(engine, essay_id: str, text: str, max_retries: int = 6) -> dict:
+    started = time.perf_counter()
+    for attempt in range(max_retries + 1):
+        try:
+            # No heuristic fallback: a batch result must be a real score. Batch
+            # calls queue behind live sessions in the shared rate limiter.
+            with rate_limiter.priority("batch"):
+                scores = engine.score_essay(text, fallback=False)
+            break
+        except UpstreamUnavailable as exc:
+            # The call already retried briefly (a 429 also paused the limiter
+            # for every worker); past that, a batch can afford to wait
+            if exc.reason == "unparseable":
+                return {"id": essay_id, "error": f"{type(exc.cause).__name__}: {exc}", "parse_failed": True}
+            if attempt == max_retries or exc.reason == "error":
+                return {"id": essay_id, "error": f"{type(exc.cause or exc).__name__}: {exc}"}
+            time.sleep(backoff_delay(attempt, exc.cause, cap=60.0))
+        except Exception as exc:
+            return {"id": essay_id, "error": f"{type(exc).__name__}: {exc}"}
+    return {
+        "id": essay_id,
+        "scores": scores,
+        "parse_failed": False,
+        "latency_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 8, rpm: float = 0,
+              id_field: str = "id", text_field: str = "essay", report_every: float = 10.0,
+              passage_id: str = None) -> dict:
+    done = completed_ids(output_path)
+    essays = list(read_essays(input_path, id_field, text_field))
+    reject_duplicate_ids(essays)
+    pending = [(eid, text) for eid, text in essays if eid not in done]
+    total = len(pending)
+    print(f"{len(done)} already scored, {total} to go", file=sys.stderr)
+
+    engine = SocraticEngine(passage_id)
+    if rpm:
+        rate_limiter.configure(rpm=rpm)
+    limiter = rate_limiter.get_limiter()
+    stats = {"scored": 0, "errors": 0, "parse_failed": 0}
+    started = time.monotonic()
+    last_report = started
+
+    def report(final: bool = False):
+        elapsed = time.monotonic() - started
+        finished = stats["scored"] + stats["errors"]
+        per_min = finished / elapsed * 60 if elapsed > 0 else 0.0
+        eta = (total - finished) / per_min if per_min else 0.0
+        label = "done" if final else "progress"
+        print(f"[{label}] {finished}/{total} in {elapsed:.0f}s — {per_min:.1f} essays/min, "
+              f"errors {stats['errors']}, 429 pauses {limiter.pauses}"
+              + ("" if final else f", ETA {eta:.1f} min"), file=sys.stderr)
+        return per_min
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        queue = iter(pending)
+        in_flight = set()
+        # Keep a bounded number of essays in flight instead of submitting the corpus
+        while True:
+            while len(in_flight) < concurrency * 2:
+                item = next(queue, None)
+                if item is None:
+                    break
+                in_flight.add(pool.submit(score_one, engine, *item))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, timeout=report_every, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                if "error" in result:
+                    stats["errors"] += 1
+                    stats["parse_failed"] += result.get("parse_failed", False)
+                else:
+                    stats["scored"] += 1
+            if time.monotonic() - last_report >= report_every:
+                report()
+                last_report = time.monotonic()
+
+    stats["essays_per_minute"] = round(report(final=True), 2)
+    stats["rate_limited"] = limiter.pauses
+    return stats
+
+
+def run_batch_api(input_path: str, output_path: str, id_field: str = "id", text_field: str = "essay",
+                  first_try: bool = False, base_url: str = None, poll_interval: float = 30.0,
+                  passage_id: str = None) -> dict:
+    done = completed_ids(output_path)
+    essays = list(read_essays(input_path, id_field, text_field))
+    reject_duplicate_ids(essays)
+    pending = [(eid, text) for eid, text in essays if eid not in done]
+    print(f"{len(done)} already scored, {len(pending)} to go", file=sys.stderr)
+    stats = {"scored": 0, "errors": 0, "parse_failed": 0}
+    state_path = output_path + ".batches.json"
+    if not pending:
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return stats
+
+    # Resuming picks up the saved batches (matched against the IDs they were
+    # submitted for) and skips what was written before the interruption
+    started = time.monotonic()
+    with open(output_path, "a", encoding="utf-8") as out:
+        for result in run_message_batches(essays, state_path, first_try, base_url, poll_interval,
+                                          log=lambda line: print(line, file=sys.stderr),
+                                          passage_id=passage_id, skip=done):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if "error" in result:
+                stats["errors"] += 1
+                stats["parse_failed"] += result.get("parse_failed", False)
+            else:
+                stats["scored"] += 1
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    elapsed = time.monotonic() - started
+    stats["essays_per_minute"] = round(len(pending) / elapsed * 60, 2) if elapsed > 0 else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score a corpus of essays against the VALUE rubric.")
+    parser.add_argument("input", help="essays as .jsonl or .csv")
+    parser.add_argument("output", help="results as .jsonl (also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel scoring calls (default 8)")
+    parser.add_argument("--rpm", type=float, default=0, help="cap on requests per minute (default: none)")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="essay")
+    parser.add_argument("--passage", help="passage pack the essays answer (default: the built-in passage)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--batch-api", action="store_true", help="use provider batch jobs instead of live calls")
+    parser.add_argument("--first-try", action="store_true",
+                        help="with --batch-api, also analyse essays that reach the target on every dimension")
+    parser.add_argument("--base-url", help="with --batch-api, API endpoint (e.g. a local mock_api_server.py)")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="seconds between batch status checks")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.batch_api:
+            stats = run_batch_api(args.input, args.output, args.id_field, args.text_field,
+                                  args.first_try, args.base_url, args.poll_interval, args.passage)
+        else:
+            stats = run_batch(args.input, args.output, args.concurrency, args.rpm,
+                              args.id_field, args.text_field, args.report_every, args.passage)
+    except ValueError as exc:  # e.g. duplicate essay IDs
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    print(json.dumps(stats), file=sys.stderr)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
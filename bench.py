@@ -0,0 +1,495 @@
+"""
+Benchmark Suite for Socratic Writing Tutor
+
+Times the full tutoring flow against a simulated model. Engine and logger
+overhead can be measured and compared between commits without an API key:
+
+    python bench.py --iterations 20 --out bench.json
+    python bench.py --latency lognormal:0.2:0.4 --compare bench.json --max-regression 10
+
+The simulated model (SimulatedModel) is served through client_pool.use_clients().
+Every call takes the real path: resilience, rate limiter, score cache,
+structured-output parsing. Replies are canned and deterministic. Scoring
+calls return the scores the scenario scripted for that draft; other calls get
+mock_api_server's replies. Latency comes from a seeded distribution.
+
+Scenarios (scripted sessions):
+- first_try       the first essay is at target, so it goes straight to reflection
+- stuck_evidence  evidence use stays low for three revisions (MODEL mode, then
+                  coaching again) and passes on the fourth
+- turn_limit      never reaches target; ends at the coaching turn limit
+
+Phases are validate, submit, revise, reflect, log (one phase-transition row)
+and export (summary row + JSON export). For each phase it reports p50/p95/p99
+latency, model calls and input/output tokens. Allocations (peak and retained
+bytes) come from a separate tracemalloc pass, so tracing doesn't skew the
+timings. With --speculate, revisions start their likely MODEL example while
+being scored; the report then includes how many speculative calls were used
+(hit_rate). Results are written as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import client_pool
+import core_engine
+import session_logger
+from core_engine import SocraticEngine
+from event_store import JsonlEventStore
+from mock_api_server import fake_reply
+from passage_config import DIMENSION_ORDER, TARGET_SCORE
+from structured_output import SCORES_TOOL
+
+PHASES = ("validate", "submit", "revise", "reflect", "log", "export")
+
+# A response to the default assignment (passage_config: "The Pineapple Pizza Debate")
+ESSAY = (
+    "I believe people should be free to experiment with food, because traditions themselves began as experiments. "
+    "According to the passage, Hawaiian pizza was invented in 1962 by Sam Panopoulos, a restaurant owner in Canada. "
+    "This shows that pizza has always been adapted, since it evolved from simple flatbreads in many cultures. "
+    "Some people argue that fruit makes the pizza soggy, but a topping that about 12 percent of Americans prefer "
+    "is clearly working for many eaters. "
+    "In conclusion, nobody should gatekeep toppings, because a new combination can become tomorrow's tradition."
+)
+REFLECTION = "I learned to explain how my evidence supports my claim instead of just quoting it."
+
+
+def scores(default: int = 2, **overrides) -> dict:
+    """A scripted score set: every dimension at default unless overridden."""
+    return {
+        dim: {"score": overrides.get(dim, default), "rationale": f"Scripted {dim} score."}
+        for dim in DIMENSION_ORDER
+    }
+
+
+# Scores per draft; later revisions reuse the last entry
+SCENARIOS = {
+    "first_try": [scores(TARGET_SCORE)],
+    "stuck_evidence": [
+        scores(TARGET_SCORE, evidence_use=1),
+        scores(TARGET_SCORE, evidence_use=1),
+        scores(TARGET_SCORE, evidence_use=1),
+        scores(TARGET_SCORE, evidence_use=2),
+        scores(TARGET_SCORE),
+    ],
+    "turn_limit": [scores(2, organization=1), scores(2)],
+}
+MAX_REVISIONS = 30
+
+
+class Latency:
+    """Seeded delay distribution: "fixed:S", "uniform:LO:HI" or "lognormal:MEDIAN:SIGMA" (seconds)."""
+
+    def __init__(self, spec: str = "lognormal:0.05:0.5", seed: int = 0):
+        kind, *params = spec.split(":")
+        try:
+            params = [float(p) for p in params]
+        except ValueError:
+            raise ValueError(f"bad latency spec: {spec}") from None
+        if (kind, len(params)) not in (("fixed", 1), ("uniform", 2), ("lognormal", 2)):
+            raise ValueError(f"bad latency spec: {spec}")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(*self.params)
+            median, sigma = self.params
+            return self._rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+def _prompt_text(request: dict) -> tuple:
+    system = request.get("system")
+    if isinstance(system, list):
+        system = "".join(block.get("text", "") for block in system)
+    content = request["messages"][-1]["content"]
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content)
+    return system or "", content
+
+
+class SimulatedModel:
+    """Stand-in for anthropic.Anthropic: canned replies after a sampled delay.
+
+    Build the async twin with SimulatedModel.async_client(); both share the
+    script and the counters.
+    """
+
+    def __init__(self, latency: Latency, token_interval: float = 0.0):
+        self.latency = latency
+        self.token_interval = token_interval
+        self.scripted = {}  # draft text -> scores for it
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        self.messages = _Messages(self)
+
+    def async_client(self):
+        return SimpleNamespace(messages=_AsyncMessages(self))
+
+    def script(self, essay: str, essay_scores: dict):
+        self.scripted[essay] = essay_scores
+
+    def usage(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+    def reply(self, request: dict):
+        """(message, text chunks, delay before the first chunk)."""
+        system, user = _prompt_text(request)
+        forced = (request.get("tool_choice") or {}).get("name")
+        text = None
+        if forced == SCORES_TOOL["name"]:
+            # Longest match, so "Draft 1" never answers for "Draft 10"
+            matches = [essay for essay in self.scripted if essay in user]
+            if matches:
+                text = json.dumps(self.scripted[max(matches, key=len)])
+        if text is None:
+            text = fake_reply(request)
+        if forced:
+            content = [SimpleNamespace(type="tool_use", id="toolu_bench", name=forced, input=json.loads(text))]
+        else:
+            content = [SimpleNamespace(type="text", text=text)]
+        usage = SimpleNamespace(
+            input_tokens=max(1, (len(system) + len(user)) // 4), output_tokens=max(1, len(text) // 4),
+            cache_creation_input_tokens=0, cache_read_input_tokens=0,
+        )
+        with self._lock:
+            self.counters["calls"] += 1
+            self.counters["input_tokens"] += usage.input_tokens
+            self.counters["output_tokens"] += usage.output_tokens
+        message = SimpleNamespace(content=content, usage=usage, model=request.get("model"),
+                                  stop_reason="tool_use" if forced else "end_turn")
+        chunks = [word + " " for word in text.split(" ")]
+        chunks[-1] = chunks[-1][:-1]
+        return message, chunks, self.latency.sample()
+
+
+class _Messages:
+    def __init__(self, model: SimulatedModel):
+        self.model = model
+
+    def create(self, timeout=None, **request):
+        message, chunks, delay = self.model.reply(request)
+        time.sleep(delay + self.model.token_interval * len(chunks))
+        return message
+
+    def stream(self, timeout=None, **request):
+        return _Stream(self.model, *self.model.reply(request))
+
+
+class _Stream:
+    def __init__(self, model, message, chunks, delay):
+        self.model = model
+        self.message = message
+        self.chunks = chunks
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        time.sleep(self.delay)
+        for chunk in self.chunks:
+            if self.model.token_interval:
+                time.sleep(self.model.token_interval)
+            yield chunk
+
+    def get_final_message(self):
+        return self.message
+
+
+class _AsyncMessages:
+    def __init__(self, model: SimulatedModel):
+        self.model = model
+
+    async def create(self, timeout=None, **request):
+        message, chunks, delay = self.model.reply(request)
+        await asyncio.sleep(delay + self.model.token_interval * len(chunks))
+        return message
+
+    def stream(self, timeout=None, **request):
+        return _AsyncStream(self.model, *self.model.reply(request))
+
+
+class _AsyncStream(_Stream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        await asyncio.sleep(self.delay)
+        for chunk in self.chunks:
+            if self.model.token_interval:
+                await asyncio.sleep(self.model.token_interval)
+            yield chunk
+
+    async def get_final_message(self):
+        return self.message
+
+
+class Recorder:
+    """Per-phase samples: wall time, model calls/tokens and (when tracing) allocations."""
+
+    def __init__(self, model: SimulatedModel, trace_allocations: bool = False):
+        self.model = model
+        self.trace_allocations = trace_allocations
+        self.samples = {}  # phase -> list of dicts
+
+    @contextmanager
+    def phase(self, name: str):
+        before = self.model.usage()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        yield
+        sample = {"ms": (time.perf_counter() - started) * 1000}
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            sample.update(peak_bytes=peak - start_bytes, retained_bytes=current - start_bytes)
+        after = self.model.usage()
+        sample.update({key: after[key] - before[key] for key in after})
+        self.samples.setdefault(name, []).append(sample)
+
+
+def run_session(scenario: str, model: SimulatedModel, recorder: Recorder, n: int,
+                speculate: bool = False) -> dict:
+    """Drive one scripted session through every phase, as app.py would."""
+    plan = SCENARIOS[scenario]
+    drafts = [f"{ESSAY} (Draft {i + 1} of {scenario} session {n}.)" for i in range(MAX_REVISIONS + 1)]
+    for i, draft in enumerate(drafts):
+        model.script(draft, plan[min(i, len(plan) - 1)])
+    engine = SocraticEngine()
+    streamed = []
+
+    def transition(phase, extra):
+        with recorder.phase("log"):
+            session_logger.log_phase_transition(phase, engine, extra)
+
+    with recorder.phase("validate"):
+        engine.validator.validate(drafts[0])
+    transition("validate", {"action": "draft_check"})
+    with recorder.phase("submit"):
+        result = engine.process_initial_essay(drafts[0], on_delta=streamed.append)
+    transition(result["phase"], {"action": "initial_submit"})
+    revision = 1
+    while result["phase"] == engine.PHASE_COACH and revision <= MAX_REVISIONS:
+        with recorder.phase("revise"):
+            result = engine.process_revision_concurrent(drafts[revision], on_delta=streamed.append,
+                                                        speculate=speculate)
+        transition(result["phase"], {"action": "revision", "revision_num": revision})
+        revision += 1
+    while result["phase"] == engine.PHASE_REFLECT:
+        with recorder.phase("reflect"):
+            result = engine.process_reflection(REFLECTION, on_delta=streamed.append)
+        transition(result["phase"], {"action": "reflection"})
+    with recorder.phase("export"):
+        session_logger.log_complete_session(engine)
+        session_logger.build_export_json(engine)
+    model.scripted.clear()
+    return {"revisions": revision - 1, "final_phase": result["phase"]}
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (q in 0-100)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: dict, allocations: dict = None) -> dict:
+    """Per-phase statistics from Recorder.samples (and a tracemalloc pass's samples)."""
+    summary = {}
+    for phase in PHASES:
+        runs = samples.get(phase)
+        if not runs:
+            continue
+        times = [s["ms"] for s in runs]
+        entry = {
+            "count": len(runs),
+            "p50_ms": round(percentile(times, 50), 3),
+            "p95_ms": round(percentile(times, 95), 3),
+            "p99_ms": round(percentile(times, 99), 3),
+            "mean_ms": round(sum(times) / len(times), 3),
+            "calls": sum(s["calls"] for s in runs),
+            "input_tokens": sum(s["input_tokens"] for s in runs),
+            "output_tokens": sum(s["output_tokens"] for s in runs),
+        }
+        traced = (allocations or {}).get(phase)
+        if traced:
+            entry["alloc_peak_bytes_p50"] = percentile([s["peak_bytes"] for s in traced], 50)
+            entry["alloc_peak_bytes_max"] = max(s["peak_bytes"] for s in traced)
+            entry["alloc_retained_bytes_mean"] = round(sum(s["retained_bytes"] for s in traced) / len(traced))
+        summary[phase] = entry
+    return summary
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run_benchmark(scenarios, iterations: int = 10, latency: str = "lognormal:0.05:0.5",
+                  token_interval: float = 0.0, seed: int = 0, allocations: bool = True,
+                  event_log: str = None, speculate: bool = False) -> dict:
+    """Run every scenario iterations times; returns the report (see module docstring)."""
+    model = SimulatedModel(Latency(latency, seed), token_interval)
+    client_pool.use_clients(model, model.async_client())
+    random.seed(seed)  # coaching openers and celebrations
+    # Logger rows go to a scratch event log, not the app's
+    scratch = None
+    if event_log is None:
+        scratch = tempfile.TemporaryDirectory()
+        event_log = os.path.join(scratch.name, "session_events.jsonl")
+    store = JsonlEventStore(event_log)
+    session_logger._backends = [store]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "iterations": iterations,
+            "latency": latency,
+            "token_interval": token_interval,
+            "seed": seed,
+            "speculate": speculate,
+        },
+        "scenarios": {},
+    }
+    n = 0
+    try:
+        for scenario in scenarios:
+            recorder = Recorder(model)
+            speculation = core_engine.get_speculation_stats()
+            started = time.perf_counter()
+            outcomes = []
+            for _ in range(iterations):
+                n += 1
+                outcomes.append(run_session(scenario, model, recorder, n, speculate))
+            wall = time.perf_counter() - started
+            speculation = {key: core_engine.SPECULATION_STATS[key] - speculation[key]
+                           for key in core_engine.SPECULATION_STATS}
+            traced = None
+            if allocations:
+                tracer = Recorder(model, trace_allocations=True)
+                tracemalloc.start()
+                try:
+                    for _ in range(max(1, iterations // 5)):
+                        n += 1
+                        run_session(scenario, model, tracer, n, speculate)
+                finally:
+                    tracemalloc.stop()
+                traced = tracer.samples
+            report["scenarios"][scenario] = {
+                "sessions": iterations,
+                "wall_s": round(wall, 3),
+                "revisions_per_session": outcomes[0]["revisions"],
+                "final_phase": outcomes[0]["final_phase"],
+                "phases": summarize(recorder.samples, traced),
+            }
+            if speculate:
+                speculation["hit_rate"] = (round(speculation["used"] / speculation["started"], 3)
+                                           if speculation["started"] else None)
+                report["scenarios"][scenario]["speculation"] = speculation
+    finally:
+        client_pool.use_clients(None)
+        store.close()
+        session_logger._backends = None
+        if scratch is not None:
+            scratch.cleanup()
+    return report
+
+
+def compare(report: dict, baseline: dict) -> list:
+    """(scenario, phase, metric, old, new, % change) for p50/p95 present in both."""
+    rows = []
+    for scenario, result in report["scenarios"].items():
+        old_phases = baseline.get("scenarios", {}).get(scenario, {}).get("phases", {})
+        for phase, stats in result["phases"].items():
+            old = old_phases.get(phase)
+            if not old:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                if old.get(metric):
+                    change = (stats[metric] - old[metric]) / old[metric] * 100
+                    rows.append((scenario, phase, metric, old[metric], stats[metric], round(change, 1)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tutoring flow against a simulated model.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--iterations", type=int, default=10, help="sessions per scenario")
+    parser.add_argument("--latency", default="lognormal:0.05:0.5",
+                        help="delay before a reply: fixed:S, uniform:LO:HI or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="seconds per streamed word")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--speculate", action="store_true", help="speculate on revisions' MODEL examples")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="earlier report to compare p50/p95 against")
+    parser.add_argument("--max-regression", type=float,
+                        help="with --compare: exit 1 if any p95 grew by more than this many percent")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.scenario or list(SCENARIOS), args.iterations, args.latency,
+                           args.token_interval, args.seed, not args.no_allocations, speculate=args.speculate)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    for scenario, result in report["scenarios"].items():
+        print(f"{scenario}: {result['sessions']} sessions in {result['wall_s']}s", file=sys.stderr)
+        if "speculation" in result:
+            print(f"  speculation: {result['speculation']}", file=sys.stderr)
+        for phase, stats in result["phases"].items():
+            print(f"  {phase:<8} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                  f"p99 {stats['p99_ms']:>9.2f}ms  calls {stats['calls']}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressed = False
+        for scenario, phase, metric, old, new, change in compare(report, baseline):
+            print(f"{scenario}/{phase} {metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%)", file=sys.stderr)
+            if args.max_regression is not None and metric == "p95_ms" and change > args.max_regression:
+                regressed = True
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
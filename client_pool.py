@@ -0,0 +1,339 @@
+"""
+Shared Anthropic Client Pool for Socratic Writing Tutor
+
+Every Streamlit session runs in its own script thread, but they all live in
+the same Python process. Building a fresh anthropic.Anthropic() for each call
+throws away the HTTP connection pool (and its TLS sessions) after a single
+request, so a class of 40 submitting at once pays 40 handshakes per turn.
+
+This module keeps ONE client per process. All sessions lease it through
+lease(), which bounds in-flight requests to the pool size and records how long
+callers waited and how often an existing connection was reused.
+
+For concurrent pipelines there is also ONE AsyncAnthropic client, bound to a
+single background event loop thread. Script threads hand coroutines to that
+loop with submit_async()/run_async(), so async calls share connections too.
+
+Settings (environment variables):
+- ANTHROPIC_POOL_SIZE         max open connections / in-flight calls (default 50)
+- ANTHROPIC_KEEPALIVE         idle connections kept warm (default 20)
+- ANTHROPIC_KEEPALIVE_EXPIRY  seconds an idle connection stays open (default 30)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import anthropic
+import httpx
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def pool_settings() -> dict:
+    """Current pool configuration, read from the environment."""
+    pool_size = max(1, _env_int("ANTHROPIC_POOL_SIZE", 50))
+    return {
+        "pool_size": pool_size,
+        "keepalive": min(pool_size, max(0, _env_int("ANTHROPIC_KEEPALIVE", 20))),
+        "keepalive_expiry": _env_float("ANTHROPIC_KEEPALIVE_EXPIRY", 30.0),
+    }
+
+
+_lock = threading.Lock()
+_client = None
+_client_key = None
+_slots = None
+_stand_ins = None  # (client, async client) installed by use_clients()
+_client_leases = {}  # client -> leases open on it
+_retired = set()  # replaced clients, closed when their last lease ends
+
+_metrics = {
+    "clients_built": 0,
+    "clients_closed": 0,
+    "requests": 0,
+    "connections_opened": 0,
+    "tls_handshakes": 0,
+    "leases": 0,
+    "leases_waited": 0,
+    "lease_wait_total_s": 0.0,
+    "lease_wait_max_s": 0.0,
+    "in_flight": 0,
+    "peak_in_flight": 0,
+}
+
+
+def _bump(key: str, amount=1):
+    with _lock:
+        _metrics[key] += amount
+
+
+def _trace(event_name: str, info: dict):
+    """httpcore trace hook — fires only when a NEW connection is being set up."""
+    if event_name == "connection.connect_tcp.complete":
+        _bump("connections_opened")
+    elif event_name == "connection.start_tls.complete":
+        _bump("tls_handshakes")
+
+
+def _on_request(request):
+    _bump("requests")
+    request.extensions["trace"] = _trace
+
+
+async def _atrace(event_name: str, info: dict):
+    _trace(event_name, info)
+
+
+async def _on_request_async(request):
+    _bump("requests")
+    request.extensions["trace"] = _atrace
+
+
+def _limits(settings: dict):
+    return httpx.Limits(
+        max_connections=settings["pool_size"],
+        max_keepalive_connections=settings["keepalive"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+
+
+def _build_client(settings: dict):
+    http_client = httpx.Client(
+        limits=_limits(settings),
+        event_hooks={"request": [_on_request]},
+    )
+    # Retries and timeouts are resilience.py's job (per-phase deadlines)
+    return anthropic.Anthropic(http_client=http_client, max_retries=0)
+
+
+def _current_client():
+    """(client, replaced client that can be closed now, or None); call with _lock held."""
+    global _client, _client_key, _slots
+    if _stand_ins is not None:
+        return _stand_ins[0], None
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    stale = None
+    if _client is None or _client_key != api_key:
+        stale = _replace(_client)
+        settings = pool_settings()
+        _client = _build_client(settings)
+        _client_key = api_key
+        _slots = threading.BoundedSemaphore(settings["pool_size"])
+        _metrics["clients_built"] += 1
+    return _client, stale
+
+
+def _replace(client):
+    """client if it can be closed now, else None (closed by its last lease); call with _lock held."""
+    if client is not None and _client_leases.get(client):
+        _retired.add(client)
+        return None
+    return client
+
+
+def _close(client):
+    if client is None:
+        return
+    try:
+        client.close()
+    except Exception:
+        pass  # its connections are gone either way
+    _bump("clients_closed")
+
+
+def get_client():
+    """Return the process-wide client, building it on first use.
+
+    The client is rebuilt if ANTHROPIC_API_KEY changes (e.g. a key entered
+    at runtime), so a stale key never sticks to the shared instance. The old
+    client is closed once the calls leased on it have finished.
+    """
+    with _lock:
+        client, stale = _current_client()
+    _close(stale)
+    return client
+
+
+@contextmanager
+def lease():
+    """Borrow the shared client for one call.
+
+    Blocks while the pool is saturated, so bursts queue here (where the wait
+    is measured) instead of failing inside the HTTP layer.
+    """
+    with _lock:
+        client, stale = _current_client()
+        slots = _slots
+        _client_leases[client] = _client_leases.get(client, 0) + 1
+    _close(stale)
+    started = time.perf_counter()
+    if not slots.acquire(blocking=False):
+        _bump("leases_waited")
+        slots.acquire()
+    waited = time.perf_counter() - started
+
+    with _lock:
+        _metrics["leases"] += 1
+        _metrics["lease_wait_total_s"] += waited
+        _metrics["lease_wait_max_s"] = max(_metrics["lease_wait_max_s"], waited)
+        _metrics["in_flight"] += 1
+        _metrics["peak_in_flight"] = max(_metrics["peak_in_flight"], _metrics["in_flight"])
+    try:
+        yield client
+    finally:
+        with _lock:
+            _metrics["in_flight"] -= 1
+            left = _client_leases.pop(client) - 1
+            if left:
+                _client_leases[client] = left
+            drained = not left and client in _retired
+            if drained:
+                _retired.discard(client)
+        slots.release()
+        if drained:
+            _close(client)
+
+
+_loop = None
+_async_client = None
+_async_client_key = None
+
+
+def _get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="anthropic-async", daemon=True).start()
+        return _loop
+
+
+def submit_async(coro):
+    """Schedule a coroutine on the shared loop; returns a concurrent Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_async(coro):
+    """Run a coroutine on the shared loop and block until it finishes."""
+    return submit_async(coro).result()
+
+
+def _current_async_client():
+    """(async client, replaced one that can be closed now, or None); call with _lock held."""
+    global _async_client, _async_client_key
+    if _stand_ins is not None:
+        return _stand_ins[1], None
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    stale = None
+    if _async_client is None or _async_client_key != api_key:
+        stale = _replace(_async_client)
+        http_client = httpx.AsyncClient(
+            limits=_limits(pool_settings()),
+            event_hooks={"request": [_on_request_async]},
+        )
+        _async_client = anthropic.AsyncAnthropic(http_client=http_client, max_retries=0)
+        _async_client_key = api_key
+        _metrics["clients_built"] += 1
+    return _async_client, stale
+
+
+async def _aclose(client):
+    try:
+        await client.close()
+    except Exception:
+        pass  # its connections are gone either way
+    _bump("clients_closed")
+
+
+def _close_async(client):
+    """Close an async client on the shared loop, which owns its connections."""
+    if client is not None:
+        submit_async(_aclose(client))
+
+
+def get_async_client():
+    """Return the process-wide AsyncAnthropic client.
+
+    Only use it from coroutines running on the shared loop (see submit_async);
+    its connections belong to that loop. Like get_client(), it is rebuilt when
+    ANTHROPIC_API_KEY changes; calls should hold it through async_lease() so
+    the old one is closed only after they finish.
+    """
+    with _lock:
+        client, stale = _current_async_client()
+    _close_async(stale)
+    return client
+
+
+@asynccontextmanager
+async def async_lease():
+    """Borrow the shared AsyncAnthropic client for one call on the shared loop.
+
+    In-flight async calls are bounded by the connection pool itself; the
+    lease only keeps a replaced client open until the calls on it are done.
+    """
+    with _lock:
+        client, stale = _current_async_client()
+        _client_leases[client] = _client_leases.get(client, 0) + 1
+    _close_async(stale)
+    try:
+        yield client
+    finally:
+        with _lock:
+            left = _client_leases.pop(client) - 1
+            if left:
+                _client_leases[client] = left
+            drained = not left and client in _retired
+            if drained:
+                _retired.discard(client)
+        if drained:
+            _close_async(client)
+
+
+def use_clients(client, async_client=None):
+    """Serve stand-in clients instead of the pooled Anthropic ones (None restores them).
+
+    Anything with the same messages.create()/messages.stream() surface works,
+    e.g. bench.py's simulated model. Leases still go through the pool's slots.
+    """
+    global _stand_ins, _slots
+    with _lock:
+        _stand_ins = None if client is None else (client, async_client)
+        if client is not None and _slots is None:
+            _slots = threading.BoundedSemaphore(pool_settings()["pool_size"])
+
+
+def get_pool_metrics() -> dict:
+    """Snapshot of pool metrics, including derived reuse and wait figures."""
+    with _lock:
+        snapshot = dict(_metrics)
+    requests = snapshot["requests"]
+    leases = snapshot["leases"]
+    snapshot["connections_reused"] = max(0, requests - snapshot["connections_opened"])
+    snapshot["reuse_rate"] = round(snapshot["connections_reused"] / requests, 3) if requests else 0.0
+    snapshot["lease_wait_avg_s"] = snapshot["lease_wait_total_s"] / leases if leases else 0.0
+    snapshot.update(pool_settings())
+    return snapshot
+
+
+def reset_pool_metrics():
+    """Zero the counters (the pooled client itself is kept)."""
+    with _lock:
+        for key in _metrics:
+            if key != "in_flight":
+                _metrics[key] = 0 if isinstance(_metrics[key], int) else 0.0
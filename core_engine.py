@@ -11,83 +11,226 @@ CHANGES FROM v1.1:
 - Improved first-try and improvement analysis
 """
 
+import asyncio
+import contextvars
 import json
+import queue
 import random
+import threading
+import time
+from collections import OrderedDict, deque
+
 import anthropic
+
+import client_pool
+import model_routing
+import rate_limiter
+import resilience
+import token_budget
+import tracing
+from draft_index import DraftIndex, split_sentences
+from essay_versions import EssayVersions
+from passage_registry import get_bundle
+from resilience import UpstreamUnavailable, phase_deadline
+from score_cache import get_score_cache, make_key
+from structured_output import (
+    DRAFT_CHECK_TOOL, DRAFT_RECHECK_TOOL, SCORES_TOOL, SchemaError,
+    parse_reply, reply_payload, tool_choice, validate_draft_check, validate_scores,
+)
 from passage_config import (
-    PASSAGE_TEXT, PASSAGE_TITLE, WRITING_PROMPT, VALUE_RUBRIC,
-    DIMENSION_ORDER, TARGET_SCORE, SCORING_SYSTEM_PROMPT,
-    COACHING_SYSTEM_PROMPT, MODEL_EXAMPLE_PROMPT, REFLECTION_PROMPTS,
-    EDGE_CASE_RULES, RESCORE_FRAMING, ROADMAP_PROMPT, 
+    VALUE_RUBRIC, DIMENSION_ORDER, TARGET_SCORE,
+    COACHING_STUDENT_CONTEXT, ROADMAP_PROMPT,
     COACHING_OPENERS, COACHING_OPENERS_FIRST_TRY, QUOTE_SANDWICH_PROMPT,
     CELEBRATION_MESSAGES, MICRO_CELEBRATION_TEMPLATES,
-    PRE_VALIDATION_SYSTEM_PROMPT,
-    get_rubric_text
+    FALLBACK_COACHING_QUESTIONS, FALLBACK_REPLIES,
 )
 
 
 class PreSubmissionValidator:
     """Grammarly-style pre-check that evaluates student input BEFORE formal scoring."""
 
-    EVIDENCE_MARKERS = [
-        "1962", "panopoulos", "sam", "2017", "iceland", "2019", "yougov",
-        "12 percent", "hawaiian", "ontario", "canada", "tagine", "moroccan"
-    ]
-    POSITION_WORDS = [
-        "i believe", "i think", "i argue", "i contend", "in my opinion",
-        "my position", "should", "must", "belongs", "doesn't belong",
-        "no place", "acceptable", "unacceptable"
-    ]
-    REASONING_WORDS = [
-        "because", "therefore", "this means", "this shows", "which demonstrates",
-        "as a result", "consequently", "this suggests", "the reason", "which is why"
-    ]
-    CASUAL_MARKERS = [
-        "lol", "tbh", "ngl", "imo", "bruh", "like,", "gonna", "wanna",
-        "kinda", "omg", "smh", "fr fr", "super gross", "it's just"
-    ]
+    # Escalate to the AI check only when the local verdict is close to the
+    # readiness cutoff, or when at least this share of the draft changed
+    # since the previous check.
+    ESCALATE_ON_CHANGE = 0.5
+    MIN_WORDS_FOR_AI = 10
+    # Objective -> lexicon category whose markers it depends on
+    OBJECTIVE_MARKERS = {"POSITION": "position", "EVIDENCE": "evidence",
+                         "REASONING": "reasoning", "TONE": "casual"}
+
+    def __init__(self, bundle=None, usage=None):
+        # The assignment's marker lists, compiled into one word-boundary-aware
+        # automaton (see lexicon.py): one pass per new sentence
+        self.bundle = bundle or get_bundle()
+        self.usage = usage or token_budget.UsageLedger()  # the session's (shared with its engine)
+        self.lexicon = self.bundle.lexicon
+        self.index = DraftIndex(self.lexicon.found)
+        self._last_essay = None
+        self._last_result = None
+        self.tier_counts = {"local": 0, "ai": 0, "incremental": 0, "repeat": 0, "ai_failed": 0}
 
+    @tracing.traced("validate")
+    @phase_deadline("validate")
+    @token_budget.metered("validate")
     def validate(self, essay: str) -> dict:
-        """Run pre-submission validation. Tries AI first, falls back to heuristics."""
-        try:
-            return self._ai_check(essay)
-        except Exception:
-            return self._heuristic_check(essay)
+        """Run pre-submission validation, local heuristics first.
+
+        The draft is diffed sentence by sentence against the previous check
+        (DraftIndex), so only new sentences are scanned. The heuristic answer
+        comes back in milliseconds; the AI check runs only when
+        _escalation_reason() finds it borderline or the draft substantially
+        rewritten. After an AI answer, small edits re-check just the
+        objectives the changed sentences affect and keep the rest. While the
+        token budget is low, nothing escalates.
+        result["tier"] records which path answered: "local", "ai",
+        "incremental" or "repeat".
+        """
+        if essay == self._last_essay and self._last_result is not None:
+            self.tier_counts["repeat"] += 1
+            return dict(self._last_result, tier="repeat")
+
+        diff = self.index.update(essay)
+        heuristic = self._heuristic_check(essay, diff.markers)
+        heuristic["tier"] = "local"
+        reason = self._escalation_reason(heuristic, diff)
+        if reason and token_budget.should_save("validation"):
+            reason = ""
+        previous = self._last_result
+        result = heuristic
+        if previous is not None and previous["tier"] in ("ai", "incremental") and reason != "large_change":
+            result = self._incremental_check(essay, diff, previous, heuristic, reason)
+        elif reason:
+            try:
+                result = self._ai_check(essay)
+                result["tier"] = "ai"
+                result["escalation"] = reason
+            except Exception:
+                self.tier_counts["ai_failed"] += 1
+        self.tier_counts[result["tier"]] += 1
+        tracing.current_span().set(tier=result["tier"], escalation=reason or "")
+        self._last_essay = essay
+        self._last_result = result
+        return result
+
+    def _escalation_reason(self, heuristic: dict, diff) -> str:
+        """Why the heuristic answer isn't good enough on its own ("" if it is)."""
+        if heuristic["word_count"] < self.MIN_WORDS_FOR_AI:
+            return ""
+        statuses = [c["status"] for c in heuristic["checks"]]
+        covered = sum(1 for s in statuses if s in ("present", "weak"))
+        # One objective either way flips overall_ready (cutoff is 3)
+        if covered in (2, 3):
+            return "borderline"
+        if heuristic["overall_ready"] and statuses.count("weak") >= 2:
+            return "borderline"
+        if not diff.first and diff.change_ratio >= self.ESCALATE_ON_CHANGE:
+            return "large_change"
+        return ""
+
+    def _affected_objectives(self, diff, previous: dict) -> list:
+        """Objectives a small edit could have changed.
+
+        Anything not yet "present" (an edit may fix it), anything whose
+        markers were in an added or removed sentence, TONE when text was
+        added, STRUCTURE when sentences or paragraphs moved.
+        """
+        if not diff.changed:
+            return []
+        touched = set()
+        for _, findings in diff.added + diff.removed:
+            touched.update(category for category, terms in findings.items() if terms)
+        affected = []
+        for check in previous["checks"]:
+            objective = check.get("objective")
+            if (check.get("status") != "present"
+                    or self.OBJECTIVE_MARKERS.get(objective) in touched
+                    or (objective == "TONE" and diff.added)
+                    or (objective == "STRUCTURE" and diff.structure_changed)):
+                affected.append(objective)
+        return affected
+
+    def _incremental_check(self, essay: str, diff, previous: dict, heuristic: dict, reason: str) -> dict:
+        """Update an earlier AI answer for a small edit.
+
+        Unaffected objectives keep their earlier findings. Affected ones are
+        re-checked by the model (changed sentences only) when the heuristic
+        verdict is borderline, otherwise by the heuristic.
+        """
+        affected = self._affected_objectives(diff, previous)
+        updates = {c["objective"]: c for c in heuristic["checks"] if c["objective"] in affected}
+        if affected and reason:
+            try:
+                updates.update(self._ai_recheck(diff, previous, affected))
+            except Exception:
+                self.tier_counts["ai_failed"] += 1
+
+        checks = [updates.pop(c.get("objective"), c) for c in previous["checks"]]
+        checks.extend(updates.values())
+        result = dict(previous, checks=checks, word_count=heuristic["word_count"],
+                      tier="incremental", rechecked=affected)
+        result.pop("escalation", None)
+        if diff.added:
+            result.pop("mechanics", None)  # may no longer match the text
+        if [c.get("status") for c in checks] != [c.get("status") for c in previous["checks"]]:
+            covered = sum(1 for c in checks if c.get("status") in ("present", "weak"))
+            result["overall_ready"] = covered >= 3 and heuristic["word_count"] >= 10
+        return result
+
+    def get_stats(self) -> dict:
+        checks = sum(self.tier_counts[t] for t in ("local", "ai", "incremental", "repeat"))
+        stats = dict(self.tier_counts, checks=checks)
+        stats["ai_rate"] = round(self.tier_counts["ai"] / checks, 3) if checks else 0.0
+        stats.update(self.index.stats)
+        return stats
+
+    def _system(self) -> list:
+        return cached_system(self.bundle.validation_system)
 
     def _ai_check(self, essay: str) -> dict:
-        prompt = PRE_VALIDATION_SYSTEM_PROMPT.format(
-            passage_text=PASSAGE_TEXT, writing_prompt=WRITING_PROMPT
+        reply = call_claude_structured(
+            self._system(), f"Student draft:\n\n{essay}", DRAFT_CHECK_TOOL,
+            task="validation"
+        )
+        result = parse_reply("validation", reply, validate_draft_check)
+        result["word_count"] = len(essay.split())
+        result["used_ai"] = True
+        return result
+
+    def _ai_recheck(self, diff, previous: dict, objectives: list) -> dict:
+        """Ask the model about the changed sentences only; returns objective -> check."""
+        earlier = [c for c in previous["checks"] if c.get("objective") in objectives]
+        removed = "\n".join(f"- {s}" for s, _ in diff.removed) or "(none)"
+        added = "\n".join(f"- {s}" for s, _ in diff.added) or "(none)"
+        user_msg = (
+            "You already checked this student's draft. They revised it; only these "
+            f"sentences changed.\n\nREMOVED:\n{removed}\n\nADDED:\n{added}\n\n"
+            f"Your earlier results for the affected objectives:\n{json.dumps(earlier)}\n\n"
+            f"Re-check ONLY these objectives: {', '.join(objectives)}, one check each."
+        )
+        max_tokens = min(model_routing.route("validation_incremental").max_tokens, 60 + 110 * len(objectives))
+        reply = call_claude_structured(
+            self._system(), user_msg, DRAFT_RECHECK_TOOL,
+            max_tokens=max_tokens, task="validation_incremental"
         )
-        response = call_claude(prompt, f"Student draft:\n\n{essay}", max_tokens=500)
-        cleaned = response.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else cleaned[3:]
-        if cleaned.endswith("```"):
-            cleaned = cleaned[:-3]
-        start = cleaned.find('{')
-        end = cleaned.rfind('}') + 1
-        if start >= 0 and end > start:
-            result = json.loads(cleaned[start:end])
-            result["word_count"] = len(essay.split())
-            result["used_ai"] = True
-            return result
-        raise ValueError("Could not parse AI response")
-
-    def _heuristic_check(self, essay: str) -> dict:
-        lower = essay.lower()
+        checks = parse_reply("validation_incremental", reply, validate_draft_check, partial=True)["checks"]
+        return {c["objective"]: c for c in checks if c["objective"] in objectives}
+
+    def _heuristic_check(self, essay: str, markers: dict = None) -> dict:
+        if markers is None:
+            markers = self.lexicon.found(essay)
         words = essay.split()
-        sentences = [s.strip() for s in essay.replace("!", ".").replace("?", ".").split(".") if s.strip()]
+        sentences = split_sentences(essay)
         word_count = len(words)
         checks = []
 
-        has_position = any(p in lower for p in self.POSITION_WORDS)
+        has_position = bool(markers.get("position"))
         checks.append({
             "objective": "POSITION",
             "status": "present" if has_position else ("weak" if word_count > 20 else "missing"),
             "tip": "" if has_position else "Try starting with a clear stance — what do you believe?"
         })
 
-        found = [m for m in self.EVIDENCE_MARKERS if m in lower]
+        found = markers.get("evidence", [])
         ev_status = "present" if len(found) >= 2 else ("weak" if len(found) == 1 else "missing")
         checks.append({
             "objective": "EVIDENCE",
@@ -95,7 +238,7 @@ class PreSubmissionValidator:
             "tip": "" if ev_status == "present" else "Reference specific facts — dates, names, statistics from the passage."
         })
 
-        has_reasoning = any(r in lower for r in self.REASONING_WORDS)
+        has_reasoning = bool(markers.get("reasoning"))
         checks.append({
             "objective": "REASONING",
             "status": "present" if has_reasoning else ("weak" if word_count > 30 else "missing"),
@@ -108,7 +251,7 @@ class PreSubmissionValidator:
             "tip": "" if len(sentences) >= 4 else "Develop your ideas across multiple sentences — aim for 4-5."
         })
 
-        has_casual = any(c in lower for c in self.CASUAL_MARKERS)
+        has_casual = bool(markers.get("casual"))
         checks.append({
             "objective": "TONE",
             "status": "missing" if has_casual else ("present" if word_count > 15 else "weak"),
@@ -140,23 +283,443 @@ class PreSubmissionValidator:
         }
 
 
-def call_claude(system_prompt: str, user_message: str, max_tokens: int = 500) -> str:
-    """Make API call to Claude."""
-    client = anthropic.Anthropic()
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=max_tokens,
+# Per-call usage records, newest last. Bounded so a long-running server
+# doesn't grow without limit; see get_prompt_cache_stats() for totals.
+CALL_LOG = deque(maxlen=1000)
+
+
+def cached_system(static_text: str, dynamic_text: str = "") -> list:
+    """Build system blocks with the static prefix marked for prompt caching.
+
+    The provider caches everything up to and including the marked block, so
+    put the long, unchanging text (passage, rubric, instructions) first and
+    anything student-specific in dynamic_text.
+    """
+    blocks = [{"type": "text", "text": static_text, "cache_control": {"type": "ephemeral"}}]
+    if dynamic_text:
+        blocks.append({"type": "text", "text": dynamic_text})
+    return blocks
+
+
+def _record_usage(task: str, model: str, message, latency: float, ttft: float = None):
+    usage = getattr(message, "usage", None)
+    token_budget.record(task, model, usage)
+    CALL_LOG.append({
+        "task": task,
+        "model": model,
+        "timestamp": time.time(),
+        "latency_s": round(latency, 4),
+        # Without streaming nothing is visible until the whole reply lands
+        "ttft_s": round(latency if ttft is None else ttft, 4),
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+    })
+
+
+def _prompt_chars(request: dict) -> int:
+    system = request["system"]
+    if isinstance(system, list):
+        system = "".join(block["text"] for block in system)
+    return len(system) + sum(len(m["content"]) for m in request["messages"])
+
+
+def _model_span(request: dict, task: str, kind: str = "model.call"):
+    span = tracing.span(kind)
+    if span.sampled:
+        span.set(task=task, model=request["model"], max_tokens=request["max_tokens"],
+                 prompt_chars=_prompt_chars(request))
+    return span
+
+
+def _trace_usage(span, message, ttft: float = None, model: str = None):
+    usage = getattr(message, "usage", None)
+    if model is not None:
+        span.set(model=model)  # the fallback model, if the call moved to it
+    span.set(input_tokens=getattr(usage, "input_tokens", 0) or 0,
+             output_tokens=getattr(usage, "output_tokens", 0) or 0,
+             cache_read_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0)
+    if ttft is not None:
+        span.set(ttft_s=round(ttft, 4))
+
+
+def get_prompt_cache_stats() -> dict:
+    """Summarize cache reads/writes per task over the recorded calls."""
+    stats = {}
+    for record in list(CALL_LOG):
+        task = stats.setdefault(record["task"], {
+            "calls": 0, "input_tokens": 0, "cache_read_tokens": 0,
+            "cache_write_tokens": 0, "latency_s": 0.0
+        })
+        task["calls"] += 1
+        task["input_tokens"] += record["input_tokens"]
+        task["cache_read_tokens"] += record["cache_read_tokens"]
+        task["cache_write_tokens"] += record["cache_write_tokens"]
+        task["latency_s"] += record["latency_s"]
+    for task in stats.values():
+        prompt_tokens = task["input_tokens"] + task["cache_read_tokens"] + task["cache_write_tokens"]
+        task["cache_hit_rate"] = round(task["cache_read_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0
+        task["avg_latency_s"] = round(task.pop("latency_s") / task["calls"], 4)
+    return stats
+
+
+def _request(system_prompt, user_message: str, max_tokens: int, task: str, tool: dict = None) -> dict:
+    """Messages request for task on its route (model_routing), fitted into the token budget.
+
+    max_tokens=None uses the route's.
+    """
+    route = model_routing.route(task)
+    request = dict(
+        model=route.model,
+        max_tokens=max_tokens or route.max_tokens,
+        temperature=route.temperature,
         system=system_prompt,
         messages=[{"role": "user", "content": user_message}]
     )
+    if tool is not None:
+        request.update(tools=[tool], tool_choice=tool_choice(tool))
+    return token_budget.admit(task, request)
+
+
+def _create(request: dict, task: str):
+    """messages.create under resilience's retry/deadline/breaker policy.
+
+    Retries move to the route's fallback model when the primary is slow or
+    failing (model_routing.ModelChoice).
+    """
+    choice = model_routing.ModelChoice(task, request)
+
+    def attempt(timeout):
+        request = choice.request
+        with client_pool.lease() as client:
+            started = time.perf_counter()
+            try:
+                message = client.messages.create(**request, timeout=choice.timeout(timeout))
+            except anthropic.APIError as exc:
+                choice.failed(exc)
+                raise
+            latency = time.perf_counter() - started
+            _record_usage(task, request["model"], message, latency)
+            choice.succeeded(latency)
+        return message
+    with _model_span(request, task) as span:
+        message = resilience.call(task, attempt, rate_limiter.estimate_tokens(request),
+                                  hedge=token_budget.level() == "ok", spared=choice.moved_on)
+        _trace_usage(span, message, model=choice.request["model"])
+        return message
+
+
+def _discard(request_task):
+    if not request_task.cancelled():
+        request_task.exception()  # nobody is waiting for it any more
+
+
+def _charge_abandoned(task: str, model: str, started: float):
+    """Done-callback recording an abandoned request's usage: it's billed all the same."""
+    def charge(request_task):
+        if not request_task.cancelled() and request_task.exception() is None:
+            _record_usage(task, model, request_task.result(), time.perf_counter() - started)
+    return charge
+
+
+async def _acreate(request: dict, task: str):
+    """Async _create on the shared AsyncAnthropic client."""
+    choice = model_routing.ModelChoice(task, request)
+
+    async def attempt(timeout):
+        request = choice.request
+        started = time.perf_counter()
+        # A cancelled caller (e.g. an unneeded speculative call) abandons the
+        # request instead of interrupting it: cancelling it while its
+        # connection is being opened leaves that connection stuck in the
+        # pool, and enough of those starve every later async call.
+        request_task = asyncio.ensure_future(
+            client.messages.create(**request, timeout=choice.timeout(timeout)))
+        request_task.add_done_callback(_discard)
+        try:
+            message = await asyncio.shield(request_task)
+        except asyncio.CancelledError:
+            request_task.add_done_callback(_charge_abandoned(task, request["model"], started))
+            raise
+        except anthropic.APIError as exc:
+            choice.failed(exc)
+            raise
+        latency = time.perf_counter() - started
+        _record_usage(task, request["model"], message, latency)
+        choice.succeeded(latency)
+        return message
+    with _model_span(request, task) as span:
+        async with client_pool.async_lease() as client:
+            message = await resilience.acall(task, attempt, rate_limiter.estimate_tokens(request),
+                                             hedge=token_budget.level() == "ok", spared=choice.moved_on)
+        _trace_usage(span, message, model=choice.request["model"])
+        return message
+
+
+def call_claude(system_prompt, user_message: str, max_tokens: int = None, task: str = "general") -> str:
+    """Make API call to Claude using the shared, pooled client.
+
+    system_prompt may be a plain string or a list of system blocks
+    (see cached_system). The model, temperature and (unless given)
+    max_tokens come from the task's route (model_routing). Usage,
+    including cache reads/writes, is recorded in CALL_LOG under the given
+    task name. Transient errors are retried within the phase deadline;
+    raises resilience.UpstreamUnavailable when the call can't be completed.
+    """
+    message = _create(_request(system_prompt, user_message, max_tokens, task), task)
     return message.content[0].text
 
 
+def stream_claude(system_prompt, user_message: str, max_tokens: int = None, task: str = "general"):
+    """Streaming variant of call_claude — yields text deltas as they arrive.
+
+    Usage is recorded when the stream finishes, with time-to-first-token.
+    Failures are retried only until the first delta has been yielded; a
+    stream cut off after that raises UpstreamUnavailable("stream_interrupted").
+    """
+    request = _request(system_prompt, user_message, max_tokens, task)
+    # Not entered: a generator's yields would leak it into the caller's context
+    span = _model_span(request, task, "model.stream")
+    try:
+        yield from _stream(request, task, span)
+    except BaseException as exc:
+        span.end(exc if isinstance(exc, Exception) else None)
+        raise
+    span.end()
+
+
+def _stream(request: dict, task: str, span):
+    attempts = resilience.Attempts(task, rate_limiter.estimate_tokens(request))
+    choice = model_routing.ModelChoice(task, request)
+    try:
+        while True:
+            timeout = attempts.timeout()
+            request = choice.request
+            with client_pool.lease() as client:
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    with client.messages.stream(**request, timeout=choice.timeout(timeout)) as stream:
+                        for text in stream.text_stream:
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            yield text
+                        message = stream.get_final_message()
+                except anthropic.APIError as exc:
+                    if first_token is not None:
+                        raise UpstreamUnavailable("stream_interrupted", exc) from exc
+                    moved = choice.failed(exc)
+                    delay = attempts.failed(exc, breaker=not moved)
+                else:
+                    latency = time.perf_counter() - started
+                    _record_usage(task, request["model"], message, latency, ttft=first_token)
+                    _trace_usage(span, message, first_token, request["model"])
+                    choice.succeeded(latency)
+                    attempts.succeeded(latency, message.usage)
+                    return
+            time.sleep(delay)
+    finally:
+        attempts.close()
+
+
+async def acall_claude(system_prompt, user_message: str, max_tokens: int = None,
+                       task: str = "general", on_delta=None) -> str:
+    """Async call_claude on the shared AsyncAnthropic client.
+
+    Must run on client_pool's event loop. With on_delta, the reply is
+    streamed and each text delta is passed to it as it arrives (retried,
+    like stream_claude, only before the first delta).
+    """
+    request = _request(system_prompt, user_message, max_tokens, task)
+    if on_delta is None:
+        message = await _acreate(request, task)
+        return message.content[0].text
+
+    with _model_span(request, task, "model.stream") as span:
+        return await _astream(request, task, on_delta, span)
+
+
+async def _astream(request: dict, task: str, on_delta, span) -> str:
+    attempts = resilience.Attempts(task, rate_limiter.estimate_tokens(request))
+    choice = model_routing.ModelChoice(task, request)
+    try:
+        while True:
+            timeout = await attempts.atimeout()
+            request = choice.request
+            started = time.perf_counter()
+            first_token = None
+            chunks = []
+            try:
+                async with client_pool.async_lease() as client, \
+                        client.messages.stream(**request, timeout=choice.timeout(timeout)) as stream:
+                    async for text in stream.text_stream:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                        chunks.append(text)
+                        on_delta(text)
+                    message = await stream.get_final_message()
+            except anthropic.APIError as exc:
+                if first_token is not None:
+                    raise UpstreamUnavailable("stream_interrupted", exc) from exc
+                moved = choice.failed(exc)
+                await asyncio.sleep(attempts.failed(exc, breaker=not moved))
+                continue
+            latency = time.perf_counter() - started
+            _record_usage(task, request["model"], message, latency, ttft=first_token)
+            _trace_usage(span, message, first_token, request["model"])
+            choice.succeeded(latency)
+            attempts.succeeded(latency, message.usage)
+            return "".join(chunks)
+    finally:
+        attempts.close()
+
+
+def call_claude_structured(system_prompt, user_message: str, tool: dict,
+                           max_tokens: int = None, task: str = "general"):
+    """call_claude that forces the reply through a tool's JSON schema.
+
+    Returns the tool input (a dict), or the reply text if the model answered
+    in text anyway; pass either to structured_output.parse_reply().
+    """
+    message = _create(_request(system_prompt, user_message, max_tokens, task, tool), task)
+    return reply_payload(message)
+
+
+async def acall_claude_structured(system_prompt, user_message: str, tool: dict,
+                                  max_tokens: int = None, task: str = "general"):
+    """Async call_claude_structured on the shared AsyncAnthropic client."""
+    message = await _acreate(_request(system_prompt, user_message, max_tokens, task, tool), task)
+    return reply_payload(message)
+
+
+_DONE = object()  # end of a _run_on_shared_loop delta queue
+
+
+def _run_on_shared_loop(make_coro, on_delta=None):
+    """Run make_coro(sink) on client_pool's loop from a regular thread.
+
+    Deltas produced on the loop are queued and handed to on_delta in THIS
+    thread, which is where Streamlit can render them. The caller's context
+    (phase deadline, rate-limit session and priority) carries over to the loop.
+    """
+    context = contextvars.copy_context()
+
+    async def run(sink):
+        # Runs as its own task, so these settings stay local to it
+        for var, value in context.items():
+            var.set(value)
+        return await make_coro(sink)
+
+    if on_delta is None:
+        return client_pool.run_async(run(None))
+    deltas = queue.Queue()
+    future = client_pool.submit_async(run(deltas.put))
+    # Queued after the last delta, so the wait ends as soon as the run does
+    future.add_done_callback(lambda _: deltas.put(_DONE))
+    while True:
+        delta = deltas.get()
+        if delta is _DONE:
+            return future.result()
+        on_delta(delta)
+
+
+# Replies to REUSABLE_TASKS prompts (token_budget), shown again while a
+# budget is low instead of generating new ones. Keyed by _ModelCall.key.
+REUSABLE_REPLIES = OrderedDict()
+REUSABLE_REPLIES_MAX = 256
+_reusable_lock = threading.Lock()
+
+
+def _remember_reply(key: str, text: str):
+    with _reusable_lock:
+        REUSABLE_REPLIES[key] = text
+        REUSABLE_REPLIES.move_to_end(key)
+        while len(REUSABLE_REPLIES) > REUSABLE_REPLIES_MAX:
+            REUSABLE_REPLIES.popitem(last=False)
+
+
+def _reused_reply(call) -> str:
+    """An earlier reply to the same reusable prompt, if the budget calls for saving."""
+    if call.task not in token_budget.REUSABLE_TASKS:
+        return None
+    with _reusable_lock:
+        text = REUSABLE_REPLIES.get(call.key)
+    if text is None or not token_budget.should_save(f"reused_{call.task}"):
+        return None
+    return text
+
+
+# Start the MODEL example a revision may need while it is being scored.
+# Off by default: an unneeded call is cancelled but still billed, so it only
+# pays when the hit rate (get_speculation_stats) is high.
+SPECULATE_REVISIONS = False
+SPECULATION_STATS = {"started": 0, "used": 0, "cancelled": 0}
+
+
+def get_speculation_stats() -> dict:
+    """Speculative calls started, used and cancelled, and the share used."""
+    stats = dict(SPECULATION_STATS)
+    stats["hit_rate"] = round(stats["used"] / stats["started"], 3) if stats["started"] else None
+    return stats
+
+
+class _ModelCall:
+    """One planned generation — the full prompt, so identical calls can be matched."""
+    
+    __slots__ = ("task", "system", "user_msg", "max_tokens", "tool", "fallback", "dimension")
+    
+    def __init__(self, task: str, system, user_msg: str, max_tokens: int = None, tool: dict = None,
+                 fallback: str = None, dimension: str = None):
+        self.task = task
+        self.system = system
+        self.user_msg = user_msg
+        self.max_tokens = max_tokens or model_routing.route(task).max_tokens
+        self.tool = tool  # answer through this tool's schema (structured output)
+        self.fallback = fallback  # local reply if the model can't be reached
+        self.dimension = dimension  # rubric dimension its tokens are charged to
+    
+    @property
+    def key(self) -> str:
+        return json.dumps([self.task, self.system, self.user_msg, self.max_tokens, self.tool])
+
+
+class _MessageBuilder:
+    """Assembles a reply message, forwarding each piece to on_delta as it's produced.
+
+    Without on_delta this is plain string concatenation; with it, the caller
+    sees the exact final message arrive in order, generated text token by token.
+    """
+    
+    def __init__(self, on_delta=None):
+        self.on_delta = on_delta
+        self.parts = []
+    
+    def add(self, text: str):
+        if not text:
+            return
+        self.parts.append(text)
+        if self.on_delta is not None:
+            self.on_delta(text)
+    
+    def generate(self, produce) -> str:
+        """Append generated text. produce(on_delta) runs the generation."""
+        if self.on_delta is None:
+            text = produce(None)
+            self.add(text)
+            return text
+        return produce(self.add)
+    
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
 class SocraticMemory:
     """Tracks session state including essays, scores, and coaching history."""
     
-    def __init__(self):
-        self.essays = []           # All essay versions
+    def __init__(self, rubric: dict = None):
+        self.rubric = rubric or VALUE_RUBRIC
+        self.essays = EssayVersions()  # All essay versions (first text + deltas)
         self.scores_history = []   # Score dict for each version
         self.coaching_history = [] # All coaching messages
         self.reflection_turn = 0   # Current reflection question index
@@ -204,7 +767,7 @@ class SocraticMemory:
             if new_score > old_score:
                 improved.append({
                     'dimension': dim,
-                    'name': VALUE_RUBRIC[dim]['name'],
+                    'name': self.rubric[dim]['name'],
                     'old': old_score,
                     'new': new_score
                 })
@@ -227,10 +790,13 @@ class SocraticEngine:
     PHASE_REFLECT = "reflect"
     PHASE_COMPLETE = "complete"
     
-    def __init__(self):
-        self.memory = SocraticMemory()
+    def __init__(self, passage_id: str = None):
+        # One assignment per engine; the bundle is shared by every session on it
+        self.bundle = get_bundle(passage_id)
+        self.memory = SocraticMemory(self.bundle.rubric)
         self.current_phase = self.PHASE_READ
-        self.validator = PreSubmissionValidator()
+        self.usage = token_budget.UsageLedger()  # this session's model usage
+        self.validator = PreSubmissionValidator(self.bundle, self.usage)
     
     def get_varied_coaching_opener(self, is_first: bool = False) -> str:
         """Get a varied coaching opener to avoid repetition."""
@@ -274,51 +840,216 @@ class SocraticEngine:
         
         return " ".join(celebrations) + " "
     
-    def score_essay(self, essay: str) -> dict:
-        """Score essay against VALUE rubric."""
-        system = SCORING_SYSTEM_PROMPT.format(rubric_text=get_rubric_text())
-        user_msg = f"ESSAY:\n{essay}\n\nPASSAGE:\n{PASSAGE_TEXT}\n\n{EDGE_CASE_RULES}"
+    def estimate_writing_level(self, essay: str) -> str:
+        """Rough basic/intermediate/advanced read of the student's register."""
+        words = essay.split()
+        sentences = [s for s in essay.replace("!", ".").replace("?", ".").split(".") if s.strip()]
+        if not words:
+            return "basic"
+        avg_sentence = len(words) / max(1, len(sentences))
+        long_ratio = sum(1 for w in words if len(w.strip(".,;:!?\"'")) >= 7) / len(words)
+        if avg_sentence >= 18 and long_ratio >= 0.2:
+            return "advanced"
+        if avg_sentence < 10 or long_ratio < 0.1:
+            return "basic"
+        return "intermediate"
+    
+    @property
+    def score_fingerprint(self) -> str:
+        """Score cache context: the assignment's fingerprint plus the scoring model's settings."""
+        return model_routing.score_fingerprint(self.bundle.fingerprint)
+    
+    @tracing.traced("score_essay")
+    def score_essay(self, essay: str, fallback: bool = True) -> dict:
+        """Score essay against VALUE rubric.
+
+        Identical (whitespace-insensitive) resubmissions are answered from
+        the shared score cache, so they return instantly with the same scores.
+        If the model can't be reached or its reply can't be parsed, the
+        scores are estimated locally (see _fallback_scores); with
+        fallback=False UpstreamUnavailable is raised instead.
+        """
+        cache_key = make_key(essay, self.score_fingerprint)
+        cached = get_score_cache().get(cache_key)
+        tracing.current_span().set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
         
-        response = call_claude(system, user_msg, max_tokens=600)
+        call = self._scoring_call(essay)
+        try:
+            reply = call_claude_structured(call.system, call.user_msg, call.tool,
+                                           max_tokens=call.max_tokens, task=call.task)
+        except UpstreamUnavailable:
+            if not fallback:
+                raise
+            return self._fallback_scores(essay)
+        return self._scores_or_fallback(essay, reply, cache_key, fallback)
+    
+    @tracing.traced("score_essay")
+    async def ascore_essay(self, essay: str, fallback: bool = True) -> dict:
+        """Async score_essay (same cache, prompt, parsing and fallback)."""
+        cache_key = make_key(essay, self.score_fingerprint)
+        cached = get_score_cache().get(cache_key)
+        tracing.current_span().set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
         
-        # Parse JSON response
+        call = self._scoring_call(essay)
         try:
-            # Find JSON in response
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            if start >= 0 and end > start:
-                scores = json.loads(response[start:end])
-                return scores
-        except json.JSONDecodeError:
-            pass
-        
-        # Fallback scores if parsing fails
-        return {dim: {"score": 2, "rationale": "Unable to parse"} for dim in DIMENSION_ORDER}
-    
-    def generate_coaching(self, dimension: str, score_data: dict, essay: str) -> str:
-        """Generate Socratic coaching question for a dimension."""
-        system = COACHING_SYSTEM_PROMPT.format(
-            dimension_name=VALUE_RUBRIC[dimension]['name'],
-            current_score=score_data['score'],
-            target_score=TARGET_SCORE,
-            rationale=score_data['rationale'],
-            essay=essay,
-            passage=PASSAGE_TEXT
+            reply = await acall_claude_structured(call.system, call.user_msg, call.tool,
+                                                  max_tokens=call.max_tokens, task=call.task)
+        except UpstreamUnavailable:
+            if not fallback:
+                raise
+            return self._fallback_scores(essay)
+        return self._scores_or_fallback(essay, reply, cache_key, fallback)
+    
+    # Draft-check objective -> the rubric dimension it approximates
+    FALLBACK_DIMENSIONS = {"POSITION": "claim_clarity", "EVIDENCE": "evidence_use",
+                           "REASONING": "reasoning_depth", "STRUCTURE": "organization",
+                           "TONE": "voice_engagement"}
+    # Kept below TARGET_SCORE: an outage must never end a session as a success
+    FALLBACK_SCORES = {"present": 2, "weak": 2, "missing": 1}
+    
+    def _fallback_scores(self, essay: str) -> dict:
+        """Rough scores from the local draft check, used while scoring is unavailable.
+
+        Never cached, so the essay is scored properly once the model is back.
+        """
+        resilience.record_fallback("scoring")
+        tracing.current_span().set(fallback=True)
+        checks = {c["objective"]: c for c in self.validator._heuristic_check(essay)["checks"]}
+        scores = {}
+        for objective, dim in self.FALLBACK_DIMENSIONS.items():
+            check = checks[objective]
+            scores[dim] = {
+                "score": self.FALLBACK_SCORES[check["status"]],
+                "rationale": "Estimated locally while scoring was unavailable. " + check["tip"],
+            }
+        return scores
+    
+    def _scoring_call(self, essay: str) -> _ModelCall:
+        # Rubric, passage and edge-case rules never change between students,
+        # so they form the cached prefix; only the essay travels uncached.
+        system = cached_system(self.bundle.scoring_system)
+        return _ModelCall("scoring", system, f"ESSAY:\n{essay}", tool=SCORES_TOOL)
+    
+    def _parse_scores(self, reply, cache_key: str) -> dict:
+        """Validate a scoring reply (tool input or text) and cache it.
+
+        Text replies are repaired locally rather than re-requested. Raises
+        SchemaError if the reply still isn't a valid set of scores; failures
+        are counted in structured_output.get_parse_stats().
+        """
+        scores = parse_reply("scoring", reply, validate_scores)
+        get_score_cache().put(cache_key, scores)
+        return scores
+
+    def _scores_or_fallback(self, essay: str, reply, cache_key: str, fallback: bool) -> dict:
+        """_parse_scores, answering an unusable reply like an outage (it isn't a real score)."""
+        try:
+            return self._parse_scores(reply, cache_key)
+        except SchemaError as exc:
+            if not fallback:
+                raise UpstreamUnavailable("unparseable", exc) from exc
+            return self._fallback_scores(essay)
+    
+    def _complete(self, system, user_msg: str, max_tokens: int, task: str, on_delta=None,
+                  fallback: str = None, reuse_key: str = None) -> str:
+        """Run one generation, streaming deltas to on_delta when it is given.
+
+        If the model can't be reached and a fallback is given, the fallback
+        text completes the reply instead of raising. A generated reply is
+        kept under reuse_key, if given (see REUSABLE_REPLIES).
+        """
+        chunks = []
+        with tracing.span("generate", task=task):
+            try:
+                if on_delta is None:
+                    text = call_claude(system, user_msg, max_tokens=max_tokens, task=task)
+                else:
+                    for delta in stream_claude(system, user_msg, max_tokens=max_tokens, task=task):
+                        chunks.append(delta)
+                        on_delta(delta)
+                    text = "".join(chunks)
+            except UpstreamUnavailable:
+                if fallback is None:
+                    raise
+                return "".join(chunks) + self._emit_fallback(task, fallback, bool(chunks), on_delta)
+        if reuse_key is not None:
+            _remember_reply(reuse_key, text)
+        return text
+    
+    @staticmethod
+    def _emit_fallback(task: str, fallback: str, after_text: bool, on_delta=None) -> str:
+        resilience.record_fallback(task)
+        tracing.current_span().set(fallback=True)
+        text = ("\n\n" if after_text else "") + fallback
+        if on_delta is not None:
+            on_delta(text)
+        return text
+    
+    @staticmethod
+    def _reuse_key(call: _ModelCall) -> str:
+        return call.key if call.task in token_budget.REUSABLE_TASKS else None
+    
+    def _run_call(self, call: _ModelCall, on_delta=None) -> str:
+        reused = _reused_reply(call)
+        if reused is not None:
+            if on_delta is not None:
+                on_delta(reused)
+            return reused
+        with token_budget.dimension(call.dimension):
+            return self._complete(call.system, call.user_msg, call.max_tokens, call.task, on_delta,
+                                  call.fallback, self._reuse_key(call))
+    
+    async def _arun_call(self, call: _ModelCall, on_delta=None) -> str:
+        reused = _reused_reply(call)
+        if reused is not None:
+            if on_delta is not None:
+                on_delta(reused)
+            return reused
+        chunks = []
+
+        def sink(text):
+            chunks.append(text)
+            on_delta(text)
+        with tracing.span("generate", task=call.task), token_budget.dimension(call.dimension):
+            try:
+                text = await acall_claude(call.system, call.user_msg, call.max_tokens, call.task,
+                                          sink if on_delta is not None else None)
+            except UpstreamUnavailable:
+                if call.fallback is None:
+                    raise
+                return "".join(chunks) + self._emit_fallback(call.task, call.fallback, bool(chunks), on_delta)
+        if self._reuse_key(call) is not None:
+            _remember_reply(call.key, text)
+        return text
+    
+    def _coaching_call(self, dimension: str, score_data: dict, essay: str) -> _ModelCall:
+        system = cached_system(
+            self.bundle.coaching_system,
+            COACHING_STUDENT_CONTEXT.format(
+                writing_level=self.estimate_writing_level(essay),
+                dimension_name=self.bundle.dimension_name(dimension),
+                current_score=score_data['score'],
+                target_score=TARGET_SCORE,
+                rationale=score_data['rationale'],
+                essay=essay
+            )
         )
         
         user_msg = f"Generate ONE focused coaching question for this student."
-        return call_claude(system, user_msg, max_tokens=250)
+        return _ModelCall("coaching", system, user_msg,
+                          fallback=FALLBACK_COACHING_QUESTIONS[dimension], dimension=dimension)
     
-    def generate_model_example(self, dimension: str) -> str:
-        """Generate before/after example when student is stuck."""
-        system = MODEL_EXAMPLE_PROMPT.format(
-            dimension_name=VALUE_RUBRIC[dimension]['name']
-        )
-        user_msg = f"Create a brief before/after example showing how to improve {VALUE_RUBRIC[dimension]['name']}."
-        return call_claude(system, user_msg, max_tokens=350)
+    def _model_example_call(self, dimension: str, essay: str) -> _ModelCall:
+        system = self.bundle.model_example_system(dimension, self.estimate_writing_level(essay))
+        user_msg = f"Create a brief before/after example showing how to improve {self.bundle.dimension_name(dimension)}."
+        return _ModelCall("model_example", system, user_msg,
+                          fallback=FALLBACK_REPLIES["model_example"], dimension=dimension)
     
-    def generate_first_try_analysis(self, essay: str) -> str:
-        """Generate specific praise for first-try success."""
+    def _first_try_call(self, essay: str) -> _ModelCall:
         system = """You are a writing coach celebrating a student who wrote an excellent response on their first try.
 
 Write 2 short paragraphs with headers:
@@ -332,10 +1063,10 @@ Explain WHY these choices made their writing strong. Help them understand the pr
 Keep total response to 4-6 sentences. Be warm but specific."""
         
         user_msg = f"ESSAY:\n{essay}\n\nSCORES: All 5 dimensions at 3/4 or higher on first attempt."
-        return call_claude(system, user_msg, max_tokens=350)
+        return _ModelCall("first_try_analysis", system, user_msg,
+                          fallback=FALLBACK_REPLIES["first_try_analysis"])
     
-    def generate_improvement_insight(self, essay: str, first_essay: str) -> str:
-        """Generate analysis of what changed between versions."""
+    def _improvement_call(self, essay: str, first_essay: str) -> _ModelCall:
         system = """You are a writing coach explaining what improved between essay versions.
 
 Write a brief analysis (3-4 sentences) explaining:
@@ -348,7 +1079,25 @@ Focus on academic writing improvements: evidence integration, signal phrases, th
 Keep it specific and actionable - reference their actual words."""
         
         user_msg = f"FIRST ESSAY:\n{first_essay}\n\nFINAL ESSAY:\n{essay}"
-        return call_claude(system, user_msg, max_tokens=300)
+        return _ModelCall("improvement_insight", system, user_msg,
+                          fallback=FALLBACK_REPLIES["improvement_insight"])
+    
+    def generate_coaching(self, dimension: str, score_data: dict, essay: str, on_delta=None) -> str:
+        """Generate Socratic coaching question for a dimension."""
+        return self._run_call(self._coaching_call(dimension, score_data, essay), on_delta)
+    
+    def generate_model_example(self, dimension: str, on_delta=None) -> str:
+        """Generate before/after example when student is stuck."""
+        call = self._model_example_call(dimension, self.memory.get_latest_essay())
+        return self._run_call(call, on_delta)
+    
+    def generate_first_try_analysis(self, essay: str, on_delta=None) -> str:
+        """Generate specific praise for first-try success."""
+        return self._run_call(self._first_try_call(essay), on_delta)
+    
+    def generate_improvement_insight(self, essay: str, first_essay: str, on_delta=None) -> str:
+        """Generate analysis of what changed between versions."""
+        return self._run_call(self._improvement_call(essay, first_essay), on_delta)
     
     def should_show_roadmap(self) -> bool:
         """Determine if roadmap prompt should be shown (only when Organization <= 2)."""
@@ -357,66 +1106,174 @@ Keep it specific and actionable - reference their actual words."""
             return True  # Show on first submission
         return scores.get('organization', {}).get('score', 0) <= 2
     
-    def process_initial_essay(self, essay: str) -> dict:
-        """Process first essay submission."""
+    @tracing.traced("process_initial_essay")
+    @phase_deadline("submit")
+    @token_budget.metered("submit")
+    def process_initial_essay(self, essay: str, on_delta=None) -> dict:
+        """Process first essay submission.
+        
+        If on_delta is given, the reply message is streamed to it as it is
+        built (generated text token by token); the returned message is the same.
+        """
         scores = self.score_essay(essay)
         self.memory.add_essay(essay, scores)
+        message = _MessageBuilder(on_delta)
         
         # Check if already at target
         if self.memory.all_dimensions_at_target():
-            analysis = self.generate_first_try_analysis(essay)
-            
-            message = f"## ✓ {CELEBRATION_MESSAGES['first_try'][0]}\n\n"
-            message += f"{CELEBRATION_MESSAGES['first_try'][1]}\n\n"
-            message += f"{analysis}\n\n"
-            message += "---\n\n"
-            message += "**Your essay:**\n\n"
-            message += f"> {essay}\n\n"
-            message += "---\n\n"
-            message += "Since your writing is already strong, let's reflect on your process so you can repeat this next time."
+            message.add(f"## ✓ {CELEBRATION_MESSAGES['first_try'][0]}\n\n")
+            message.add(f"{CELEBRATION_MESSAGES['first_try'][1]}\n\n")
+            message.generate(lambda sink: self.generate_first_try_analysis(essay, on_delta=sink))
+            message.add("\n\n")
+            message.add("---\n\n")
+            message.add("**Your essay:**\n\n")
+            message.add(f"> {essay}\n\n")
+            message.add("---\n\n")
+            message.add("Since your writing is already strong, let's reflect on your process so you can repeat this next time.")
             
             return {
                 "phase": self.PHASE_REFLECT,
                 "scores": scores,
-                "message": message
+                "message": message.text()
             }
         
-        # Generate coaching for lowest dimension
+        # Build response with conditional roadmap, then coach the lowest dimension
         lowest_dim, lowest_data = self.memory.get_lowest_dimension()
-        coaching = self.generate_coaching(lowest_dim, lowest_data, essay)
-        self.memory.add_coaching(coaching)
-        
-        # Build response with conditional roadmap
         opener = self.get_varied_coaching_opener(is_first=True)
         
-        message = f"{opener}\n\n"
+        message.add(f"{opener}\n\n")
         
         # Only show roadmap if Organization is low
         if self.should_show_roadmap():
-            message += f"**{ROADMAP_PROMPT}**\n\n"
+            message.add(f"**{ROADMAP_PROMPT}**\n\n")
         
-        message += f"Here's my first question for you:\n\n{coaching}"
+        message.add("Here's my first question for you:\n\n")
+        coaching = message.generate(
+            lambda sink: self.generate_coaching(lowest_dim, lowest_data, essay, on_delta=sink)
+        )
+        self.memory.add_coaching(coaching)
         
         return {
             "phase": self.PHASE_COACH,
             "scores": scores,
-            "message": message,
+            "message": message.text(),
             "focus_dimension": lowest_dim
         }
     
-    def process_revision(self, essay: str) -> dict:
-        """Process a revision submission."""
+    @tracing.traced("process_revision")
+    @phase_deadline("revise")
+    @token_budget.metered("revise")
+    def process_revision(self, essay: str, on_delta=None) -> dict:
+        """Process a revision submission (streams the reply to on_delta if given)."""
         prev_scores = self.memory.get_latest_scores()
         new_scores = self.score_essay(essay)
         self.memory.add_essay(essay, new_scores)
+        return self._run_plan(self._plan_revision(essay, prev_scores), on_delta)
+    
+    @tracing.traced("process_revision_async")
+    @phase_deadline("revise")
+    @token_budget.metered("revise")
+    async def process_revision_async(self, essay: str, on_delta=None, speculate: bool = None) -> dict:
+        """Concurrent process_revision; run it on client_pool's event loop.
         
+        With speculate (default SPECULATE_REVISIONS), the MODEL example the
+        reply would need if the student is still stuck is started while the
+        essay is being scored (not while the token budget is low). Once the
+        score arrives it is kept if the reply uses it and cancelled
+        otherwise; any remaining independent calls run in parallel.
+        """
+        if speculate is None:
+            speculate = SPECULATE_REVISIONS
+        prev_scores = self.memory.get_latest_scores()
+        running = {}
+        try:
+            if (speculate and not self.memory.at_turn_limit()
+                    and not token_budget.should_save("speculation")):
+                for call in self._speculative_calls(essay, prev_scores):
+                    running[call.key] = asyncio.ensure_future(self._arun_call(call))
+                    SPECULATION_STATS["started"] += 1
+            
+            new_scores = await self.ascore_essay(essay)
+            self.memory.add_essay(essay, new_scores)
+            plan = self._plan_revision(essay, prev_scores)
+            
+            calls = [part for part in plan["parts"] if isinstance(part, _ModelCall)]
+            needed = {call.key for call in calls}
+            for key in list(running):
+                if key in needed:
+                    SPECULATION_STATS["used"] += 1
+                else:
+                    running.pop(key).cancel()
+                    SPECULATION_STATS["cancelled"] += 1
+            
+            # Start everything else now; with on_delta, the first new call is
+            # run inline instead so it can stream.
+            streamed = None
+            for call in calls:
+                if call.key in running:
+                    continue
+                if on_delta is not None and streamed is None:
+                    streamed = call.key
+                    continue
+                running[call.key] = asyncio.ensure_future(self._arun_call(call))
+            
+            message = _MessageBuilder(on_delta)
+            texts = []
+            for part in plan["parts"]:
+                if not isinstance(part, _ModelCall):
+                    message.add(part)
+                    texts.append(part)
+                elif part.key in running:
+                    text = await running.pop(part.key)
+                    message.add(text)
+                    texts.append(text)
+                else:
+                    texts.append(await self._arun_call(part, message.add))
+            return self._finish_plan(plan, message.text(), texts)
+        finally:
+            for task in running.values():
+                task.cancel()
+    
+    @tracing.traced("process_revision_concurrent")
+    @phase_deadline("revise")
+    @token_budget.metered("revise")
+    def process_revision_concurrent(self, essay: str, on_delta=None, speculate: bool = None) -> dict:
+        """Run process_revision_async from a regular (e.g. Streamlit script) thread."""
+        return _run_on_shared_loop(
+            lambda sink: self.process_revision_async(essay, on_delta=sink, speculate=speculate), on_delta
+        )
+    
+    def _speculative_calls(self, essay: str, prev_scores: dict) -> list:
+        """The call a revision of essay needs if the student is stuck, before it is scored.
+        
+        Only the clear case is predicted: one dimension strictly lowest,
+        which hasn't had MODEL mode yet. If its score doesn't move, the
+        reply is that dimension's MODEL example.
+        """
+        if not prev_scores or not self.memory.essays:
+            return []
+        ranked = sorted(DIMENSION_ORDER, key=lambda d: prev_scores[d]['score'])
+        lowest = ranked[0]
+        if (prev_scores[lowest]['score'] == prev_scores[ranked[1]]['score']
+                or lowest in self.memory.model_mode_used or lowest == "evidence_use"):
+            return []
+        return [self._model_example_call(lowest, essay)]
+    
+    def _plan_revision(self, essay: str, prev_scores: dict) -> dict:
+        """Decide how to answer a revision that has just been scored and stored.
+        
+        Returns a reply plan: text and _ModelCall steps in display order, plus
+        the index of the step that counts as this turn's coaching.
+        """
         # Check if at target
         if self.memory.all_dimensions_at_target():
-            return self._build_success_message(essay)
+            return self._plan_success(essay)
         
         # Check turn limit
         if self.memory.at_turn_limit():
-            return self._build_turn_limit_message()
+            return self._plan_turn_limit()
+        
+        new_scores = self.memory.get_latest_scores()
         
         # Find lowest dimension and check for improvement
         lowest_dim, lowest_data = self.memory.get_lowest_dimension()
@@ -429,117 +1286,108 @@ Keep it specific and actionable - reference their actual words."""
         # Check if stuck on same dimension (trigger MODEL mode)
         if new_score <= prev_score and lowest_dim in self.memory.model_mode_used:
             # Already tried MODEL mode, try different approach
-            coaching = self.generate_coaching(lowest_dim, lowest_data, essay)
-            self.memory.add_coaching(coaching)
-            
-            message = micro_celeb if micro_celeb else ""
-            message += f"{coaching}"
-            
-            return {
-                "phase": self.PHASE_COACH,
-                "scores": new_scores,
-                "message": message,
-                "focus_dimension": lowest_dim
-            }
+            parts = [micro_celeb, self._coaching_call(lowest_dim, lowest_data, essay)]
         
         elif new_score <= prev_score:
             # First time stuck - use MODEL mode
             self.memory.model_mode_used.add(lowest_dim)
             
+            parts = [
+                f"## 📋 Let me show you an example:\n\n",
+                f"Your {self.bundle.dimension_name(lowest_dim)} score hasn't moved yet, and that's okay - this one can be tricky. ",
+                f"Let me show you an example of what I mean:\n\n",
+            ]
+            
             # Special handling for Evidence Use - use Quote Sandwich
             if lowest_dim == "evidence_use":
-                model_example = QUOTE_SANDWICH_PROMPT
+                parts.append(QUOTE_SANDWICH_PROMPT)
             else:
-                model_example = self.generate_model_example(lowest_dim)
-            
-            self.memory.add_coaching(model_example)
-            
-            message = f"## 📋 Let me show you an example:\n\n"
-            message += f"Your {VALUE_RUBRIC[lowest_dim]['name']} score hasn't moved yet, and that's okay - this one can be tricky. "
-            message += f"Let me show you an example of what I mean:\n\n"
-            message += f"{model_example}"
-            
-            return {
-                "phase": self.PHASE_COACH,
-                "scores": new_scores,
-                "message": message,
-                "focus_dimension": lowest_dim
-            }
+                parts.append(self._model_example_call(lowest_dim, essay))
         
         else:
-            # Score improved, generate new coaching
-            coaching = self.generate_coaching(lowest_dim, lowest_data, essay)
-            self.memory.add_coaching(coaching)
-            
-            # Build message with micro-celebration
-            opener = self.get_varied_coaching_opener()
-            
-            message = ""
-            if micro_celeb:
-                message += f"{micro_celeb}\n\n"
+            # Score improved, generate new coaching with micro-celebration
+            parts = [f"{micro_celeb}\n\n" if micro_celeb else ""]
             
             # Only show roadmap if Organization is still low
             if self.should_show_roadmap():
-                message += f"**{ROADMAP_PROMPT}**\n\n"
-            
-            message += f"{coaching}"
+                parts.append(f"**{ROADMAP_PROMPT}**\n\n")
             
-            return {
-                "phase": self.PHASE_COACH,
-                "scores": new_scores,
-                "message": message,
-                "focus_dimension": lowest_dim
-            }
+            parts.append(self._coaching_call(lowest_dim, lowest_data, essay))
+        
+        return {
+            "phase": self.PHASE_COACH,
+            "scores": new_scores,
+            "parts": parts,
+            "coaching_part": len(parts) - 1,
+            "focus_dimension": lowest_dim
+        }
     
-    def _build_success_message(self, essay: str) -> dict:
+    def _run_plan(self, plan: dict, on_delta=None) -> dict:
+        """Produce a planned reply, one call after another."""
+        message = _MessageBuilder(on_delta)
+        texts = []
+        for part in plan["parts"]:
+            if isinstance(part, _ModelCall):
+                texts.append(message.generate(lambda sink: self._run_call(part, sink)))
+            else:
+                message.add(part)
+                texts.append(part)
+        return self._finish_plan(plan, message.text(), texts)
+    
+    def _finish_plan(self, plan: dict, message: str, texts: list) -> dict:
+        if plan.get("coaching_part") is not None:
+            self.memory.add_coaching(texts[plan["coaching_part"]])
+        result = {"phase": plan["phase"], "scores": plan["scores"], "message": message}
+        if "focus_dimension" in plan:
+            result["focus_dimension"] = plan["focus_dimension"]
+        return result
+    
+    def _build_success_message(self, essay: str, on_delta=None) -> dict:
         """Build the success/celebration message."""
+        return self._run_plan(self._plan_success(essay), on_delta)
+    
+    def _plan_success(self, essay: str) -> dict:
         scores = self.memory.get_latest_scores()
         revisions = self.memory.get_revision_count()
         
         # Get journey-aware opener
         celebration_opener = self.get_varied_celebration_opener()
-        
-        # Generate improvement insight
-        if revisions > 0:
-            first_essay = self.memory.essays[0]
-            improvement_insight = self.generate_improvement_insight(essay, first_essay)
-        else:
-            improvement_insight = ""
-        
-        message = f"## ✓ {celebration_opener}\n\n"
+        parts = [f"## ✓ {celebration_opener}\n\n"]
         
         # Show score progress
         if revisions > 0:
-            message += "**What changed:**\n\n"
+            progress = "**What changed:**\n\n"
             for dim in DIMENSION_ORDER:
                 first_score = self.memory.scores_history[0][dim]['score']
                 final_score = scores[dim]['score']
                 if final_score > first_score:
-                    message += f"- **{VALUE_RUBRIC[dim]['name']}:** {first_score} → {final_score} ⬆️\n"
+                    progress += f"- **{self.bundle.dimension_name(dim)}:** {first_score} → {final_score} ⬆️\n"
                 else:
-                    message += f"- **{VALUE_RUBRIC[dim]['name']}:** {first_score} → {final_score} ➡️\n"
-            message += "\n"
-        
-        # Add improvement insight
-        if improvement_insight:
-            message += f"**What made the difference:** {improvement_insight}\n\n"
+                    progress += f"- **{self.bundle.dimension_name(dim)}:** {first_score} → {final_score} ➡️\n"
+            parts.append(progress + "\n")
+            
+            # Add improvement insight
+            parts.append("**What made the difference:** ")
+            parts.append(self._improvement_call(essay, self.memory.essays[0]))
+            parts.append("\n\n")
         
-        message += "---\n\n"
-        message += "**Where you started:**\n\n"
-        message += f"> {self.memory.essays[0]}\n\n"
-        message += "**Where you are now:**\n\n"
-        message += f"> {essay}\n\n"
-        message += "---\n\n"
-        message += "Your writing is stronger now. Let's take a few minutes to reflect on what you learned so you can use these skills again."
+        parts.append(
+            "---\n\n"
+            "**Where you started:**\n\n"
+            f"> {self.memory.essays[0]}\n\n"
+            "**Where you are now:**\n\n"
+            f"> {essay}\n\n"
+            "---\n\n"
+            "Your writing is stronger now. Let's take a few minutes to reflect on what you learned so you can use these skills again."
+        )
         
-        return {
-            "phase": self.PHASE_REFLECT,
-            "scores": scores,
-            "message": message
-        }
+        return {"phase": self.PHASE_REFLECT, "scores": scores, "parts": parts}
     
-    def _build_turn_limit_message(self) -> dict:
+    def _build_turn_limit_message(self, on_delta=None) -> dict:
         """Build message when coaching turn limit is reached."""
+        return self._run_plan(self._plan_turn_limit(), on_delta)
+    
+    def _plan_turn_limit(self) -> dict:
         scores = self.memory.get_latest_scores()
         essay = self.memory.get_latest_essay()
         
@@ -552,7 +1400,7 @@ Keep it specific and actionable - reference their actual words."""
         for dim in DIMENSION_ORDER:
             score = scores[dim]['score']
             status = "🟢" if score >= TARGET_SCORE else "🟡" if score == 2 else "🔴"
-            message += f"- {status} {VALUE_RUBRIC[dim]['name']}: {score}/4\n"
+            message += f"- {status} {self.bundle.dimension_name(dim)}: {score}/4\n"
         
         message += "\n---\n\n"
         message += "**Your essay:**\n\n"
@@ -560,35 +1408,36 @@ Keep it specific and actionable - reference their actual words."""
         message += "---\n\n"
         message += "Let's reflect on what you learned during this session."
         
-        return {
-            "phase": self.PHASE_REFLECT,
-            "scores": scores,
-            "message": message
-        }
+        return {"phase": self.PHASE_REFLECT, "scores": scores, "parts": [message]}
     
-    def process_reflection(self, response: str) -> dict:
+    @tracing.traced("process_reflection")
+    @phase_deadline("reflect")
+    @token_budget.metered("reflect")
+    def process_reflection(self, response: str, on_delta=None) -> dict:
         """Process reflection response and return next reflection or completion."""
         self.memory.reflection_responses.append(response)
+        message = _MessageBuilder(on_delta)
         
         # Get current reflection prompt
-        current_prompt = REFLECTION_PROMPTS[self.memory.reflection_turn]
+        current_prompt = self.bundle.reflection_prompts[self.memory.reflection_turn]
         
         # Generate followup to their response
-        followup = call_claude(
+        followup = message.generate(lambda sink: self._complete(
             current_prompt['followup_system'],
             f"Student said: {response}",
-            max_tokens=150
-        )
+            None, "reflection", sink, fallback=FALLBACK_REPLIES["reflection"]
+        ))
         
         # Move to next reflection turn
         self.memory.reflection_turn += 1
         
         # Check if more reflection questions
-        if self.memory.reflection_turn < len(REFLECTION_PROMPTS):
-            next_question = REFLECTION_PROMPTS[self.memory.reflection_turn]['question']
+        if self.memory.reflection_turn < len(self.bundle.reflection_prompts):
+            next_question = self.bundle.reflection_prompts[self.memory.reflection_turn]['question']
+            message.add(f"\n\n**{next_question}**")
             return {
                 "phase": self.PHASE_REFLECT,
-                "message": f"{followup}\n\n**{next_question}**"
+                "message": message.text()
             }
         else:
             # Reflection complete
@@ -600,9 +1449,13 @@ Keep it specific and actionable - reference their actual words."""
     def get_session_stats(self) -> dict:
         """Return session statistics."""
         return {
+            "passage_id": self.bundle.passage_id,
             "revisions": self.memory.get_revision_count(),
             "coaching_turns": self.memory.coaching_turns,
             "essay_versions": len(self.memory.essays),
+            "essay_storage": self.memory.essays.stats(),
             "reflection_turns": self.memory.reflection_turn,
-            "final_scores": self.memory.get_latest_scores()
+            "final_scores": self.memory.get_latest_scores(),
+            "usage": self.usage.summary(),
+            "budget": token_budget.status(self.usage, self.bundle.passage_id),
         }
@@ -0,0 +1,123 @@
+"""
+Sentence Index for Socratic Writing Tutor
+
+Between two "Check my draft" presses a student usually changes a sentence or
+two. DraftIndex keeps the previous draft as a list of sentence hashes plus
+per-sentence findings (from any analyse(sentence) function, e.g. the
+validator's lexicon), so a re-check only analyses sentences it has not seen
+and reports exactly what was added and removed.
+
+One index per validator, i.e. per student session.
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+
+_SENTENCE_SPLIT = re.compile(r"[.!?]")
+
+
+def split_sentences(text: str) -> list:
+    """Sentences as the validator counts them: split on . ! ?, blanks dropped."""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def sentence_hash(sentence: str) -> str:
+    normalized = " ".join(sentence.split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class DraftDiff:
+    """What changed between the previous draft and this one."""
+
+    __slots__ = ("added", "removed", "markers", "change_ratio", "structure_changed", "first")
+
+    def __init__(self, added, removed, markers, change_ratio, structure_changed, first):
+        self.added = added                          # [(sentence, findings)]
+        self.removed = removed                      # [(sentence, findings)]
+        self.markers = markers                      # category -> distinct terms, whole draft
+        self.change_ratio = change_ratio            # 0.0 unchanged .. 1.0 rewritten
+        self.structure_changed = structure_changed  # sentence/paragraph count or order
+        self.first = first                          # no previous draft to compare with
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.structure_changed)
+
+
+class DraftIndex:
+    """Per-session sentence hash index with cached per-sentence findings."""
+
+    def __init__(self, analyse, max_cached: int = 2000):
+        self.analyse = analyse
+        self.max_cached = max_cached
+        self._findings = OrderedDict()  # hash -> findings
+        self._sentences = []            # [(hash, sentence)] of the previous draft
+        self._paragraphs = 0
+        self.stats = {"drafts": 0, "sentences_analysed": 0, "sentences_reused": 0}
+
+    def _lookup(self, key: str, sentence: str):
+        findings = self._findings.get(key)
+        if findings is None:
+            findings = self.analyse(sentence)
+            self._findings[key] = findings
+            if len(self._findings) > self.max_cached:
+                self._findings.popitem(last=False)
+            self.stats["sentences_analysed"] += 1
+        else:
+            self._findings.move_to_end(key)
+            self.stats["sentences_reused"] += 1
+        return findings
+
+    def update(self, text: str) -> DraftDiff:
+        """Index a new draft and diff it against the previous one."""
+        first = self.stats["drafts"] == 0
+        self.stats["drafts"] += 1
+        sentences = [(sentence_hash(s), s) for s in split_sentences(text)]
+        paragraphs = len([p for p in re.split(r"\n\s*\n", text) if p.strip()])
+        findings = [self._lookup(key, s) for key, s in sentences]
+
+        old_keys = [key for key, _ in self._sentences]
+        new_keys = [key for key, _ in sentences]
+        remaining = {}
+        for key in old_keys:
+            remaining[key] = remaining.get(key, 0) + 1
+        added = []
+        for (key, s), found in zip(sentences, findings):
+            if remaining.get(key):
+                remaining[key] -= 1
+            else:
+                added.append((s, found))
+        still_new = {}
+        for key in new_keys:
+            still_new[key] = still_new.get(key, 0) + 1
+        removed = []
+        for key, s in self._sentences:
+            if still_new.get(key):
+                still_new[key] -= 1
+            else:
+                removed.append((s, self._lookup(key, s)))
+
+        old_set, new_set = set(old_keys), set(new_keys)
+        kept_old = [k for k in old_keys if k in new_set]
+        kept_new = [k for k in new_keys if k in old_set]
+        structure_changed = (
+            len(sentences) != len(self._sentences) or paragraphs != self._paragraphs
+            or kept_old != kept_new
+        )
+
+        old_words = sum(len(s.split()) for _, s in self._sentences)
+        new_words = sum(len(s.split()) for _, s in sentences)
+        changed_words = sum(len(s.split()) for s, _ in added) + sum(len(s.split()) for s, _ in removed)
+        total = old_words + new_words
+        change_ratio = changed_words / total if total else 0.0
+
+        markers = {}
+        for found in findings:
+            for category, terms in found.items():
+                bucket = markers.setdefault(category, [])
+                bucket.extend(t for t in terms if t not in bucket)
+
+        self._sentences = sentences
+        self._paragraphs = paragraphs
+        return DraftDiff(added, removed, markers, change_ratio, structure_changed, first)
@@ -0,0 +1,205 @@
+"""
+Essay Version Storage for Socratic Writing Tutor
+
+SocraticMemory used to keep every essay version as a full string: up to 16
+near-identical copies per session, all of it held in st.session_state and
+serialized whole again by the logger and the export. Revisions usually change
+a few sentences, so almost all of that is repetition.
+
+EssayVersions stores the first essay as text and every later version as a
+delta against the one before it: a tuple of ops over the previous version's
+tokens (runs of whitespace or non-whitespace, so joining them gives the exact
+text back):
+
+    n > 0     copy the next n tokens
+    n < 0     skip the next -n tokens
+    "text"    insert text
+
+A version whose delta wouldn't be smaller than itself (a full rewrite) is
+stored whole as a keyframe, so rebuilding never walks further back than the
+last keyframe. Texts are rebuilt on demand and memoized; the memo holds only
+the latest version (needed for the next diff) and the last one asked for,
+and is dropped when the object is pickled.
+
+It behaves like the list it replaces (len, indexing, iteration, truthiness).
+encode() and decode_versions() give the same compact form for session
+snapshots; exports decode to full texts.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+_TOKEN = re.compile(r"\s+|\S+")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall(text)
+
+
+def diff_ops(old_tokens: list, new_tokens: list) -> tuple:
+    """Ops turning old_tokens into new_tokens (see module docstring)."""
+    ops = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append("".join(new_tokens[j1:j2]))
+    return tuple(ops)
+
+
+def apply_ops(old_tokens: list, ops) -> str:
+    out = []
+    i = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.extend(old_tokens[i:i + op])
+            i += op
+        else:
+            i -= op
+    return "".join(out)
+
+
+def _ops_size(ops) -> int:
+    # Stored size: inserted characters plus a few bytes per op
+    return sum(len(op) if isinstance(op, str) else 4 for op in ops)
+
+
+class _Version:
+    """One stored version: a keyframe (text) or a delta (ops) against the previous version."""
+
+    __slots__ = ("text", "ops", "length")
+
+    def __init__(self, text: str = None, ops: tuple = None, length: int = 0):
+        self.text = text
+        self.ops = ops
+        self.length = length
+
+    def __getstate__(self):
+        return (self.text, self.ops, self.length)
+
+    def __setstate__(self, state):
+        self.text, self.ops, self.length = state
+
+
+class EssayVersions:
+    """Append-only essay history stored as a first text plus deltas."""
+
+    __slots__ = ("_versions", "_memo", "_latest_tokens")
+
+    def __init__(self, texts=()):
+        self._versions = []
+        self._memo = {}
+        self._latest_tokens = None
+        for text in texts:
+            self.append(text)
+
+    def append(self, text: str):
+        tokens = tokenize(text)
+        if self._versions:
+            ops = diff_ops(self._tokens(len(self._versions) - 1), tokens)
+            if _ops_size(ops) < len(text):
+                self._versions.append(_Version(ops=ops, length=len(text)))
+            else:
+                self._versions.append(_Version(text=text, length=len(text)))
+        else:
+            self._versions.append(_Version(text=text, length=len(text)))
+        self._latest_tokens = tokens
+        self._memo = {len(self._versions) - 1: text}
+
+    def _tokens(self, index: int) -> list:
+        if index == len(self._versions) - 1 and self._latest_tokens is not None:
+            return self._latest_tokens
+        return tokenize(self._text(index))
+
+    def _text(self, index: int) -> str:
+        if index in self._memo:
+            return self._memo[index]
+        start = index
+        while self._versions[start].text is None:
+            start -= 1
+        text = self._versions[start].text
+        for version in self._versions[start + 1:index + 1]:
+            text = apply_ops(tokenize(text), version.ops) if version.text is None else version.text
+        # Keep the latest version plus this one
+        latest = len(self._versions) - 1
+        self._memo = {i: t for i, t in self._memo.items() if i == latest}
+        self._memo[index] = text
+        return text
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __bool__(self) -> bool:
+        return bool(self._versions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._text(i) for i in range(*index.indices(len(self._versions)))]
+        if index < 0:
+            index += len(self._versions)
+        if not 0 <= index < len(self._versions):
+            raise IndexError("essay version out of range")
+        return self._text(index)
+
+    def __iter__(self):
+        # Walk forward once instead of rebuilding each version from its keyframe
+        text = None
+        for version in self._versions:
+            text = version.text if version.text is not None else apply_ops(tokenize(text), version.ops)
+            yield text
+
+    def __getstate__(self):
+        return (self._versions,)  # never falsy, so copy/pickle always restore it
+
+    def __setstate__(self, state):
+        self._versions = state[0]
+        self._memo = {}
+        self._latest_tokens = None
+
+    def stats(self) -> dict:
+        """Characters stored vs. what full copies of every version would take."""
+        stored = sum(v.length if v.text is not None else _ops_size(v.ops) for v in self._versions)
+        return {
+            "versions": len(self._versions),
+            "keyframes": sum(1 for v in self._versions if v.text is not None),
+            "stored_chars": stored,
+            "full_chars": sum(v.length for v in self._versions),
+        }
+
+    def encode(self) -> list:
+        """JSON-ready compact form: [{"text": ...} | {"delta": [...]}, ...]."""
+        return [{"text": v.text} if v.text is not None else {"delta": list(v.ops)} for v in self._versions]
+
+    @classmethod
+    def decode(cls, entries) -> "EssayVersions":
+        """Inverse of encode(); keeps the stored deltas instead of diffing again."""
+        versions = cls()
+        text = None
+        for entry in entries:
+            if entry.get("text") is not None:
+                text = entry["text"]
+                versions._versions.append(_Version(text=text, length=len(text)))
+            else:
+                ops = tuple(entry["delta"])
+                text = apply_ops(tokenize(text), ops)
+                versions._versions.append(_Version(ops=ops, length=len(text)))
+        if text is not None:
+            versions._memo = {len(versions._versions) - 1: text}
+        return versions
+
+
+def decode_versions(entries) -> list:
+    """Full texts from encode()'s form (e.g. the "essays" of a session export)."""
+    texts = []
+    for entry in entries:
+        if entry.get("text") is not None:
+            texts.append(entry["text"])
+        else:
+            texts.append(apply_ops(tokenize(texts[-1]), entry["delta"]))
+    return texts
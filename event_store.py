@@ -0,0 +1,228 @@
+"""
+Logger Backends for Socratic Writing Tutor
+
+session_logger builds one row per event (phase transition, completed session)
+and hands it to every configured backend. A backend only has to implement
+write(); flush(), close() and get_stats() are optional.
+
+Backends:
+- JsonlEventStore  local, append-only JSON Lines file — the durable record.
+                   Works offline. Writes from all sessions are group-committed:
+                   one write + fsync covers every event that arrived in the
+                   same commit window.
+- SheetsSink       Google Sheets, fed through the batching BackgroundLogWriter
+                   (log_queue.py) — a downstream copy, never the only one.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+
+class LogBackend:
+    """Interface for session log backends."""
+
+    name = "backend"
+
+    def write(self, stream: str, headers: list, row: list):
+        """Record one row for the given stream (worksheet name)."""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+class JsonlEventStore(LogBackend):
+    """Append-only JSON Lines event log with group-commit fsync batching.
+
+    Each record is {"seq", "ts", "stream", "data": {header: value}}. Writers
+    append to a shared buffer; a committer thread writes and fsyncs the whole
+    buffer at most every commit_interval seconds. write() returns at once;
+    flush() (also run by close() and at interpreter exit) waits for what was
+    written so far. With wait_for_commit, write() returns only once its record
+    is on disk — still one fsync per group, not per event, but the caller
+    waits out a commit window.
+    """
+
+    name = "local"
+
+    def __init__(self, path: str = "session_events.jsonl", commit_interval: float = 0.02,
+                 wait_for_commit: bool = False, max_group: int = 1000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.wait_for_commit = wait_for_commit
+        self.max_group = max_group
+        self.stats = {"events": 0, "commits": 0, "fsyncs": 0, "errors": 0, "largest_group": 0}
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._seq = self._last_seq()
+        self._committed_seq = self._seq
+        self._closed = False
+        self._failures = 0  # consecutive failed commits
+        # Unbuffered, so a failed commit leaves nothing behind to be written later
+        self._file = open(path, "ab", buffering=0)
+        self._end_torn_line()
+        self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _last_seq(self) -> int:
+        """Resume numbering after the last record already on disk."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 65536))
+                lines = f.read().splitlines()
+            for line in reversed(lines):
+                try:
+                    return int(json.loads(line)["seq"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        except OSError:
+            pass
+        return 0
+
+    def _end_torn_line(self):
+        """Terminate a line torn by a crash, so the next record isn't glued onto it."""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) == b"\n":
+                    return
+            self._file.write(b"\n")
+        except OSError:
+            pass
+
+    def write(self, stream: str, headers: list, row: list):
+        with self._cond:
+            if self._closed:
+                return
+            self._seq += 1
+            seq = self._seq
+            record = {"seq": seq, "ts": time.time(), "stream": stream, "data": dict(zip(headers, row))}
+            self._buffer.append(json.dumps(record, default=str))
+            self.stats["events"] += 1
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_group:
+                self._cond.notify_all()
+            if self.wait_for_commit:
+                # Bounded wait — a stuck disk must not hang the student's page
+                self._cond.wait_for(lambda: self._committed_seq >= seq or self._closed,
+                                    timeout=max(1.0, self.commit_interval * 50))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._closed, timeout=1.0)
+                if self._closed and not self._buffer:
+                    return
+            # Let the group fill for one commit window, then take all of it
+            time.sleep(self.commit_interval)
+            with self._cond:
+                group, self._buffer = self._buffer, []
+                group_seq = self._seq
+            if self._commit(group):
+                self._failures = 0
+                with self._cond:
+                    self._committed_seq = group_seq
+                    self._cond.notify_all()
+                continue
+            # Keep the group (ahead of anything newer) and retry after a pause;
+            # waiters keep waiting (bounded) rather than being told it's on disk
+            with self._cond:
+                self._buffer[:0] = group
+                closed = self._closed
+            self._failures += 1
+            if closed and self._failures >= 3:
+                return  # shutting down: give up on a disk that keeps failing
+            time.sleep(min(1.0, self.commit_interval * 2 ** self._failures))
+
+    def _commit(self, group: list) -> bool:
+        """Append and fsync group; on failure, cut the file back to where it was."""
+        if not group:
+            return True
+        data = memoryview(("\n".join(group) + "\n").encode("utf-8"))
+        fd = self._file.fileno()
+        try:
+            start = os.fstat(fd).st_size
+        except OSError:
+            self.stats["errors"] += 1
+            return False
+        try:
+            while data:
+                data = data[self._file.write(data):]
+            os.fsync(fd)
+        except OSError:
+            self.stats["errors"] += 1
+            try:
+                os.ftruncate(fd, start)  # no half-written group to duplicate on retry
+            except OSError:
+                pass
+            return False
+        self.stats["commits"] += 1
+        self.stats["fsyncs"] += 1
+        self.stats["largest_group"] = max(self.stats["largest_group"], len(group))
+        return True
+
+    def flush(self):
+        with self._cond:
+            target = self._seq
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._committed_seq >= target, timeout=5.0)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5.0)
+        self._file.close()
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._buffer)
+        stats["events_per_fsync"] = round(stats["events"] / stats["fsyncs"], 2) if stats["fsyncs"] else 0.0
+        return stats
+
+    def read_events(self, stream: str = None):
+        """Iterate stored events (optionally one stream), oldest first."""
+        self.flush()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line after a crash
+                if stream is None or record.get("stream") == stream:
+                    yield record
+
+
+class SheetsSink(LogBackend):
+    """Google Sheets as an asynchronous downstream sink."""
+
+    name = "sheets"
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, stream: str, headers: list, row: list):
+        self.writer.submit(stream, headers, row)
+
+    def close(self):
+        self.writer.close()
+
+    def get_stats(self) -> dict:
+        return self.writer.get_stats()
@@ -0,0 +1,106 @@
+"""
+Lexicon Matcher for Socratic Writing Tutor
+
+The heuristic validator looks for marker phrases (evidence, position,
+reasoning, casual tone) in every draft. Scanning once per phrase with
+`phrase in text` costs one pass per entry and ignores word boundaries, so
+"sam" matched "same" and "imo" matched "imoral".
+
+Lexicon compiles all categories into one Aho-Corasick automaton when it is
+built (at import, or when a passage's markers load). find_all() then walks
+the draft once, whatever the number of phrases, and reports every hit that
+starts and ends on a word boundary, with its category and offset.
+
+Matching is case-insensitive; curly apostrophes match straight ones.
+"""
+
+from collections import deque, namedtuple
+
+Hit = namedtuple("Hit", ["category", "term", "start", "end"])
+
+_CHAR_MAP = {"’": "'", "‘": "'"}
+
+
+def _fold(ch: str) -> str:
+    ch = _CHAR_MAP.get(ch, ch)
+    lowered = ch.lower()
+    # Keep offsets aligned with the original text
+    return lowered if len(lowered) == 1 else ch
+
+
+class Lexicon:
+    """Multi-pattern, word-boundary-aware phrase matcher.
+
+    categories maps a category name to its phrases, e.g.
+    {"evidence": ["1962", "panopoulos"], "casual": ["lol", "tbh"]}.
+    """
+
+    def __init__(self, categories: dict):
+        self.categories = {name: tuple(terms) for name, terms in categories.items()}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for category, terms in self.categories.items():
+            for term in terms:
+                self._add(category, term)
+        self._link()
+
+    def _add(self, category: str, term: str):
+        folded = "".join(_fold(ch) for ch in term)
+        if not folded:
+            return
+        state = 0
+        for ch in folded:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((category, term, len(folded)))
+
+    def _link(self):
+        """Breadth-first failure links; outputs inherit their suffix states' outputs."""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> list:
+        """Every word-bounded hit in text, in order of where it ends."""
+        hits = []
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        length = len(text)
+        for i, raw in enumerate(text):
+            ch = _fold(raw)
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for category, term, size in out[state]:
+                start = i - size + 1
+                # Only alphanumeric edges need a boundary: "like," ends on its comma
+                if term[0].isalnum() and start > 0 and text[start - 1].isalnum():
+                    continue
+                if term[-1].isalnum() and i + 1 < length and text[i + 1].isalnum():
+                    continue
+                hits.append(Hit(category, term, start, i + 1))
+        return hits
+
+    def found(self, text: str) -> dict:
+        """Distinct terms found per category (every category present, possibly empty)."""
+        result = {name: [] for name in self.categories}
+        for hit in self.find_all(text):
+            if hit.term not in result[hit.category]:
+                result[hit.category].append(hit.term)
+        return result
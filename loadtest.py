@@ -0,0 +1,374 @@
+"""
+Classroom Load Test for Socratic Writing Tutor
+
+How many students can one server hold before latency degrades? This runs
+synthetic students against mock_api_server.py in stages of growing class
+size and reports where the server saturates:
+
+    python loadtest.py --students 25,50,100,200,400 --latency 0.8 --rpm 4000 --tpm 2000000
+    python loadtest.py --students 100 --base-url http://127.0.0.1:8765 --out load.json
+
+Each student is a thread driving its own SocraticEngine, the way Streamlit
+runs one script thread per session, through the same calls app.py makes:
+draft check, first submission, revisions (process_revision_concurrent),
+reflection and finishing (summary row and JSON export). Revisions are
+scripted edits or random mutations of the draft (--edits). Students pause
+between actions (--think) and give up after --max-revisions.
+
+The mock server runs in-process unless --base-url is given. Its latency,
+rate limits (429 with retry-after) and capacity (529) are set with the same
+options as mock_api_server.py. The app's own limiter still applies
+(ANTHROPIC_RPM / ANTHROPIC_TPM).
+
+Per stage it reports:
+- throughput: actions per second and finished sessions per minute
+- action latency p50/p95/p99 and time to first streamed text
+- queueing: connection-pool lease waits, rate-limiter waits, 429/529s seen
+- failures: errors and fallback replies
+- memory: RSS growth per student and the size of each session's state
+
+A stage is saturated when its p95 action latency exceeds --slo-factor times
+the first stage's, or more than 1% of actions fail or fall back. The run
+stops at the first saturated stage (unless --all-stages). The saturation
+point is the largest class size that stayed within bounds.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import client_pool
+import rate_limiter
+import resilience
+import session_logger
+from bench import ESSAY, REFLECTION, percentile
+from core_engine import SocraticEngine
+from event_store import JsonlEventStore
+from mock_api_server import start_in_thread
+from session_snapshot import capture, pack_snapshot
+
+ACTIONS = ("validate", "submit", "revise", "reflect", "finish")
+
+# Scripted revisions, applied in order; each adds or sharpens one thing
+SCRIPTED_EDITS = (
+    ("append", "For example, the passage reports that students who started at 8:30 had 10% better attendance."),
+    ("append", "This matters because attendance is the first step to learning anything at all."),
+    ("replace", ("I believe", "The evidence shows")),
+    ("append", "While later buses may cost more, the gains in health and grades are worth that cost."),
+    ("replace", ("a tired brain cannot focus", "a tired brain cannot focus on new material")),
+    ("append", "Therefore, districts should move the first bell to 8:30 or later."),
+)
+
+EVIDENCE_POOL = (
+    "The passage says that sleepy students are more likely to be in car accidents.",
+    "One study in the passage found grades rose after a later start.",
+    "Doctors quoted in the passage recommend at least eight hours of sleep for teens.",
+    "According to the author, tardiness dropped by a third at schools that changed.",
+)
+WORD_SWAPS = {"good": "beneficial", "bad": "harmful", "help": "support", "better": "stronger", "more": "additional"}
+
+
+def mutate(essay: str, rng: random.Random) -> str:
+    """A random small edit of the kind students make between revisions."""
+    sentences = re.split(r"(?<=[.!?])\s+", essay.strip())
+    kind = rng.choice(("insert", "swap_word", "drop", "reorder", "extend"))
+    if kind == "insert":
+        sentences.insert(rng.randrange(len(sentences) + 1), rng.choice(EVIDENCE_POOL))
+    elif kind == "swap_word":
+        i = rng.randrange(len(sentences))
+        for word, better in WORD_SWAPS.items():
+            if word in sentences[i]:
+                sentences[i] = sentences[i].replace(word, better, 1)
+                break
+        else:
+            sentences[i] = sentences[i].rstrip(".") + ", which is important."
+    elif kind == "drop" and len(sentences) > 4:
+        del sentences[rng.randrange(1, len(sentences) - 1)]
+    elif kind == "reorder" and len(sentences) > 3:
+        i = rng.randrange(1, len(sentences) - 2)
+        sentences[i], sentences[i + 1] = sentences[i + 1], sentences[i]
+    else:
+        sentences.append(f"This shows why the change matters for students like me ({rng.randrange(1000)}).")
+    return " ".join(sentences)
+
+
+def scripted_edit(essay: str, step: int) -> str:
+    kind, edit = SCRIPTED_EDITS[step % len(SCRIPTED_EDITS)]
+    if kind == "append" or edit[0] not in essay:
+        text = edit if kind == "append" else edit[1] + "."
+        return f"{essay} {text}"
+    return essay.replace(*edit, 1)
+
+
+class StudentAgent:
+    """One synthetic student: submit, revise, reflect and finish, like a real session."""
+
+    def __init__(self, n: int, seed: int, edits: str = "mutate", max_revisions: int = 5,
+                 think: float = 0.5):
+        self.n = n
+        self.rng = random.Random(seed * 100003 + n)
+        self.edits = edits
+        self.max_revisions = max_revisions
+        self.think = think
+        self.engine = None
+        self.samples = []  # (action, seconds, time to first text or None, ok)
+        self.finished = False
+        self.error = None
+
+    def _pause(self):
+        if self.think:
+            time.sleep(self.rng.uniform(0, self.think))
+
+    def _act(self, action: str, call):
+        first = []
+        started = time.perf_counter()
+        try:
+            result = call(lambda text: first or first.append(time.perf_counter() - started))
+        except Exception:
+            self.samples.append((action, time.perf_counter() - started, None, False))
+            raise
+        self.samples.append((action, time.perf_counter() - started, first[0] if first else None, True))
+        return result
+
+    def run(self):
+        rate_limiter.set_session(f"student-{self.n}")
+        try:
+            self.engine = engine = SocraticEngine()
+            essay = f"{ESSAY} My name is Student {self.n}."
+            self._pause()
+            self._act("validate", lambda sink: engine.validator.validate(essay))
+            self._pause()
+            result = self._act("submit", lambda sink: engine.process_initial_essay(essay, on_delta=sink))
+            session_logger.log_phase_transition(result["phase"], engine, {"action": "initial_submit"})
+            revision = 0
+            while result["phase"] == engine.PHASE_COACH and revision < self.max_revisions:
+                self._pause()
+                essay = mutate(essay, self.rng) if self.edits == "mutate" else scripted_edit(essay, revision)
+                result = self._act("revise", lambda sink: engine.process_revision_concurrent(essay, on_delta=sink))
+                session_logger.log_phase_transition(result["phase"], engine, {"action": "revision"})
+                revision += 1
+            while result["phase"] == engine.PHASE_REFLECT:
+                self._pause()
+                result = self._act("reflect", lambda sink: engine.process_reflection(REFLECTION, on_delta=sink))
+                session_logger.log_phase_transition(result["phase"], engine, {"action": "reflection"})
+            self._act("finish", lambda sink: (session_logger.log_complete_session(engine),
+                                              session_logger.build_export_json(engine)))
+            self.finished = True
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (peak size where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _numbers(stats: dict, prefix: str = "") -> dict:
+    """Flatten nested numeric stats into {"a.b": n} for before/after differences."""
+    flat = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            flat.update(_numbers(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def _counters(mock_state) -> dict:
+    counters = {}
+    counters.update(_numbers(client_pool.get_pool_metrics(), "pool."))
+    counters.update(_numbers(rate_limiter.get_limiter_stats(), "limiter."))
+    counters.update(_numbers(resilience.get_resilience_stats(), "resilience."))
+    if mock_state is not None:
+        counters.update(_numbers(mock_state.snapshot(), "mock."))
+    return counters
+
+
+def _latency_stats(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "p99_s": round(percentile(values, 99), 4),
+        "max_s": round(max(values), 4),
+    }
+
+
+def run_stage(students: int, seed: int, ramp: float, mock_state=None, **agent_options) -> dict:
+    """Run one class of students at once; returns the stage's measurements."""
+    agents = [StudentAgent(n, seed, **agent_options) for n in range(students)]
+    threads = [threading.Thread(target=agent.run, name=f"student-{agent.n}", daemon=True) for agent in agents]
+    before = _counters(mock_state)
+    rss_before = rss_bytes()
+    rss_peak = rss_before
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+        if ramp:
+            time.sleep(ramp / students)
+    while any(thread.is_alive() for thread in threads):
+        rss_peak = max(rss_peak, rss_bytes())
+        time.sleep(0.2)
+    duration = time.perf_counter() - started
+    after = _counters(mock_state)
+    delta = {key: round(after[key] - before.get(key, 0), 4) for key in after
+             if not key.endswith(("_max_s", "peak_in_flight", "in_flight", "pool_size", "keepalive"))}
+
+    samples = [s for agent in agents for s in agent.samples]
+    ok = [s for s in samples if s[3]]
+    state_sizes = [len(pack_snapshot(capture(agent.engine))) for agent in agents if agent.engine is not None]
+    fallbacks = sum(v for k, v in delta.items() if k.startswith("resilience.fallbacks."))
+    finished = sum(agent.finished for agent in agents)
+    return {
+        "students": students,
+        "duration_s": round(duration, 3),
+        "actions": len(samples),
+        "actions_per_s": round(len(ok) / duration, 3),
+        "sessions_finished": finished,
+        "sessions_per_min": round(finished / duration * 60, 2),
+        "errors": len(samples) - len(ok) + sum(1 for a in agents if a.error and not a.samples),
+        "error_examples": sorted({a.error for a in agents if a.error})[:3],
+        "fallbacks": fallbacks,
+        "latency": _latency_stats([s[1] for s in ok]),
+        "latency_by_action": {action: _latency_stats([s[1] for s in ok if s[0] == action])
+                              for action in ACTIONS},
+        "time_to_first_text": _latency_stats([s[2] for s in ok if s[2] is not None]),
+        "queueing": {
+            "pool_lease_waits": delta.get("pool.leases_waited", 0),
+            "pool_lease_wait_s": delta.get("pool.lease_wait_total_s", 0),
+            "pool_peak_in_flight": after.get("pool.peak_in_flight", 0),
+            "limiter_wait_s": round(sum(v for k, v in delta.items()
+                                        if k.startswith("limiter.classes.") and k.endswith(".wait_total_s")), 4),
+            "limiter_rejected": sum(v for k, v in delta.items()
+                                    if k.startswith("limiter.classes.") and k.endswith(".rejected")),
+            "rate_limited_429": delta.get("mock.rate_limited", 0),
+            "overloaded_529": delta.get("mock.overloaded", 0),
+            "mock_peak_in_flight": after.get("mock.peak_in_flight", 0),
+        },
+        "memory": {
+            "rss_growth_per_student_kb": round((rss_peak - rss_before) / students / 1024, 1),
+            "state_bytes_p50": percentile(state_sizes, 50) if state_sizes else 0,
+            "state_bytes_max": max(state_sizes, default=0),
+        },
+    }
+
+
+def saturated(stage: dict, baseline: dict, slo_factor: float) -> bool:
+    actions = max(1, stage["actions"])
+    if (stage["errors"] + stage["fallbacks"]) / actions > 0.01:
+        return True
+    p95, base = stage["latency"].get("p95_s"), baseline["latency"].get("p95_s")
+    return bool(p95 and base and p95 > slo_factor * base)
+
+
+def run_load_test(classes, base_url: str = None, seed: int = 0, ramp: float = 5.0, slo_factor: float = 2.0,
+                  all_stages: bool = False, mock_options: dict = None, **agent_options) -> dict:
+    """Run stages of growing class size; returns the report (see module docstring)."""
+    server = mock_state = None
+    if base_url is None:
+        server, base_url = start_in_thread(**(mock_options or {}))
+        mock_state = server.state
+    # client_pool's clients pick these up when they're built
+    os.environ["ANTHROPIC_BASE_URL"] = base_url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "loadtest")
+    # Logger rows go to a scratch event log, not the app's
+    scratch = tempfile.TemporaryDirectory()
+    store = JsonlEventStore(os.path.join(scratch.name, "session_events.jsonl"))
+    session_logger._backends = [store]
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "base_url": base_url,
+            "mock": mock_options if server else None,
+            "seed": seed,
+            "ramp_s": ramp,
+            "slo_factor": slo_factor,
+            "pool_size": client_pool.pool_settings()["pool_size"],
+            "limiter": {"rpm": rate_limiter.get_limiter().rpm, "tpm": rate_limiter.get_limiter().tpm},
+            **agent_options,
+        },
+        "stages": [],
+        "saturation_point": None,
+        "saturated_at": None,
+    }
+    try:
+        for students in classes:
+            stage = run_stage(students, seed, ramp, mock_state, **agent_options)
+            report["stages"].append(stage)
+            print(f"{students:>5} students: {stage['actions_per_s']:>7.2f} actions/s  "
+                  f"p95 {stage['latency'].get('p95_s', 0):>6.2f}s  "
+                  f"errors {stage['errors']}  fallbacks {stage['fallbacks']}  "
+                  f"429s {stage['queueing']['rate_limited_429']}", file=sys.stderr)
+            if saturated(stage, report["stages"][0], slo_factor):
+                report["saturated_at"] = report["saturated_at"] or students
+                if not all_stages:
+                    break
+            elif report["saturated_at"] is None:
+                report["saturation_point"] = students
+    finally:
+        store.close()
+        session_logger._backends = None
+        scratch.cleanup()
+        if server is not None:
+            server.shutdown()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the tutor with synthetic students.")
+    parser.add_argument("--students", default="10,25,50,100,200",
+                        help="comma-separated class sizes, one stage each")
+    parser.add_argument("--base-url", help="an already running API (default: an in-process mock server)")
+    parser.add_argument("--edits", choices=("mutate", "scripted"), default="mutate")
+    parser.add_argument("--max-revisions", type=int, default=5)
+    parser.add_argument("--think", type=float, default=0.5, help="max seconds a student pauses between actions")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which a stage's students arrive")
+    parser.add_argument("--slo-factor", type=float, default=2.0,
+                        help="saturated once p95 latency exceeds this multiple of the first stage's")
+    parser.add_argument("--all-stages", action="store_true", help="keep going after saturation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock: median seconds before a reply starts")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.0, help="mock: seconds per streamed word")
+    parser.add_argument("--rpm", type=int, default=0, help="mock: requests per minute before 429s")
+    parser.add_argument("--tpm", type=int, default=0, help="mock: tokens per minute before 429s")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="mock: in-flight requests before 529s")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    mock_options = {"latency": args.latency, "latency_sigma": args.latency_sigma,
+                    "token_interval": args.token_interval, "rpm": args.rpm, "tpm": args.tpm,
+                    "max_concurrent": args.max_concurrent}
+    report = run_load_test(
+        [int(n) for n in args.students.split(",")], args.base_url, args.seed, args.ramp,
+        args.slo_factor, args.all_stages, mock_options,
+        edits=args.edits, max_revisions=args.max_revisions, think=args.think,
+    )
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    point = report["saturation_point"]
+    print(f"saturation point: {f'{point} students' if point else 'below the first stage'}"
+          + (f" (saturated at {report['saturated_at']})" if report["saturated_at"] else ""), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
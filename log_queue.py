@@ -0,0 +1,200 @@
+"""
+Background Log Writer for Socratic Writing Tutor
+
+Logging used to run inside the Streamlit request thread, one network write per
+row, so every phase transition made the student's page wait on Google Sheets.
+
+BackgroundLogWriter takes rows from all sessions through a bounded queue and
+writes them from one daemon thread:
+- rows for the same worksheet are coalesced into one batch write
+- a batch is flushed once it reaches batch_size rows or flush_interval seconds
+- failed writes are retried with jittered exponential backoff
+- rows that can't be queued (writer behind) or written (retries exhausted)
+  are spilled to a local JSON Lines file and replayed once writes succeed again;
+  a replay cut short by a crash (the .replaying file it leaves) is resumed
+
+The writer knows nothing about Sheets itself: it calls sink(worksheet, headers,
+rows) and asks is_retryable(exc) whether a failure is worth another attempt.
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+_STOP = object()
+
+# Spill files being replayed by a writer in this process
+_replaying = set()
+_replaying_lock = threading.Lock()
+
+
+class BackgroundLogWriter:
+    """Bounded-queue, batching, retrying writer running on a daemon thread."""
+
+    def __init__(self, sink, is_retryable=None, batch_size: int = 50,
+                 flush_interval: float = 2.0, queue_size: int = 5000,
+                 spill_path: str = "log_spill.jsonl", max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.sink = sink
+        self.is_retryable = is_retryable or (lambda exc: True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = {
+            "enqueued": 0, "written": 0, "batches": 0, "retries": 0,
+            "spilled": 0, "replayed": 0,
+        }
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._last_replay = 0.0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def submit(self, worksheet: str, headers: list, row: list) -> bool:
+        """Queue one row. Never blocks; spills to disk if the queue is full."""
+        item = (worksheet, list(headers), row)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._spill([item])
+            return False
+        self._count("enqueued")
+        return True
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        stats["spill_pending"] = (os.path.exists(self.spill_path)
+                                  or os.path.exists(self.spill_path + ".replaying"))
+        return stats
+
+    def close(self, timeout: float = 10.0):
+        """Flush what's queued and stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    # --- writer thread ---
+
+    def _run(self):
+        pending = {}   # worksheet -> (headers, rows)
+        count = 0
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            # Coalesce whatever else is already waiting
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                worksheet, headers, row = item
+                pending.setdefault(worksheet, (headers, []))[1].append(row)
+                count += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if count >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            due = deadline is not None and time.monotonic() >= deadline
+            if pending and (count >= self.batch_size or due or stopping):
+                ok = self._flush(pending)
+                pending, count, deadline = {}, 0, None
+                if ok and self._queue.empty():
+                    self._maybe_replay_spill()
+            elif not pending and self._queue.empty():
+                self._maybe_replay_spill()
+
+    def _flush(self, pending: dict) -> bool:
+        ok = True
+        for worksheet, (headers, rows) in pending.items():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.sink(worksheet, headers, rows)
+                    self._count("written", len(rows))
+                    self._count("batches")
+                    break
+                except Exception as exc:
+                    if attempt == self.max_retries or not self.is_retryable(exc):
+                        self._spill([(worksheet, headers, row) for row in rows])
+                        ok = False
+                        break
+                    self._count("retries")
+                    delay = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+                    time.sleep(random.uniform(0, delay))
+        return ok
+
+    def _spill(self, items: list):
+        with self._spill_lock:
+            try:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for worksheet, headers, row in items:
+                        f.write(json.dumps({"worksheet": worksheet, "headers": headers, "row": row}) + "\n")
+                self._count("spilled", len(items))
+            except OSError:
+                pass  # Nowhere left to put it — never break the app over logging
+
+    def _maybe_replay_spill(self):
+        """Re-queue spilled rows once writes are succeeding again."""
+        now = time.monotonic()
+        if now - self._last_replay < self.flush_interval * 5:
+            return
+        self._last_replay = now
+        replaying = os.path.abspath(self.spill_path) + ".replaying"
+        with self._spill_lock, _replaying_lock:
+            if replaying in _replaying:
+                return
+            # A .replaying file nobody here is working on was left by a process
+            # that died mid-replay: finish it before taking the next spill
+            if not os.path.exists(replaying):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replaying)
+            _replaying.add(replaying)
+        try:
+            self._replay(replaying)
+        finally:
+            with _replaying_lock:
+                _replaying.discard(replaying)
+
+    def _replay(self, replaying: str):
+        pending = {}
+        with open(replaying, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                pending.setdefault(record["worksheet"], (record["headers"], []))[1].append(record["row"])
+        replayed = sum(len(rows) for _, rows in pending.values())
+        # Anything that fails again is spilled to the live spill file
+        self._flush(pending)
+        self._count("replayed", replayed)
+        os.remove(replaying)
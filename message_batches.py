@@ -0,0 +1,242 @@
+"""
+Message Batches Mode for Socratic Writing Tutor
+
+Bulk rescoring and research re-analysis don't need answers within seconds,
+so instead of one interactive messages.create per essay the prompts are
+packed into provider batch jobs (Message Batches API): cheaper per essay and
+outside the per-minute rate limits that live sessions compete for.
+
+The prompts are exactly the ones the tutor uses — SocraticEngine builds them
+(_scoring_call, _first_try_call) and parses the scores (_parse_scores), so
+batch results land in the same score cache as interactive ones.
+
+Two stages:
+1. every essay's scoring prompt in one (or more) batch jobs
+2. optionally, a first-try analysis for the essays that reached the target
+   on every dimension — the same condition the tutor uses
+
+Results are yielded as each batch job ends, not once every stage is done.
+Batch IDs and the IDs of the essays submitted (custom_id -> essay ID) are
+saved to a state file after submitting, so an interrupted run resumes
+polling the same batches instead of resubmitting (and paying again).
+
+Point base_url (or ANTHROPIC_BASE_URL) at mock_api_server.py to try it locally.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+import anthropic
+
+import client_pool
+import model_routing
+from core_engine import SocraticEngine
+from passage_config import DIMENSION_ORDER, TARGET_SCORE
+from score_cache import make_key
+from structured_output import SchemaError, reply_payload, tool_choice
+
+MAX_BATCH_REQUESTS = 10000
+
+
+def get_batch_client(base_url: str = None):
+    """The shared client, or a dedicated one for a different endpoint (close it when done)."""
+    if base_url:
+        return anthropic.Anthropic(base_url=base_url)
+    return client_pool.get_client()
+
+
+def reject_duplicate_ids(essays):
+    """Raise ValueError if two (essay_id, text) pairs share an ID."""
+    duplicates = sorted(eid for eid, n in Counter(eid for eid, _ in essays).items() if n > 1)
+    if duplicates:
+        raise ValueError(f"duplicate essay IDs: {', '.join(duplicates[:5])}"
+                         + (f" and {len(duplicates) - 5} more" if len(duplicates) > 5 else ""))
+
+
+def _request(custom_id: str, call) -> dict:
+    route = model_routing.route(call.task)
+    params = {
+        "model": route.model,
+        "max_tokens": call.max_tokens,
+        "temperature": route.temperature,
+        "system": call.system,
+        "messages": [{"role": "user", "content": call.user_msg}],
+    }
+    if call.tool:
+        params["tools"] = [call.tool]
+        params["tool_choice"] = tool_choice(call.tool)
+    return {"custom_id": custom_id, "params": params}
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_state(path: str, state: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+class BatchJob:
+    """One stage: submit its requests, wait for the batches, read the results."""
+
+    def __init__(self, client, state: dict, state_path: str, stage: str,
+                 poll_interval: float = 30.0, log=print):
+        self.client = client
+        self.state = state
+        self.state_path = state_path
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.log = log
+
+    def submit(self, requests: list):
+        """Create the batch jobs for this stage unless they already exist."""
+        if self.stage in self.state:
+            self.log(f"{self.stage}: resuming {len(self.state[self.stage])} batch(es)")
+            return
+        batch_ids = []
+        for start in range(0, len(requests), MAX_BATCH_REQUESTS):
+            batch = self.client.messages.batches.create(requests=requests[start:start + MAX_BATCH_REQUESTS])
+            batch_ids.append(batch.id)
+        self.state[self.stage] = batch_ids
+        _save_state(self.state_path, self.state)
+        self.log(f"{self.stage}: submitted {len(requests)} requests in {len(batch_ids)} batch(es)")
+
+    def ended(self):
+        """Poll until every batch of this stage has ended, yielding each ID as it ends."""
+        pending = list(self.state.get(self.stage, []))
+        while pending:
+            for batch_id in list(pending):
+                batch = self.client.messages.batches.retrieve(batch_id)
+                counts = batch.request_counts
+                self.log(f"{self.stage}: {batch_id} {batch.processing_status} "
+                         f"(processing {counts.processing}, succeeded {counts.succeeded}, "
+                         f"errored {counts.errored})")
+                if batch.processing_status == "ended":
+                    pending.remove(batch_id)
+                    yield batch_id
+            if pending:
+                time.sleep(self.poll_interval)
+
+    def wait(self):
+        """Poll until every batch of this stage has ended."""
+        for _ in self.ended():
+            pass
+
+    def results(self, batch_id: str = None):
+        """Yield (custom_id, reply or None, error or None, usage or None).
+
+        reply is the tool input for structured calls, otherwise the text.
+        Covers one batch if batch_id is given, else every batch of the stage.
+        """
+        for batch_id in [batch_id] if batch_id else self.state.get(self.stage, []):
+            for entry in self.client.messages.batches.results(batch_id):
+                result = entry.result
+                if result.type == "succeeded":
+                    yield entry.custom_id, reply_payload(result.message), None, result.message.usage
+                else:
+                    error = getattr(getattr(result, "error", None), "error", None)
+                    yield entry.custom_id, None, getattr(error, "message", result.type), None
+
+
+def run_message_batches(essays, state_path: str, first_try: bool = False,
+                        base_url: str = None, poll_interval: float = 30.0, log=print,
+                        passage_id: str = None, skip=()):
+    """Score (and optionally analyse) essays through batch jobs.
+
+    essays is an iterable of (essay_id, text); IDs must be unique (ValueError
+    otherwise). Yields one result dict per submitted essay, as soon as its
+    batch has ended, in the same shape batch_score writes: {"id", "scores",
+    "parse_failed": False} plus "first_try_analysis" when requested, or
+    {"id", "error"} (with "parse_failed": True if the reply had no usable
+    scores). Essays in skip (already scored) are not submitted. If
+    state_path holds batches submitted for some of these essays, those are
+    resumed instead, and only results for essays not in skip are yielded.
+    Essays are scored against passage_id's assignment (the default one if
+    None).
+    """
+    essays = list(essays)
+    reject_duplicate_ids(essays)
+    client = get_batch_client(base_url)
+    try:
+        yield from _run(client, essays, state_path, first_try, poll_interval, log, passage_id, set(skip))
+    finally:
+        if base_url:
+            client.close()  # a dedicated client; the shared one stays open
+
+
+def _run(client, essays: list, state_path: str, first_try: bool, poll_interval: float, log,
+         passage_id: str, skip: set):
+    engine = SocraticEngine(passage_id)
+    texts = dict(essays)
+    state = _load_state(state_path)
+    # custom_id must be short and [a-zA-Z0-9_-]; essay IDs may be neither, so
+    # the state keeps the submitted IDs in custom_id order
+    if not state.get("essay_ids") or not all(eid in texts for eid in state["essay_ids"]):
+        state = {"essay_ids": [eid for eid, _ in essays if eid not in skip]}
+    ids = state["essay_ids"]
+    if not ids:
+        return
+    usage = {"input_tokens": 0, "output_tokens": 0}
+
+    def count(u):
+        if u is not None:
+            usage["input_tokens"] += u.input_tokens
+            usage["output_tokens"] += u.output_tokens
+
+    def at_target(result):
+        return ("scores" in result
+                and all(result["scores"][dim]["score"] >= TARGET_SCORE for dim in DIMENSION_ORDER))
+
+    scoring = BatchJob(client, state, state_path, "scoring", poll_interval, log)
+    scoring.submit([_request(f"score-{n}", engine._scoring_call(texts[eid])) for n, eid in enumerate(ids)])
+
+    answered = set()
+    held = {}  # n -> scored result waiting for its first-try analysis
+    for batch_id in scoring.ended():
+        for custom_id, text, error, u in scoring.results(batch_id):
+            count(u)
+            n = int(custom_id.split("-")[1])
+            eid = ids[n]
+            answered.add(n)
+            if error is not None:
+                result = {"id": eid, "error": error}
+            else:
+                try:
+                    scores = engine._parse_scores(text, make_key(texts[eid], engine.score_fingerprint))
+                    result = {"id": eid, "scores": scores, "parse_failed": False}
+                except SchemaError as exc:
+                    result = {"id": eid, "error": f"SchemaError: {exc}", "parse_failed": True}
+            if first_try and at_target(result):
+                held[n] = result
+            elif eid not in skip:
+                yield result
+    for n, eid in enumerate(ids):
+        if n not in answered and eid not in skip:
+            yield {"id": eid, "error": "missing from batch results"}
+
+    if held:
+        analysis = BatchJob(client, state, state_path, "first_try", poll_interval, log)
+        analysis.submit([_request(f"first-{n}", engine._first_try_call(texts[ids[n]])) for n in sorted(held)])
+        for batch_id in analysis.ended():
+            for custom_id, text, error, u in analysis.results(batch_id):
+                count(u)
+                result = held.pop(int(custom_id.split("-")[1]), None)
+                if result is None:
+                    continue
+                result["first_try_analysis"] = text if error is None else None
+                if result["id"] not in skip:
+                    yield result
+        for result in held.values():
+            if result["id"] not in skip:
+                yield dict(result, first_try_analysis=None)
+
+    log(f"batch usage: {usage['input_tokens']} input / {usage['output_tokens']} output tokens")
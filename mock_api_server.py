@@ -0,0 +1,391 @@
+"""
+Local Stand-in API Server for Socratic Writing Tutor
+
+A small, dependency-free imitation of the Messages and Message Batches
+endpoints, for exercising the bulk and load paths without an API key or cost:
+
+    python mock_api_server.py --port 8765
+    python batch_score.py essays.jsonl scores.jsonl --batch-api --base-url http://127.0.0.1:8765
+    python mock_api_server.py --latency 0.8 --rpm 500 --tpm 400000 --max-concurrent 100
+
+Replies are deterministic: scoring prompts get rubric JSON whose scores
+depend on the essay text, validation prompts get a readiness verdict, and
+everything else gets a short coaching-style question. Batches finish
+batch_seconds after they are created. "stream": true requests get the
+Messages server-sent events, one text delta per word.
+
+For load tests it can also behave like a busy API:
+- latency: each reply waits a lognormal delay (median --latency, spread
+  --latency-sigma) before its first byte, plus --token-interval per word
+- rate limits: past --rpm requests or --tpm tokens per minute (continuously
+  refilled buckets, like the real API) a request gets 429 rate_limit_error
+  with retry-after
+- capacity: past --max-concurrent requests in flight, 529 overloaded_error
+Counters are served at GET /v1/mock/stats.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from passage_config import DIMENSION_ORDER
+
+
+def _system_text(system) -> str:
+    if isinstance(system, list):
+        return "".join(block.get("text", "") for block in system)
+    return system or ""
+
+
+def _user_text(params: dict) -> str:
+    content = params["messages"][-1]["content"]
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content)
+    return content
+
+
+def fake_reply(params: dict) -> str:
+    """Deterministic reply text for a Messages request."""
+    system = _system_text(params.get("system"))
+    user = _user_text(params)
+    digest = hashlib.sha256(user.encode("utf-8")).digest()
+    if "assessment engine" in system:
+        return json.dumps({
+            dim: {"score": 1 + digest[i] % 4, "rationale": f"Mock rationale for {dim}."}
+            for i, dim in enumerate(DIMENSION_ORDER)
+        })
+    if "readiness checker" in system:
+        statuses = ("present", "weak", "missing")
+        checks = [
+            {"objective": objective, "status": statuses[digest[i] % 3], "tip": f"Mock tip for {objective.lower()}."}
+            for i, objective in enumerate(("POSITION", "EVIDENCE", "REASONING", "STRUCTURE", "TONE"))
+        ]
+        ready = sum(c["status"] != "missing" for c in checks) >= 3
+        return json.dumps({"overall_ready": ready, "checks": checks, "summary": "Mock check."})
+    return "What made you choose that piece of evidence, and how does it support your claim?"
+
+
+def _message(params: dict) -> dict:
+    text = fake_reply(params)
+    prompt = _system_text(params.get("system")) + _user_text(params)
+    content = [{"type": "text", "text": text}]
+    forced = (params.get("tool_choice") or {}).get("name")
+    if forced:
+        # Structured output: answer through the forced tool
+        content = [{"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                    "name": forced, "input": json.loads(text)}]
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "mock"),
+        "content": content,
+        "stop_reason": "tool_use" if forced else "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": max(1, len(prompt) // 4),
+            "output_tokens": max(1, len(text) // 4),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        },
+    }
+
+
+def _chunks(block: dict) -> list:
+    """A content block's text (or tool input JSON) split the way it is streamed: by word."""
+    text = block["text"] if block["type"] == "text" else json.dumps(block["input"])
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + [words[-1]]
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class MockState:
+    """Batches, rate-limit buckets and counters, shared by all handler threads."""
+
+    def __init__(self, batch_seconds: float = 2.0, latency: float = 0.0, latency_sigma: float = 0.0,
+                 token_interval: float = 0.0, rpm: int = 0, tpm: int = 0, max_concurrent: int = 0):
+        self.batch_seconds = batch_seconds
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.token_interval = token_interval
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max_concurrent
+        self.lock = threading.Lock()
+        self.batches = {}
+        # Like the real API: buckets that hold a minute's allowance and refill continuously
+        self.buckets = {"requests": [float(rpm), rpm / 60], "tokens": [float(tpm), tpm / 60]}
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "streamed": 0, "rate_limited": 0, "overloaded": 0, "peak_in_flight": 0}
+        self._rng = random.Random(0)
+
+    def delay(self) -> float:
+        """Time to first byte for one reply."""
+        if self.latency <= 0:
+            return 0.0
+        with self.lock:
+            return self._rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+    def admit(self, tokens: int):
+        """None if a Messages request may run now, else (status, kind, retry_after, headers)."""
+        now = time.monotonic()
+        with self.lock:
+            self.stats["requests"] += 1
+            limits = {"requests": self.rpm, "tokens": self.tpm}
+            costs = {"requests": 1, "tokens": min(tokens, self.tpm)}
+            for name, bucket in self.buckets.items():
+                bucket[0] = min(limits[name], bucket[0] + (now - self.refilled) * bucket[1])
+            self.refilled = now
+            short = {name: costs[name] - bucket[0] for name, bucket in self.buckets.items()
+                     if limits[name] and bucket[0] < costs[name]}
+            if short:
+                self.stats["rate_limited"] += 1
+                retry_after = max(math.ceil(need / self.buckets[name][1]) for name, need in short.items())
+                headers = {
+                    "anthropic-ratelimit-requests-limit": str(self.rpm or ""),
+                    "anthropic-ratelimit-requests-remaining": str(int(self.buckets["requests"][0])),
+                    "anthropic-ratelimit-tokens-limit": str(self.tpm or ""),
+                    "anthropic-ratelimit-tokens-remaining": str(int(self.buckets["tokens"][0])),
+                }
+                return 429, "rate_limit_error", max(1, retry_after), headers
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.stats["overloaded"] += 1
+                return 529, "overloaded_error", None, {}
+            for name, bucket in self.buckets.items():
+                if limits[name]:
+                    bucket[0] -= costs[name]
+            self.in_flight += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+            return None
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats, in_flight=self.in_flight)
+
+    def create_batch(self, requests: list) -> str:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.batches[batch_id] = {"created": time.time(), "requests": requests}
+        return batch_id
+
+    def batch_body(self, batch_id: str, base_url: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = time.time() >= batch["created"] + self.batch_seconds
+        total = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0, "canceled": 0, "expired": 0,
+            },
+            "created_at": _iso(batch["created"]),
+            "expires_at": _iso(batch["created"] + 86400),
+            "ended_at": _iso(batch["created"] + self.batch_seconds) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None  # set per server in make_server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _send(self, status: int, body, content_type: str = "application/json", headers: dict = None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("request-id", f"req_{uuid.uuid4().hex[:16]}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, kind: str, message: str, headers: dict = None):
+        self._send(status, {"type": "error", "error": {"type": kind, "message": message}}, headers=headers)
+
+    def _messages(self, params: dict):
+        """POST /v1/messages, with the configured latency and limits."""
+        message = _message(params)
+        tokens = message["usage"]["input_tokens"] + message["usage"]["output_tokens"]
+        refused = self.state.admit(tokens)
+        if refused:
+            status, kind, retry_after, headers = refused
+            if retry_after is not None:
+                headers = dict(headers, **{"retry-after": str(retry_after)})
+            self._error(status, kind, "Mock limit reached", headers)
+            return
+        try:
+            time.sleep(self.state.delay())
+            if params.get("stream"):
+                self._stream(message)
+            else:
+                words = sum(len(_chunks(block)) for block in message["content"])
+                time.sleep(self.state.token_interval * words)
+                self._send(200, message)
+        finally:
+            self.state.release()
+
+    def _stream(self, message: dict):
+        """The Messages API's server-sent events for message, one delta per word."""
+        with self.state.lock:
+            self.state.stats["streamed"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")  # keeps the connection reusable
+        self.send_header("request-id", f"req_{uuid.uuid4().hex[:16]}")
+        self.end_headers()
+
+        def event(name: str, data: dict):
+            chunk = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.flush()
+
+        usage = message["usage"]
+        event("message_start", {"type": "message_start", "message": dict(
+            message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))})
+        for index, block in enumerate(message["content"]):
+            start = {"type": "text", "text": ""} if block["type"] == "text" else dict(block, input={})
+            event("content_block_start", {"type": "content_block_start", "index": index, "content_block": start})
+            for chunk in _chunks(block):
+                if self.state.token_interval:
+                    time.sleep(self.state.token_interval)
+                delta = ({"type": "text_delta", "text": chunk} if block["type"] == "text"
+                         else {"type": "input_json_delta", "partial_json": chunk})
+                event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": delta})
+            event("content_block_stop", {"type": "content_block_stop", "index": index})
+        event("message_delta", {"type": "message_delta",
+                                "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}  # cut off mid-body
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/messages":
+            params = self._body()
+            if not params.get("messages"):
+                # Also what's left of a request whose client hung up (e.g. a cancelled call)
+                self._error(400, "invalid_request_error", "messages: field required")
+                return
+            try:
+                self._messages(params)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+        elif path == "/v1/messages/batches":
+            batch_id = self.state.create_batch(self._body().get("requests", []))
+            self._send(200, self.state.batch_body(batch_id, self.base_url))
+        else:
+            self._error(404, "not_found_error", f"No route for POST {path}")
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/mock/stats":
+            self._send(200, self.state.snapshot())
+            return
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", path)
+        if not match or match.group(1) not in self.state.batches:
+            self._error(404, "not_found_error", f"No route for GET {path}")
+            return
+        batch_id, results = match.groups()
+        body = self.state.batch_body(batch_id, self.base_url)
+        if not results:
+            self._send(200, body)
+        elif body["processing_status"] != "ended":
+            self._error(400, "invalid_request_error", "Batch is still processing")
+        else:
+            lines = [
+                json.dumps({"custom_id": request["custom_id"],
+                            "result": {"type": "succeeded", "message": _message(request["params"])}})
+                for request in self.state.batches[batch_id]["requests"]
+            ]
+            self._send(200, ("\n".join(lines) + "\n").encode("utf-8"), "application/x-jsonl")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # a whole class connecting at once
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, batch_seconds: float = 2.0, **limits):
+    """Build a server (port 0 = any free port); call serve_forever() to run it.
+
+    limits are MockState's latency/rate-limit settings; the state is the
+    server's .state.
+    """
+    state = MockState(batch_seconds, **limits)
+    handler = type("Handler", (MockHandler,), {"state": state})
+    server = _Server((host, port), handler)
+    server.state = state
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a server on a daemon thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-api", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Messages and Message Batches APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-seconds", type=float, default=2.0, help="time until a batch has ended")
+    parser.add_argument("--latency", type=float, default=0.0, help="median seconds before a reply starts")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="lognormal spread of --latency")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="seconds per word of a reply")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute before 429s (0 = no limit)")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="in-flight requests before 529s (0 = no limit)")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.batch_seconds, latency=args.latency,
+                         latency_sigma=args.latency_sigma, token_interval=args.token_interval,
+                         rpm=args.rpm, tpm=args.tpm, max_concurrent=args.max_concurrent)
+    print(f"Mock API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
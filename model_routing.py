@@ -0,0 +1,192 @@
+"""
+Model Routing for Socratic Writing Tutor
+
+Every call used to go to the same model with the same settings, whether it
+was a 150-token reflection follow-up, a draft check or rubric scoring. Each
+engine task now has a Route: model, max_tokens, temperature, a latency
+target and an optional fallback model.
+
+- Scoring stays on the strong model at temperature 0. There is no fallback
+  model: scores from another model wouldn't match the rubric calibration or
+  the cached scores, so an outage still ends in the local estimate. The
+  scoring model and temperature are part of the score cache fingerprint
+  (score_fingerprint), so changing them never serves stale scores.
+- Draft checks and reflection follow-ups are short and frequent, so they
+  run on the fast model and fall back to the strong one.
+- Coaching, MODEL examples and the praise/insight replies stay on the
+  strong model and fall back to the fast one.
+
+Fallback: when a call has a fallback model, each attempt on the primary
+model gets at most latency_target seconds (for a streamed reply, that is
+the wait for each chunk, so in practice the time to first token). If the
+primary times out, is overloaded (529), rate limited (429), failing (5xx)
+or unknown (404), the retry goes to the fallback model. That failure is not
+counted against resilience's circuit breaker, which guards every model: a
+slow fast-tier reply says nothing about the strong model's health. Without a
+fallback model the target only shows up in get_routing_stats().
+
+Settings (environment variables):
+- MODEL_STRONG   model ID of the strong tier (default claude-sonnet-4-20250514)
+- MODEL_FAST     model ID of the fast tier (default claude-3-5-haiku-20241022)
+- MODEL_ROUTES   JSON overrides per task, e.g.
+                 {"coaching": {"model": "fast", "max_tokens": 200, "fallback": null}};
+                 "strong"/"fast" name a tier, anything else is a model ID
+"""
+
+import json
+import os
+import threading
+
+import anthropic
+
+from score_cache import fingerprint
+
+STRONG = "strong"
+FAST = "fast"
+TIER_DEFAULTS = {STRONG: "claude-sonnet-4-20250514", FAST: "claude-3-5-haiku-20241022"}
+
+# task -> (model, max_tokens, temperature, latency target in seconds, fallback model)
+DEFAULT_ROUTES = {
+    "scoring": (STRONG, 600, 0.0, 20.0, None),
+    "validation": (FAST, 500, 0.0, 5.0, STRONG),
+    "validation_incremental": (FAST, 500, 0.0, 5.0, STRONG),
+    "reflection": (FAST, 150, 0.7, 5.0, STRONG),
+    "coaching": (STRONG, 250, 0.7, 10.0, FAST),
+    "model_example": (STRONG, 350, 0.7, 12.0, FAST),
+    "first_try_analysis": (STRONG, 350, 0.5, 12.0, FAST),
+    "improvement_insight": (STRONG, 300, 0.5, 12.0, FAST),
+    "general": (STRONG, 500, 1.0, 20.0, None),
+}
+
+
+class Route:
+    """How one engine task calls the model."""
+
+    __slots__ = ("task", "model", "max_tokens", "temperature", "latency_target", "fallback_model")
+
+    def __init__(self, task: str, model: str, max_tokens: int, temperature: float,
+                 latency_target: float, fallback_model: str = None):
+        self.task = task
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.latency_target = latency_target
+        self.fallback_model = fallback_model
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _model_id(name, tiers: dict):
+    return tiers.get(name, name) if name else None
+
+
+def load_routes() -> dict:
+    """task -> Route, from DEFAULT_ROUTES and the environment."""
+    tiers = {tier: os.environ.get(f"MODEL_{tier.upper()}", default) for tier, default in TIER_DEFAULTS.items()}
+    try:
+        overrides = json.loads(os.environ.get("MODEL_ROUTES", "") or "{}")
+    except ValueError:
+        overrides = {}
+    routes = {}
+    for task in set(DEFAULT_ROUTES) | set(overrides):
+        model, max_tokens, temperature, target, fallback = DEFAULT_ROUTES.get(task, DEFAULT_ROUTES["general"])
+        override = overrides.get(task) or {}
+        routes[task] = Route(
+            task,
+            _model_id(override.get("model", model), tiers),
+            int(override.get("max_tokens", max_tokens)),
+            float(override.get("temperature", temperature)),
+            float(override.get("latency_target", target)),
+            _model_id(override.get("fallback", fallback), tiers),
+        )
+    return routes
+
+
+_routes = load_routes()
+_lock = threading.Lock()
+_stats = {}  # task -> counters
+
+
+def configure():
+    """Re-read the routes from the environment."""
+    global _routes
+    _routes = load_routes()
+
+
+def route(task: str) -> Route:
+    """The task's route (unknown tasks use "general"'s settings)."""
+    return _routes.get(task) or _routes["general"]
+
+
+def score_fingerprint(passage_fingerprint: str) -> str:
+    """Score cache context: the assignment's fingerprint plus the scoring model and temperature."""
+    scoring = route("scoring")
+    return fingerprint(passage_fingerprint, scoring.model, repr(scoring.temperature))
+
+
+def _count(task: str, key: str):
+    with _lock:
+        counters = _stats.setdefault(task, {"calls": 0, "fallbacks": 0, "over_target": 0})
+        counters[key] += 1
+
+
+def _moves_to_fallback(exc: Exception) -> bool:
+    """Failures a different model may not have: slowness, overload, its own limits, unknown model."""
+    if isinstance(exc, anthropic.APITimeoutError):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status is not None and (status in (404, 429) or status >= 500)
+
+
+class ModelChoice:
+    """Which model the next attempt of one logical call uses.
+
+        choice = ModelChoice(task, request)
+        ... attempt: client.messages.create(**choice.request, timeout=choice.timeout(timeout))
+        ... on anthropic.APIError: choice.failed(exc), then retry as usual
+            (not counting it against the breaker if choice.moved_on(exc))
+        ... on success: choice.succeeded(latency)
+    """
+
+    def __init__(self, task: str, request: dict):
+        self.task = task
+        self.route = route(task)
+        self.request = request
+        self.fell_back = False
+        self._moved_by = None  # the failure that sent the call to the fallback model
+
+    def timeout(self, timeout: float) -> float:
+        """Attempt timeout: capped at the latency target while a fallback model is waiting."""
+        if self.fell_back or not self.route.fallback_model:
+            return timeout
+        return min(timeout, self.route.latency_target)
+
+    def failed(self, exc: Exception) -> bool:
+        """Move to the fallback model if exc calls for it; True if this failure moved it."""
+        if self.fell_back or not self.route.fallback_model or not _moves_to_fallback(exc):
+            return False
+        self.fell_back = True
+        self._moved_by = exc
+        self.request = dict(self.request, model=self.route.fallback_model)
+        _count(self.task, "fallbacks")
+        return True
+
+    def moved_on(self, exc: Exception) -> bool:
+        """True if exc is the primary model's failure that sent the call to the fallback."""
+        return exc is self._moved_by
+
+    def succeeded(self, latency: float):
+        _count(self.task, "calls")
+        if latency > self.route.latency_target:
+            _count(self.task, "over_target")
+
+
+def get_routing_stats() -> dict:
+    """Per task: the route, calls, fallbacks to the other model and calls over the latency target."""
+    with _lock:
+        counters = {task: dict(values) for task, values in _stats.items()}
+    return {
+        task: dict(r.as_dict(), **counters.get(task, {"calls": 0, "fallbacks": 0, "over_target": 0}))
+        for task, r in sorted(_routes.items())
+    }
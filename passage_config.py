@@ -162,7 +162,7 @@ OBJECTIVES:
 4. STRUCTURE: Are ideas organized into paragraphs with logical flow? (A single block of text with no paragraphs is "weak" even if it has multiple sentences. "present" requires actual paragraph breaks and ideas grouped logically.)
 5. TONE: Does it use academic vocabulary and sentence construction? (Conversational writing like "that is weird" or "people get so mad" is still informal — mark as "weak." "present" requires language a teacher would consider essay-appropriate. Check also for: slang, missing apostrophes, misspellings, run-on sentences.)
 
-Return ONLY valid JSON:
+Record your result by calling the record_draft_check tool, with these fields:
 {{
     "overall_ready": true/false,
     "checks": [
@@ -215,8 +215,35 @@ RULES:
 - If draft is very short (< 2 sentences), overall_ready = false.
 - NEVER write sentences for them, give templates, or provide fill-in-the-blank starters."""
 
+# Marker phrases for the heuristic draft check. Evidence markers are facts
+# from THIS passage; the others are generic and shared by every passage pack.
+EVIDENCE_MARKERS = [
+    "1962", "panopoulos", "sam", "2017", "iceland", "2019", "yougov",
+    "12 percent", "hawaiian", "ontario", "canada", "tagine", "moroccan"
+]
+DEFAULT_MARKERS = {
+    "position": [
+        "i believe", "i think", "i argue", "i contend", "in my opinion",
+        "my position", "should", "must", "belongs", "doesn't belong",
+        "no place", "acceptable", "unacceptable"
+    ],
+    "reasoning": [
+        "because", "therefore", "this means", "this shows", "which demonstrates",
+        "as a result", "consequently", "this suggests", "the reason", "which is why"
+    ],
+    "casual": [
+        "lol", "tbh", "ngl", "imo", "bruh", "like,", "gonna", "wanna",
+        "kinda", "omg", "smh", "fr fr", "super gross", "it's just"
+    ],
+}
+
+# Bump when the scoring prompt, rubric semantics or output format change in a
+# way the text alone doesn't capture — invalidates every cached score.
+SCORING_PROMPT_VERSION = "1.4"
+
 SCORING_SYSTEM_PROMPT = """You are a writing assessment engine. Score student
-responses against the VALUE rubric. Return ONLY valid JSON.
+responses against the VALUE rubric. Record the scores by calling the
+record_scores tool.
 
 RUBRIC:
 {rubric_text}
@@ -229,21 +256,16 @@ SCORING RULES:
 - Evidence that is mentioned but not explained should be scored 2 on Evidence Use.
 - Brief rationale for each score.
 
-RETURN FORMAT:
-{{"claim_clarity": {{"score": <int>, "rationale": "<string>"}}, "evidence_use": {{"score": <int>, "rationale": "<string>"}}, "reasoning_depth": {{"score": <int>, "rationale": "<string>"}}, "organization": {{"score": <int>, "rationale": "<string>"}}, "voice_engagement": {{"score": <int>, "rationale": "<string>"}}}}
+TOOL INPUT (record_scores):
+One entry per dimension, each with "score" (integer 1-4) and "rationale"
+(one or two sentences): claim_clarity, evidence_use, reasoning_depth,
+organization, voice_engagement.
 """
 
+# Static coaching instructions + passage. Kept separate from the per-student
+# context below so this prefix can be cached by the provider across calls.
 COACHING_SYSTEM_PROMPT = """You are a Socratic writing coach. Ask questions, don't tell answers.
 
-STUDENT'S WRITING LEVEL: {writing_level}
-DIMENSION TO FOCUS ON: {dimension_name}
-CURRENT SCORE: {current_score}/4
-TARGET: {target_score}/4
-RATIONALE: {rationale}
-
-STUDENT'S ESSAY:
-{essay}
-
 PASSAGE:
 {passage}
 
@@ -277,6 +299,16 @@ If writing is too casual (slang like 'super gross', 'it's just pizza'):
 - Validate passion while redirecting: "I can tell you feel strongly — now let's channel it into language that would impress your teacher"
 """
 
+COACHING_STUDENT_CONTEXT = """STUDENT'S WRITING LEVEL: {writing_level}
+DIMENSION TO FOCUS ON: {dimension_name}
+CURRENT SCORE: {current_score}/4
+TARGET: {target_score}/4
+RATIONALE: {rationale}
+
+STUDENT'S ESSAY:
+{essay}
+"""
+
 MODEL_EXAMPLE_PROMPT = """Student's {dimension_name} score didn't improve after revision.
 Show a SHORT before/after example on a DIFFERENT topic (social media, not pizza).
 Explain specifically what changed and why it's stronger.
@@ -422,9 +454,26 @@ MICRO_CELEBRATION_TEMPLATES = [
     "Good progress on {dimension} ({old} → {new}).",
 ]
 
-def get_rubric_text():
+# Used when the model can't be reached in time (see resilience.py), so the
+# session keeps moving with a generic but still Socratic reply.
+FALLBACK_COACHING_QUESTIONS = {
+    "claim_clarity": "If a friend read only your first sentence, would they know exactly what you believe? How could you say it more directly?",
+    "evidence_use": "Which detail from the passage best supports your opinion — and how could you explain why it matters?",
+    "reasoning_depth": "You've told me what you think. Can you add a sentence that explains WHY your evidence proves your point?",
+    "organization": "What are the main ideas in your response, and does each one connect clearly to the next?",
+    "voice_engagement": "Where in your response does your own voice come through? How could you make one sentence sound more like you?",
+}
+
+FALLBACK_REPLIES = {
+    "model_example": "Look at one sentence where you make this point. Try rewriting it so it states your idea more specifically and connects it to the passage — then compare the two versions.",
+    "first_try_analysis": "Your response states a clear position, supports it with the passage, and explains your thinking. Keep doing exactly that: claim, evidence, and the reason the evidence matters.",
+    "improvement_insight": "Compare your first and final versions side by side: the sentences you added or sharpened are what raised your scores.",
+    "reflection": "Thanks for sharing that — noticing how you worked is what lets you do it again next time.",
+}
+
+def get_rubric_text(rubric: dict = None):
     lines = []
-    for key, dim in VALUE_RUBRIC.items():
+    for key, dim in (rubric or VALUE_RUBRIC).items():
         lines.append(f"{dim['name']}: {dim['description']}")
         for score, anchor in dim['anchors'].items():
             lines.append(f"  {score}: {anchor}")
@@ -0,0 +1,203 @@
+"""
+Passage Registry for Socratic Writing Tutor
+
+passage_config.py describes ONE assignment (the pineapple pizza passage).
+The registry serves any number of them: each passage pack is a directory
+
+    passages/<passage_id>/pack.json     title, writing_prompt, and optionally
+                                        rubric, edge_case_rules, markers,
+                                        reflection_prompts, prompt overrides
+    passages/<passage_id>/passage.md    the passage (or "passage" in pack.json)
+
+Packs load lazily — the first session that asks for an assignment compiles it
+— and are reloaded when pack.json changes, so new assignments need no
+redeploy. Compiling renders every system prompt that doesn't depend on the
+student (scoring, coaching, validation, model examples per dimension and
+writing level), the rubric text, the validator lexicon and the score cache
+fingerprint ONCE into an immutable PassageBundle that all sessions share.
+
+The built-in assignment is always available as DEFAULT_PASSAGE_ID.
+
+Settings (environment variables):
+- PASSAGE_DIR   directory of passage packs (default "passages")
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import passage_config as config
+from lexicon import Lexicon
+from score_cache import fingerprint
+
+DEFAULT_PASSAGE_ID = "pineapple-pizza"
+WRITING_LEVELS = ("basic", "intermediate", "advanced")
+
+
+@dataclass(frozen=True)
+class PassageBundle:
+    """One assignment with its prompts precompiled. Shared, never mutated."""
+
+    passage_id: str
+    title: str
+    passage_text: str
+    writing_prompt: str
+    rubric: MappingProxyType
+    edge_case_rules: str
+    reflection_prompts: tuple
+    markers: MappingProxyType
+    rubric_text: str
+    scoring_system: str
+    coaching_system: str
+    validation_system: str
+    model_example_systems: MappingProxyType = field(repr=False)
+    lexicon: Lexicon = field(repr=False, compare=False)
+    fingerprint: str = ""
+
+    def dimension_name(self, dimension: str) -> str:
+        return self.rubric[dimension]["name"]
+
+    def model_example_system(self, dimension: str, writing_level: str) -> str:
+        return self.model_example_systems[(dimension, writing_level)]
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def compile_bundle(passage_id: str, pack: dict) -> PassageBundle:
+    """Render a pack's static prompts once. Missing fields use passage_config's."""
+    rubric = pack.get("rubric") or config.VALUE_RUBRIC
+    if set(rubric) != set(config.DIMENSION_ORDER):
+        raise ValueError(f"{passage_id}: rubric must define exactly {config.DIMENSION_ORDER}")
+    passage_text = pack["passage"]
+    writing_prompt = pack["writing_prompt"]
+    edge_case_rules = pack.get("edge_case_rules", config.EDGE_CASE_RULES)
+
+    markers = dict(config.DEFAULT_MARKERS)
+    markers["evidence"] = []  # evidence is passage-specific; never inherit pineapple facts
+    if passage_id == DEFAULT_PASSAGE_ID:
+        markers["evidence"] = config.EVIDENCE_MARKERS
+    markers.update(pack.get("markers", {}))
+
+    rubric_text = config.get_rubric_text(rubric)
+    scoring_prompt = pack.get("scoring_system_prompt", config.SCORING_SYSTEM_PROMPT)
+    model_example_prompt = pack.get("model_example_prompt", config.MODEL_EXAMPLE_PROMPT)
+    scoring_system = (
+        scoring_prompt.format(rubric_text=rubric_text)
+        + f"\nPASSAGE:\n{passage_text}\n\n{edge_case_rules}"
+    )
+    return PassageBundle(
+        passage_id=passage_id,
+        title=pack["title"],
+        passage_text=passage_text,
+        writing_prompt=writing_prompt,
+        rubric=_freeze(rubric),
+        edge_case_rules=edge_case_rules,
+        reflection_prompts=_freeze(pack.get("reflection_prompts") or config.REFLECTION_PROMPTS),
+        markers=_freeze(markers),
+        rubric_text=rubric_text,
+        scoring_system=scoring_system,
+        coaching_system=pack.get("coaching_system_prompt", config.COACHING_SYSTEM_PROMPT).format(
+            passage=passage_text),
+        validation_system=pack.get("pre_validation_prompt", config.PRE_VALIDATION_SYSTEM_PROMPT).format(
+            passage_text=passage_text, writing_prompt=writing_prompt),
+        model_example_systems=MappingProxyType({
+            (dim, level): model_example_prompt.format(dimension_name=rubric[dim]["name"], writing_level=level)
+            for dim in config.DIMENSION_ORDER for level in WRITING_LEVELS
+        }),
+        lexicon=Lexicon(markers),
+        # Everything that shapes a score besides the essay itself; part of
+        # every score cache key, so changing any of it never serves stale scores.
+        fingerprint=fingerprint(config.SCORING_PROMPT_VERSION, scoring_system),
+    )
+
+
+def default_pack() -> dict:
+    return {
+        "title": config.PASSAGE_TITLE,
+        "passage": config.PASSAGE_TEXT,
+        "writing_prompt": config.WRITING_PROMPT,
+    }
+
+
+class PassageRegistry:
+    """Lazily loaded, hot-reloaded passage packs from one directory."""
+
+    def __init__(self, directory: str = "passages"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._bundles = {}  # passage_id -> (pack.json mtime, bundle)
+
+    def ids(self) -> list:
+        """Available passage IDs (cheap: lists directories, compiles nothing)."""
+        found = []
+        if os.path.isdir(self.directory):
+            found = sorted(
+                name for name in os.listdir(self.directory)
+                if os.path.isfile(os.path.join(self.directory, name, "pack.json"))
+            )
+        return [DEFAULT_PASSAGE_ID] + [name for name in found if name != DEFAULT_PASSAGE_ID]
+
+    def get(self, passage_id: str = None) -> PassageBundle:
+        """The compiled bundle for passage_id (default assignment if None).
+
+        Raises KeyError for an unknown ID and ValueError for a broken pack.
+        """
+        # One name per pack directory: "../x" and "x" are the same pack and
+        # must share a cache entry, and an ID can never leave the directory
+        passage_id = os.path.basename(passage_id) if passage_id else DEFAULT_PASSAGE_ID
+        pack_dir = os.path.join(self.directory, passage_id)
+        pack_file = os.path.join(pack_dir, "pack.json")
+        try:
+            mtime = os.path.getmtime(pack_file)
+        except OSError:
+            if passage_id != DEFAULT_PASSAGE_ID:
+                raise KeyError(passage_id)
+            mtime = None
+
+        with self._lock:
+            cached = self._bundles.get(passage_id)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            pack = default_pack() if mtime is None else self._read_pack(pack_dir, pack_file)
+            bundle = compile_bundle(passage_id, pack)
+            self._bundles[passage_id] = (mtime, bundle)
+            return bundle
+
+    @staticmethod
+    def _read_pack(pack_dir: str, pack_file: str) -> dict:
+        with open(pack_file, encoding="utf-8") as f:
+            pack = json.load(f)
+        for key, filename in (("passage", "passage.md"), ("writing_prompt", "prompt.md")):
+            path = os.path.join(pack_dir, filename)
+            if key not in pack and os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    pack[key] = f.read()
+        missing = [key for key in ("title", "passage", "writing_prompt") if not pack.get(key)]
+        if missing:
+            raise ValueError(f"{pack_file}: missing {', '.join(missing)}")
+        return pack
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> PassageRegistry:
+    """Process-wide registry over PASSAGE_DIR."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PassageRegistry(os.environ.get("PASSAGE_DIR", "passages"))
+        return _registry
+
+
+def get_bundle(passage_id: str = None) -> PassageBundle:
+    return get_registry().get(passage_id)
@@ -0,0 +1,388 @@
+"""
+Global Rate Limiter for Socratic Writing Tutor
+
+Every Streamlit session used to call the API on its own. When a whole class
+submitted at once, the burst ran past the organization's requests-per-minute
+and tokens-per-minute limits, everyone got 429s together, and everyone
+retried together.
+
+This module puts ONE scheduler in front of every model call in the process:
+
+- Token buckets: one for requests, one for tokens (prompt estimate plus
+  max_tokens, settled against the actual usage afterwards), refilled
+  continuously at the configured per-minute rate
+- Priority classes: interactive (scoring, coaching, reflection...) before
+  validation ("Check My Draft") before batch jobs; a lower class never
+  overtakes a waiting higher one
+- Fair queuing: within a class, sessions take turns (round robin), so one
+  student's burst of calls can't starve the rest of the class
+- Admission control: a call whose expected wait exceeds what is left of its
+  phase deadline is refused at once (the engine answers with its local
+  fallback) instead of timing out at the back of the queue
+- A 429 pauses the whole scheduler for retry-after, so sessions back off
+  together instead of hammering the API in lockstep (also with no limits set)
+
+expected_wait(task) tells the UI how long a new call would queue.
+
+Settings (environment variables):
+- ANTHROPIC_RPM            requests per minute (default 0 = unlimited)
+- ANTHROPIC_TPM            tokens per minute (default 0 = unlimited)
+- ANTHROPIC_BURST_SECONDS  bucket size, in seconds of budget (default 10)
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "validation": 1, "batch": 2}
+TASK_CLASSES = {"validation": "validation", "validation_incremental": "validation"}
+
+_session = contextvars.ContextVar("rate_limit_session", default="-")
+_priority = contextvars.ContextVar("rate_limit_priority", default=None)
+
+
+def set_session(session_id: str):
+    """Queue this context's calls under session_id (one Streamlit script run)."""
+    _session.set(session_id)
+
+
+@contextmanager
+def priority(cls: str):
+    """Run the block's calls in priority class cls (e.g. "batch")."""
+    token = _priority.set(cls)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def task_class(task: str) -> str:
+    return _priority.get() or TASK_CLASSES.get(task, "interactive")
+
+
+def estimate_tokens(request: dict) -> int:
+    """Rough token cost of a Messages request: ~4 characters per prompt token, plus max_tokens."""
+    system = request.get("system") or ""
+    if isinstance(system, list):
+        system = "".join(block.get("text", "") for block in system)
+    chars = len(system) + sum(len(str(m.get("content", ""))) for m in request.get("messages", ()))
+    return chars // 4 + request.get("max_tokens", 0)
+
+
+def usage_tokens(usage) -> int:
+    """Tokens a reply counted against TPM (cache reads don't)."""
+    return sum(getattr(usage, name, 0) or 0
+               for name in ("input_tokens", "cache_creation_input_tokens", "output_tokens"))
+
+
+def settings() -> dict:
+    def env(name, default):
+        try:
+            return float(os.environ.get(name, default))
+        except ValueError:
+            return default
+    return {
+        "rpm": env("ANTHROPIC_RPM", 0),
+        "tpm": env("ANTHROPIC_TPM", 0),
+        "burst_seconds": env("ANTHROPIC_BURST_SECONDS", 10),
+    }
+
+
+class _Bucket:
+    """Continuously refilled token bucket holding burst_seconds of budget."""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount: float) -> float:
+        # A request bigger than the whole bucket waits for a full bucket
+        return min(amount, self.capacity)
+
+    def seconds_until(self, amount: float) -> float:
+        return max(0.0, (self.cost(amount) - self.level) / self.rate)
+
+
+class _Ticket:
+    __slots__ = ("cls", "session", "tokens", "enqueued", "granted", "event", "loop", "future")
+
+    def __init__(self, cls: str, session: str, tokens: int, loop=None):
+        self.cls = cls
+        self.session = session
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class RateLimiter:
+    """Priority + fair-queuing scheduler over request and token buckets."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, burst_seconds: float = 10):
+        self._lock = threading.Lock()
+        self.rpm = rpm
+        self.tpm = tpm
+        self._tokens = _Bucket(tpm, burst_seconds) if tpm else None
+        # (bucket, what a call of n estimated tokens costs in it); unlimited ones are left out
+        self._buckets = [(bucket, need) for bucket, need in (
+            (_Bucket(rpm, burst_seconds) if rpm else None, lambda tokens: 1),
+            (self._tokens, lambda tokens: tokens),
+        ) if bucket is not None]
+        # class -> OrderedDict(session -> deque of tickets); dict order is the round robin
+        self._queues = {cls: OrderedDict() for cls in PRIORITIES}
+        self._paused_until = 0.0
+        self.pauses = 0
+        self.stats = {cls: {"admitted": 0, "rejected": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+                      for cls in PRIORITIES}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._buckets)
+
+    # --- scheduling (call with self._lock held) ------------------------------
+
+    def _waiting(self):
+        """Queued tickets in the order they would be served."""
+        for cls in sorted(PRIORITIES, key=PRIORITIES.get):
+            sessions = [list(tickets) for tickets in self._queues[cls].values()]
+            depth = max(map(len, sessions), default=0)
+            for turn in range(depth):
+                for tickets in sessions:
+                    if turn < len(tickets):
+                        yield tickets[turn]
+
+    def _dispatch(self, now: float):
+        """Grant queued tickets in order while the buckets allow."""
+        for bucket, _ in self._buckets:
+            bucket.refill(now)
+        if now < self._paused_until:
+            return
+        for cls in sorted(PRIORITIES, key=PRIORITIES.get):
+            queue = self._queues[cls]
+            while queue:
+                session, tickets = next(iter(queue.items()))
+                ticket = tickets[0]
+                if any(bucket.level < bucket.cost(need(ticket.tokens)) for bucket, need in self._buckets):
+                    return  # head of line: nothing behind it may overtake
+                for bucket, need in self._buckets:
+                    bucket.level -= bucket.cost(need(ticket.tokens))
+                tickets.popleft()
+                del queue[session]
+                if tickets:
+                    queue[session] = tickets  # back of the round robin
+                self._record(ticket, now)
+                ticket.grant()
+
+    def _record(self, ticket: _Ticket, now: float):
+        waited = max(0.0, now - ticket.enqueued)
+        stats = self.stats[ticket.cls]
+        stats["admitted"] += 1
+        stats["wait_total_s"] += waited
+        stats["wait_max_s"] = max(stats["wait_max_s"], waited)
+
+    def _wait_for(self, cls: str, tokens: int, now: float) -> float:
+        """Seconds until a new ticket of cls would be granted."""
+        ahead = [t for t in self._waiting() if PRIORITIES[t.cls] <= PRIORITIES[cls]]
+        wait = 0.0
+        for bucket, need in self._buckets:
+            bucket.refill(now)
+            total = sum(bucket.cost(need(t.tokens)) for t in ahead) + bucket.cost(need(tokens))
+            wait = max(wait, (total - bucket.level) / bucket.rate)
+        return max(wait, self._paused_until - now, 0.0)
+
+    def _next_wake(self, now: float) -> float:
+        head = next(self._waiting(), None)
+        wait = max(self._paused_until - now, 0.0)
+        if head is not None:
+            wait = max([wait] + [bucket.seconds_until(need(head.tokens)) for bucket, need in self._buckets])
+        return min(max(wait, 0.01), 1.0)
+
+    def _enqueue(self, task: str, tokens: int, limit, loop=None):
+        cls = task_class(task)
+        now = time.monotonic()
+        self._dispatch(now)
+        if limit is not None and self._wait_for(cls, tokens, now) > limit:
+            self.stats[cls]["rejected"] += 1
+            return None
+        ticket = _Ticket(cls, _session.get(), tokens, loop)
+        self._queues[cls].setdefault(ticket.session, deque()).append(ticket)
+        self._dispatch(now)
+        return ticket
+
+    def _withdraw(self, ticket: _Ticket):
+        queue = self._queues[ticket.cls]
+        tickets = queue.get(ticket.session)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.session]
+
+    # --- public --------------------------------------------------------------
+
+    def _pause_left(self, task: str, limit) -> float:
+        """Without buckets only a 429 pause holds calls: seconds left of it, or None to refuse."""
+        with self._lock:
+            wait = max(0.0, self._paused_until - time.monotonic())
+            if wait and limit is not None and wait > limit:
+                self.stats[task_class(task)]["rejected"] += 1
+                return None
+        return wait
+
+    def acquire(self, task: str, tokens: int = 0, limit: float = None) -> bool:
+        """Block until the call may go out. False if it would wait more than limit seconds."""
+        if not self.enabled:
+            wait = self._pause_left(task, limit)
+            if wait:
+                time.sleep(wait)
+            return wait is not None
+        with self._lock:
+            ticket = self._enqueue(task, tokens, limit)
+        if ticket is None:
+            return False
+        give_up = None if limit is None else time.monotonic() + limit
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._dispatch(now)
+                if ticket.granted:
+                    return True
+                if give_up is not None and now >= give_up:
+                    self._withdraw(ticket)
+                    self.stats[ticket.cls]["rejected"] += 1
+                    return False
+                wake = self._next_wake(now)
+            if give_up is not None:
+                wake = min(wake, max(0.0, give_up - now))
+            ticket.event.wait(wake)
+
+    def try_acquire(self, task: str, tokens: int = 0) -> bool:
+        """Take a permit only if one is free now with nobody queued ahead; never waits."""
+        if not self.enabled:
+            return self._pause_left(task, 0) is not None
+        with self._lock:
+            cls = task_class(task)
+            now = time.monotonic()
+            self._dispatch(now)
+            if self._wait_for(cls, tokens, now) > 0:
+                return False
+            for bucket, need in self._buckets:
+                bucket.level -= bucket.cost(need(tokens))
+            self._record(_Ticket(cls, _session.get(), tokens), now)
+            return True
+
+    async def aacquire(self, task: str, tokens: int = 0, limit: float = None) -> bool:
+        """acquire() for coroutines: waits without blocking the event loop."""
+        if not self.enabled:
+            wait = self._pause_left(task, limit)
+            if wait:
+                await asyncio.sleep(wait)
+            return wait is not None
+        with self._lock:
+            ticket = self._enqueue(task, tokens, limit, asyncio.get_running_loop())
+        if ticket is None:
+            return False
+        give_up = None if limit is None else time.monotonic() + limit
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._dispatch(now)
+                    if ticket.granted:
+                        return True
+                    if give_up is not None and now >= give_up:
+                        self._withdraw(ticket)
+                        self.stats[ticket.cls]["rejected"] += 1
+                        return False
+                    wake = self._next_wake(now)
+                if give_up is not None:
+                    wake = min(wake, max(0.0, give_up - now))
+                await asyncio.wait({ticket.future}, timeout=wake)
+        except asyncio.CancelledError:
+            with self._lock:
+                if not ticket.granted:
+                    self._withdraw(ticket)
+            raise
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token bucket once a reply's real usage is known."""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + estimated - actual)
+
+    def pause(self, seconds: float):
+        """Hold every queue for seconds (the API answered 429)."""
+        with self._lock:
+            self.pauses += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def expected_wait(self, task: str = "scoring", tokens: int = 2000) -> float:
+        """Seconds a new call of task would queue right now."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            return self._wait_for(task_class(task), tokens, time.monotonic())
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {cls: dict(s) for cls, s in self.stats.items()}
+            for cls, s in stats.items():
+                s["queued"] = sum(len(t) for t in self._queues[cls].values())
+                s["sessions_waiting"] = len(self._queues[cls])
+                s["avg_wait_s"] = round(s["wait_total_s"] / s["admitted"], 4) if s["admitted"] else 0.0
+                s["wait_total_s"] = round(s["wait_total_s"], 4)
+                s["wait_max_s"] = round(s["wait_max_s"], 4)
+            pauses = self.pauses
+        return {"rpm": self.rpm, "tpm": self.tpm, "pauses": pauses, "classes": stats}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Process-wide limiter from ANTHROPIC_RPM / ANTHROPIC_TPM."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(**settings())
+        return _limiter
+
+
+def configure(**overrides):
+    """Replace the process-wide limiter: settings from the environment, plus overrides (e.g. rpm=120)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = RateLimiter(**dict(settings(), **overrides))
+
+
+def expected_wait(task: str = "scoring") -> float:
+    return get_limiter().expected_wait(task)
+
+
+def get_limiter_stats() -> dict:
+    return get_limiter().get_stats()
@@ -0,0 +1,502 @@
+"""
+Resilience Layer for Socratic Writing Tutor
+
+call_claude used to wait as long as the upstream took and crash the phase on
+any API error. Every model call now goes through an Attempts policy:
+
+- Deadlines: each phase (validate, submit, revise, reflect) gets a time
+  budget; every attempt's timeout is capped by what's left of it
+- Retries: 429, 5xx and connection errors are retried with jittered
+  exponential backoff (honouring retry-after) while the budget allows
+- Hedging (optional): if a call runs past that task's p95 latency, a
+  duplicate is sent and whichever answers first wins; the duplicate needs a
+  rate-limit permit that is free right away, else no duplicate is sent
+- Circuit breaker: after repeated upstream failures calls fail fast for a
+  cool-down period instead of queueing behind a sick upstream; a failure
+  the call recovers from on another model (model_routing) doesn't count
+
+- Admission: every attempt first takes its turn in the global rate limiter
+  (rate_limiter.py), which may refuse it when the wait would outlast the
+  phase deadline
+
+When a call can't be completed it raises UpstreamUnavailable, and the engine
+answers from local fallbacks (heuristic scores, canned Socratic questions)
+so the student's page keeps moving.
+
+Settings (environment variables):
+- ANTHROPIC_CALL_TIMEOUT       per-attempt cap in seconds (default 30)
+- ANTHROPIC_MAX_RETRIES        retries per call (default 3)
+- ANTHROPIC_HEDGE              "1" to enable hedged requests (default off)
+- ANTHROPIC_BREAKER_FAILURES   consecutive failures that open the breaker (default 5)
+- ANTHROPIC_BREAKER_COOLDOWN   seconds before a trial call is let through (default 30)
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import anthropic
+
+import rate_limiter
+
+# Seconds a whole phase may spend waiting on the model
+PHASE_BUDGETS = {"validate": 20.0, "submit": 45.0, "revise": 45.0, "reflect": 20.0}
+
+HEDGE_MIN_SAMPLES = 20
+
+
+def settings() -> dict:
+    def env(name, default, cast=float):
+        try:
+            return cast(os.environ.get(name, default))
+        except ValueError:
+            return default
+    return {
+        "call_timeout": env("ANTHROPIC_CALL_TIMEOUT", 30.0),
+        "max_retries": env("ANTHROPIC_MAX_RETRIES", 3, int),
+        "hedge": os.environ.get("ANTHROPIC_HEDGE", "0") == "1",
+        "breaker_failures": env("ANTHROPIC_BREAKER_FAILURES", 5, int),
+        "breaker_cooldown": env("ANTHROPIC_BREAKER_COOLDOWN", 30.0),
+        "backoff_base": 0.5,
+        "backoff_cap": 8.0,
+    }
+
+
+class UpstreamUnavailable(Exception):
+    """The model call couldn't be completed; answer locally instead."""
+
+    def __init__(self, reason: str, cause: Exception = None):
+        super().__init__(f"{reason}: {cause}" if cause else reason)
+        self.reason = reason  # circuit_open | overloaded | deadline | retries_exhausted | error | stream_interrupted | budget_exhausted | unparseable
+        self.cause = cause
+
+
+_lock = threading.Lock()
+_stats = {
+    "calls": 0, "retries": 0, "hedges": 0, "hedges_won": 0, "hedges_skipped": 0, "deadline_exceeded": 0,
+    "short_circuited": 0, "overloaded": 0, "unavailable": 0, "breaker_opens": 0, "fallbacks": {},
+}
+_latencies = {}  # task -> recent successful latencies
+
+
+def _count(key: str, amount: int = 1):
+    with _lock:
+        _stats[key] += amount
+
+
+def record_fallback(task: str):
+    """Note that a local fallback answered for task."""
+    with _lock:
+        _stats["fallbacks"][task] = _stats["fallbacks"].get(task, 0) + 1
+
+
+# --- circuit breaker --------------------------------------------------------
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open -> closed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+
+    def _trial_free(self, now: float, config: dict) -> bool:
+        """Half-open with no trial running (a trial held past a whole call's timeout has been lost)."""
+        if self.state == "open" and now - self.opened_at >= config["breaker_cooldown"]:
+            self.state = "half_open"
+        if self.state != "half_open":
+            return False
+        return not self._trial_running or now - self._trial_started >= config["call_timeout"] + config["breaker_cooldown"]
+
+    def blocked(self) -> bool:
+        """True if a call would be refused right now; takes nothing."""
+        config = settings()
+        with self._lock:
+            return self.state != "closed" and not self._trial_free(time.monotonic(), config)
+
+    def acquire(self) -> str:
+        """"closed" (go ahead), "trial" (this call is the one half-open trial) or "" (refused).
+
+        Whoever gets "trial" must end it with record_success(), record_failure()
+        or release_trial().
+        """
+        config = settings()
+        with self._lock:
+            if self.state == "closed":
+                return "closed"
+            now = time.monotonic()
+            if not self._trial_free(now, config):
+                return ""
+            self._trial_running = True  # one trial call at a time
+            self._trial_started = now
+            return "trial"
+
+    def release_trial(self):
+        """End a trial that gave no verdict (refused, 4xx, cancelled...); the next call may try."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= settings()["breaker_failures"]:
+                if self.state != "open":
+                    _count("breaker_opens")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+BREAKER = CircuitBreaker()
+
+
+# --- deadlines --------------------------------------------------------------
+
+_deadline = contextvars.ContextVar("phase_deadline", default=None)
+
+
+def current_deadline():
+    """Absolute time.monotonic() deadline of the running phase, or None."""
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_at(deadline):
+    """Run the block under an absolute deadline (nested deadlines keep the tighter one)."""
+    outer = _deadline.get()
+    if deadline is None or (outer is not None and outer < deadline):
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def phase_deadline(phase: str):
+    """Decorator giving a (sync or async) engine method its phase budget."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with deadline_at(time.monotonic() + PHASE_BUDGETS[phase]):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with deadline_at(time.monotonic() + PHASE_BUDGETS[phase]):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def remaining():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# --- retry policy -----------------------------------------------------------
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, anthropic.APIConnectionError):  # includes timeouts
+        return True
+    status = getattr(exc, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Exception = None, cap: float = None) -> float:
+    """Seconds before the next try: exc's retry-after if it has one, else jittered exponential backoff."""
+    delay = _retry_after(exc) if exc is not None else None
+    if delay is None:
+        config = settings()
+        cap = config["backoff_cap"] if cap is None else cap
+        delay = min(cap, config["backoff_base"] * 2 ** attempt) * random.uniform(0.5, 1.0)
+    return delay
+
+
+class Attempts:
+    """Retry/deadline/breaker bookkeeping for one logical model call.
+
+        attempts = Attempts(task, tokens)
+        while True:                             # in try/finally: attempts.close()
+            timeout = attempts.timeout()        # may raise UpstreamUnavailable
+            try:
+                result = one_attempt(timeout)
+            except Exception as exc:
+                time.sleep(attempts.failed(exc))  # may raise
+                continue
+            attempts.succeeded(latency, result.usage)
+            return result
+
+    tokens is the call's estimated cost for the rate limiter. Run the loop
+    in try/finally with attempts.close() in the finally, so a call that ends
+    any other way (a 4xx, a refusal, cancellation) doesn't keep the circuit
+    breaker's half-open trial.
+    """
+
+    def __init__(self, task: str, tokens: int = 0):
+        self.task = task
+        self.tokens = tokens
+        self.attempt = 0
+        self.settings = settings()
+        self._trial = False  # holding the breaker's half-open trial
+        _count("calls")
+
+    def _short_circuit(self):
+        _count("short_circuited")
+        _count("unavailable")
+        return UpstreamUnavailable("circuit_open")
+
+    def _check_breaker(self):
+        """Fail fast while the breaker is open, before queueing for admission."""
+        if not self._trial and BREAKER.blocked():
+            raise self._short_circuit()
+
+    def _enter_breaker(self):
+        """Take the breaker's go-ahead once admitted and within the deadline."""
+        if self._trial:
+            return
+        grant = BREAKER.acquire()
+        if not grant:  # another call took the trial while this one queued
+            rate_limiter.get_limiter().settle(self.tokens, 0)
+            raise self._short_circuit()
+        self._trial = grant == "trial"
+
+    def _refused(self):
+        _count("overloaded")
+        _count("unavailable")
+        return UpstreamUnavailable("overloaded")
+
+    def timeout(self) -> float:
+        """Check breaker, wait for admission, check deadline; the timeout for the next attempt."""
+        self._check_breaker()
+        if not rate_limiter.get_limiter().acquire(self.task, self.tokens, remaining()):
+            raise self._refused()
+        timeout = self._attempt_timeout()
+        self._enter_breaker()
+        return timeout
+
+    async def atimeout(self) -> float:
+        """timeout() for coroutines (admission waits without blocking the loop)."""
+        self._check_breaker()
+        if not await rate_limiter.get_limiter().aacquire(self.task, self.tokens, remaining()):
+            raise self._refused()
+        timeout = self._attempt_timeout()
+        self._enter_breaker()
+        return timeout
+
+    def _attempt_timeout(self) -> float:
+        left = remaining()
+        if left is not None and left <= 0.05:
+            _count("deadline_exceeded")
+            _count("unavailable")
+            raise UpstreamUnavailable("deadline")
+        cap = self.settings["call_timeout"]
+        return cap if left is None else min(cap, left)
+
+    def succeeded(self, latency: float, usage=None):
+        BREAKER.record_success()
+        self._trial = False
+        if usage is not None:
+            rate_limiter.get_limiter().settle(self.tokens, rate_limiter.usage_tokens(usage))
+        with _lock:
+            _latencies.setdefault(self.task, deque(maxlen=200)).append(latency)
+
+    def failed(self, exc: Exception, breaker: bool = True) -> float:
+        """Seconds to wait before retrying; raises UpstreamUnavailable when done trying.
+
+        breaker=False leaves the circuit breaker out of it (the retry goes
+        to another model, so this one's failure says nothing about the rest).
+        """
+        if not isinstance(exc, anthropic.APIError):
+            raise exc  # a bug, not an upstream problem
+        retryable = is_retryable(exc)
+        if retryable and breaker and getattr(exc, "status_code", None) != 429:
+            BREAKER.record_failure()
+            self._trial = False
+        reason = None
+        if not retryable:
+            reason = "error"
+        elif self.attempt >= self.settings["max_retries"]:
+            reason = "retries_exhausted"
+        if reason is None:
+            delay = backoff_delay(self.attempt, exc)
+            if getattr(exc, "status_code", None) == 429:
+                rate_limiter.get_limiter().pause(delay)  # every session backs off, not just this one
+            left = remaining()
+            if left is not None and delay >= left:
+                reason = "deadline"
+                _count("deadline_exceeded")
+        if reason is not None:
+            _count("unavailable")
+            raise UpstreamUnavailable(reason, exc) from exc
+        self.attempt += 1
+        _count("retries")
+        return delay
+
+    def close(self):
+        """Give back the breaker's trial if this call still holds it; call when done, however it ended."""
+        if self._trial:
+            self._trial = False
+            BREAKER.release_trial()
+
+
+# --- hedging ----------------------------------------------------------------
+
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def hedge_threshold(task: str):
+    """p95 latency of recent successful calls for task, once there are enough."""
+    if not settings()["hedge"]:
+        return None
+    with _lock:
+        samples = sorted(_latencies.get(task, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95) - 1]
+
+
+def _hedge_permit(task: str, tokens: int) -> bool:
+    """The duplicate is a call of its own: it needs a rate-limit permit, but never queues for one."""
+    if rate_limiter.get_limiter().try_acquire(task, tokens):
+        _count("hedges")
+        return True
+    _count("hedges_skipped")
+    return False
+
+
+def _settle_when_done(future, tokens: int):
+    """Settle the losing duplicate's permit once its reply (billed all the same) arrives."""
+    def settle(future):
+        if future.exception() is None:
+            usage = getattr(future.result(), "usage", None)
+            rate_limiter.get_limiter().settle(tokens, rate_limiter.usage_tokens(usage))
+    future.add_done_callback(settle)
+
+
+def _hedged(task: str, attempt, timeout: float, tokens: int = 0, hedge: bool = True):
+    threshold = hedge_threshold(task) if hedge else None
+    if threshold is None or threshold >= timeout:
+        return attempt(timeout)
+    # Each attempt runs with the caller's deadline context
+    primary = _hedge_pool.submit(contextvars.copy_context().run, attempt, timeout)
+    done, _ = wait([primary], timeout=threshold)
+    if done or not _hedge_permit(task, tokens):
+        return primary.result()
+    backup = _hedge_pool.submit(contextvars.copy_context().run, attempt, max(0.1, timeout - threshold))
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    _count("hedges_won")
+                # The winner is settled by Attempts.succeeded, the loser here
+                for loser in pending:
+                    _settle_when_done(loser, tokens)
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+async def _ahedged(task: str, attempt, timeout: float, tokens: int = 0, hedge: bool = True):
+    threshold = hedge_threshold(task) if hedge else None
+    if threshold is None or threshold >= timeout:
+        return await attempt(timeout)
+    primary = asyncio.ensure_future(attempt(timeout))
+    done, _ = await asyncio.wait({primary}, timeout=threshold)
+    if done or not _hedge_permit(task, tokens):
+        return await primary
+    backup = asyncio.ensure_future(attempt(max(0.1, timeout - threshold)))
+    pending = {primary, backup}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task_ in done:
+                if task_.exception() is None:
+                    if task_ is backup:
+                        _count("hedges_won")
+                    return task_.result()
+                error = error or task_.exception()
+        raise error
+    finally:
+        # A cancelled loser keeps its whole estimate in the token bucket
+        for task_ in pending:
+            task_.cancel()
+
+
+def call(task: str, attempt, tokens: int = 0, hedge: bool = True, spared=None):
+    """Run attempt(timeout) under the full policy; returns its result (a Message).
+
+    hedge=False never sends a duplicate, even when hedging is enabled.
+    spared(exc) returning True keeps that failure off the circuit breaker.
+    """
+    attempts = Attempts(task, tokens)
+    try:
+        while True:
+            timeout = attempts.timeout()
+            started = time.perf_counter()
+            try:
+                result = _hedged(task, attempt, timeout, tokens, hedge)
+            except Exception as exc:
+                time.sleep(attempts.failed(exc, breaker=not (spared and spared(exc))))
+                continue
+            attempts.succeeded(time.perf_counter() - started, getattr(result, "usage", None))
+            return result
+    finally:
+        attempts.close()
+
+
+async def acall(task: str, attempt, tokens: int = 0, hedge: bool = True, spared=None):
+    """Async call(): attempt(timeout) returns an awaitable."""
+    attempts = Attempts(task, tokens)
+    try:
+        while True:
+            timeout = await attempts.atimeout()
+            started = time.perf_counter()
+            try:
+                result = await _ahedged(task, attempt, timeout, tokens, hedge)
+            except Exception as exc:
+                await asyncio.sleep(attempts.failed(exc, breaker=not (spared and spared(exc))))
+                continue
+            attempts.succeeded(time.perf_counter() - started, getattr(result, "usage", None))
+            return result
+    finally:
+        attempts.close()
+
+
+def get_resilience_stats() -> dict:
+    with _lock:
+        stats = dict(_stats, fallbacks=dict(_stats["fallbacks"]))
+        p95 = {task: round(sorted(s)[int(len(s) * 0.95) - 1], 3) for task, s in _latencies.items() if len(s) >= 2}
+    stats["breaker_state"] = BREAKER.state
+    stats["p95_latency_s"] = p95
+    return stats
@@ -0,0 +1,187 @@
+"""
+Score Cache for Socratic Writing Tutor
+
+Students often resubmit a revision that is unchanged, or changed only in
+whitespace within its paragraphs. Scoring it again costs a full model call and can even return a
+different score for the same text. This cache returns the earlier result.
+
+Keys are content-addressed: a hash of the normalized essay plus a fingerprint
+of everything that shapes the score (passage, rubric, prompts, prompt
+version). Changing any of those produces new keys, so stale scores are never
+served after a rubric or prompt edit.
+
+Two tiers:
+- In-process LRU (always on) — shared by every session in this process
+- SQLite on disk (optional) — survives restarts, shared across processes
+
+Settings (environment variables):
+- SCORE_CACHE_SIZE     max entries in the in-process tier (default 2048)
+- SCORE_CACHE_TTL      seconds before an entry expires (default 7 days)
+- SCORE_CACHE_DB       path to the SQLite file; unset disables the disk tier
+- SCORE_CACHE_DB_ROWS  max rows kept on disk (default 50000)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_essay(essay: str) -> str:
+    """Canonical form used for keys: NFC, whitespace runs collapsed, trimmed.
+
+    Paragraph breaks (a blank line, as draft_index counts them) are kept as
+    "\n\n": paragraphing is part of what STRUCTURE is scored on.
+    """
+    paragraphs = re.split(r"\n\s*\n", unicodedata.normalize("NFC", essay))
+    return "\n\n".join(filter(None, (" ".join(p.split()) for p in paragraphs)))
+
+
+def fingerprint(*parts: str) -> str:
+    """Hash of the scoring context (passage, rubric, prompts, version)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def make_key(essay: str, context_fingerprint: str) -> str:
+    digest = hashlib.sha256(context_fingerprint.encode("utf-8"))
+    digest.update(normalize_essay(essay).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ScoreCache:
+    """Two-tier (LRU + optional SQLite) cache of score dicts, with TTL."""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 7 * 24 * 3600,
+                 db_path: str = None, max_db_rows: int = 50000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_rows = max_db_rows
+        self._memory = OrderedDict()  # key -> (stored_at, json)
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scores "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS scores_stored_at ON scores (stored_at)")
+            self._db.commit()
+        except sqlite3.Error:
+            # A broken disk tier should never stop scoring — fall back to memory only
+            self._db = None
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return now - stored_at > self.ttl_seconds
+
+    def get(self, key: str):
+        """Return a fresh copy of the cached scores, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return json.loads(entry[1])
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, stored_at FROM scores WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row and not self._expired(row[1], now):
+                    self._remember(key, row[1], row[0])
+                    self.stats["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, scores: dict):
+        value = json.dumps(scores)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self.stats["stores"] += 1
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO scores (key, value, stored_at) VALUES (?, ?, ?)",
+                        (key, value, now)
+                    )
+                    self._prune_db(now)
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def _remember(self, key: str, stored_at: float, value: str):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _prune_db(self, now: float):
+        self._db.execute("DELETE FROM scores WHERE stored_at < ?", (now - self.ttl_seconds,))
+        (rows,) = self._db.execute("SELECT COUNT(*) FROM scores").fetchone()
+        if rows > self.max_db_rows:
+            self._db.execute(
+                "DELETE FROM scores WHERE key IN "
+                "(SELECT key FROM scores ORDER BY stored_at ASC LIMIT ?)",
+                (rows - self.max_db_rows,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM scores")
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_score_cache() -> ScoreCache:
+    """Process-wide cache, configured from the environment on first use."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ScoreCache(
+                max_entries=int(os.environ.get("SCORE_CACHE_SIZE", 2048)),
+                ttl_seconds=float(os.environ.get("SCORE_CACHE_TTL", 7 * 24 * 3600)),
+                db_path=os.environ.get("SCORE_CACHE_DB") or None,
+                max_db_rows=int(os.environ.get("SCORE_CACHE_DB_ROWS", 50000)),
+            )
+        return _shared_cache
@@ -1,23 +1,38 @@
 """
 Session Logger for Socratic Writing Tutor
-Automatically logs session data to Google Sheets for dissertation research.
+Automatically logs session data for dissertation research.
+
+Every row goes to a local append-only event log first (event_store.py), so
+sessions are captured even offline or with Sheets unconfigured. Google Sheets
+is an asynchronous downstream sink, enabled by the setup below.
 
 Setup:
 1. Create a Google Cloud project and enable Google Sheets API
 2. Create a service account and download the JSON credentials
 3. Share your Google Sheet with the service account email
 4. Add the credentials JSON to Streamlit secrets as [gcp_service_account]
+
+Rows are written to Sheets by a background writer (log_queue.py), so a phase
+transition never waits on Sheets. Optional settings in Streamlit secrets under
+[logging]: event_log_path, local_enabled, wait_for_commit, batch_size,
+flush_interval, queue_size, spill_path.
 """
 
 import json
-import uuid
+import secrets
+import threading
 from datetime import datetime
 
 import streamlit as st
 
+import tracing
+from event_store import JsonlEventStore, SheetsSink
+from log_queue import BackgroundLogWriter
+
 # Google Sheets imports - graceful fallback if not configured
 try:
     import gspread
+    from google.auth.transport.requests import Request
     from google.oauth2.service_account import Credentials
     GSHEETS_AVAILABLE = True
 except ImportError:
@@ -25,67 +40,236 @@ except ImportError:
 
 
 def get_session_id() -> str:
-    """Get or create a unique session ID."""
+    """Get or create a unique session ID.
+
+    It is also the key that resumes the session from the URL (?session=<id>),
+    so it has to be unguessable: 128 random bits, URL-safe.
+    """
     if 'session_id' not in st.session_state:
-        st.session_state.session_id = str(uuid.uuid4())[:8]
+        st.session_state.session_id = secrets.token_urlsafe(16)
     return st.session_state.session_id
 
 
+# Process-level handle cache: one authorization, one spreadsheet open and one
+# lookup per worksheet for the life of the process, instead of per log call.
+_handles = {"creds": None, "client": None, "spreadsheet": None, "worksheets": {}}
+_handles_lock = threading.RLock()
+_connection_stats = {
+    "authorizations": 0, "token_refreshes": 0, "spreadsheet_opens": 0,
+    "worksheet_lookups": 0, "worksheets_created": 0,
+    "cache_hits": 0, "invalidations": 0,
+}
+
+
 def get_gsheets_connection():
-    """Connect to Google Sheets using Streamlit secrets."""
+    """Connect to Google Sheets using Streamlit secrets (cached per process)."""
     if not GSHEETS_AVAILABLE:
         return None
     
-    try:
-        creds_dict = st.secrets.get("gcp_service_account", None)
-        if not creds_dict:
+    with _handles_lock:
+        try:
+            if _handles["spreadsheet"] is not None:
+                creds = _handles["creds"]
+                if creds.token and creds.expired:
+                    creds.refresh(Request())
+                    _connection_stats["token_refreshes"] += 1
+                _connection_stats["cache_hits"] += 1
+                return _handles["spreadsheet"]
+            
+            creds_dict = st.secrets.get("gcp_service_account", None)
+            if not creds_dict:
+                return None
+            
+            scopes = [
+                "https://www.googleapis.com/auth/spreadsheets",
+                "https://www.googleapis.com/auth/drive"
+            ]
+            creds = Credentials.from_service_account_info(dict(creds_dict), scopes=scopes)
+            client = gspread.authorize(creds)
+            _connection_stats["authorizations"] += 1
+            
+            sheet_url = st.secrets.get("sheets", {}).get("spreadsheet_url", None)
+            if sheet_url:
+                spreadsheet = client.open_by_url(sheet_url)
+            else:
+                sheet_name = st.secrets.get("sheets", {}).get("spreadsheet_name", "Socratic Tutor Sessions")
+                spreadsheet = client.open(sheet_name)
+            _connection_stats["spreadsheet_opens"] += 1
+            
+            _handles.update(creds=creds, client=client, spreadsheet=spreadsheet, worksheets={})
+            return spreadsheet
+        except Exception:
+            # Silently fail — don't break the app if logging fails
             return None
-        
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = Credentials.from_service_account_info(dict(creds_dict), scopes=scopes)
-        client = gspread.authorize(creds)
-        
-        sheet_url = st.secrets.get("sheets", {}).get("spreadsheet_url", None)
-        if sheet_url:
-            return client.open_by_url(sheet_url)
-        
-        sheet_name = st.secrets.get("sheets", {}).get("spreadsheet_name", "Socratic Tutor Sessions")
-        return client.open(sheet_name)
-    except Exception as e:
-        # Silently fail — don't break the app if logging fails
-        return None
+
+
+def invalidate_gsheets_handles():
+    """Drop cached client/spreadsheet/worksheets; the next call reconnects."""
+    with _handles_lock:
+        _handles.update(creds=None, client=None, spreadsheet=None, worksheets={})
+        _connection_stats["invalidations"] += 1
+
+
+def get_connection_stats() -> dict:
+    """Counts of authorizations, opens, lookups and cache hits in this process."""
+    with _handles_lock:
+        stats = dict(_connection_stats)
+        stats["cached_worksheets"] = len(_handles["worksheets"])
+    return stats
 
 
 def ensure_worksheet(spreadsheet, name: str, headers: list):
     """Get or create a worksheet with the given headers."""
+    with _handles_lock:
+        cached = spreadsheet is _handles["spreadsheet"]
+        if cached and name in _handles["worksheets"]:
+            return _handles["worksheets"][name]
+        
+        try:
+            ws = spreadsheet.worksheet(name)
+            _connection_stats["worksheet_lookups"] += 1
+        except gspread.WorksheetNotFound:
+            ws = spreadsheet.add_worksheet(title=name, rows=1000, cols=len(headers))
+            ws.append_row(headers)
+            _connection_stats["worksheets_created"] += 1
+        
+        if cached:
+            _handles["worksheets"][name] = ws
+        return ws
+
+
+SESSION_LOG_HEADERS = [
+    "Session ID", "Timestamp", "Phase", "Essay Version #",
+    "Essay Text", "Scores JSON", "Coaching Message",
+    "Reflection Q", "Reflection A", "Extra"
+]
+
+SESSION_SUMMARY_HEADERS = [
+    "Session ID", "Completed At", "Total Revisions", "Coaching Turns",
+    "Essay Versions", "Reflection Turns",
+    "Initial Essay", "Final Essay",
+    "Initial Scores", "Final Scores",
+    "All Reflections JSON", "All Scores JSON",
+    "Session Complete"
+]
+
+
+def sheets_configured() -> bool:
+    """Cheap check (no network) that Sheets logging is set up at all."""
+    if not GSHEETS_AVAILABLE:
+        return False
     try:
-        ws = spreadsheet.worksheet(name)
-    except gspread.WorksheetNotFound:
-        ws = spreadsheet.add_worksheet(title=name, rows=1000, cols=len(headers))
-        ws.append_row(headers)
-    return ws
+        return bool(st.secrets.get("gcp_service_account", None))
+    except Exception:
+        return False
+
+
+def _append_rows_to_sheet(worksheet_name: str, headers: list, rows: list):
+    """Writer sink: one batched append per worksheet. Raises so the writer can retry."""
+    # Runs on the writer thread, long after the action that logged the rows,
+    # so this is a (sampled) root span of its own
+    with tracing.span("sheets.append", worksheet=worksheet_name, rows=len(rows)):
+        spreadsheet = get_gsheets_connection()
+        if not spreadsheet:
+            raise ConnectionError("Google Sheets is not reachable")
+        try:
+            ws = ensure_worksheet(spreadsheet, worksheet_name, headers)
+            ws.append_rows(rows, value_input_option="RAW")
+        except gspread.exceptions.APIError as exc:
+            # A deleted worksheet, revoked share or expired session all surface as
+            # APIError — reconnect next time. Quota errors (429) don't mean the
+            # handles are stale, and reopening would only burn more read quota.
+            if getattr(exc.response, "status_code", None) != 429:
+                invalidate_gsheets_handles()
+            raise
+
+
+def _is_retryable_sheets_error(exc: Exception) -> bool:
+    """Retry quota (429), server (5xx) and network errors; other API errors won't fix themselves."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _logging_settings() -> dict:
+    try:
+        return dict(st.secrets.get("logging", {}))
+    except Exception:
+        return {}
+
+
+def get_log_writer() -> BackgroundLogWriter:
+    """Process-wide background Sheets writer shared by every session."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            settings = _logging_settings()
+            _writer = BackgroundLogWriter(
+                _append_rows_to_sheet,
+                is_retryable=_is_retryable_sheets_error,
+                batch_size=int(settings.get("batch_size", 50)),
+                flush_interval=float(settings.get("flush_interval", 2.0)),
+                queue_size=int(settings.get("queue_size", 5000)),
+                spill_path=settings.get("spill_path", "sheets_spill.jsonl"),
+            )
+        return _writer
+
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def get_log_backends() -> list:
+    """Configured backends: the local event log, then Sheets if set up."""
+    global _backends
+    with _backends_lock:
+        if _backends is None:
+            settings = _logging_settings()
+            backends = []
+            if str(settings.get("local_enabled", True)).lower() not in ("false", "0", "no"):
+                try:
+                    backends.append(JsonlEventStore(
+                        settings.get("event_log_path", "session_events.jsonl"),
+                        wait_for_commit=str(settings.get("wait_for_commit", False)).lower() in ("true", "1", "yes"),
+                    ))
+                except OSError:
+                    pass  # Read-only filesystem etc. — fall back to Sheets only
+            if sheets_configured():
+                backends.append(SheetsSink(get_log_writer()))
+            _backends = backends
+        return _backends
+
+
+def register_log_backend(backend):
+    """Add a backend (a LogBackend, or anything with write(stream, headers, row))."""
+    backends = get_log_backends()
+    with _backends_lock:
+        backends.append(backend)
+
+
+def _emit(stream: str, headers: list, row: list):
+    with tracing.span("log.write", stream=stream) as span:
+        for backend in get_log_backends():
+            try:
+                backend.write(stream, headers, row)
+            except Exception as exc:
+                span.set(backend_error=f"{getattr(backend, 'name', type(backend).__name__)}: {exc}")
+                # One failing backend must not stop the others
 
 
 def log_phase_transition(phase: str, engine, extra_data: dict = None):
-    """Log a phase transition to Google Sheets. Called every time the phase changes."""
+    """Log a phase transition to every backend. Called every time the phase changes.
+    
+    Only builds the row here; the backends do the (batched) writes.
+    """
     session_id = get_session_id()
     timestamp = datetime.now().isoformat()
     
-    spreadsheet = get_gsheets_connection()
-    if not spreadsheet:
-        return  # Logging not configured, skip silently
-    
     try:
         # === SESSION LOG worksheet — one row per phase transition ===
-        session_ws = ensure_worksheet(spreadsheet, "Session Log", [
-            "Session ID", "Timestamp", "Phase", "Essay Version #",
-            "Essay Text", "Scores JSON", "Coaching Message",
-            "Reflection Q", "Reflection A", "Extra"
-        ])
-        
         # Build the row
         essay_num = len(engine.memory.essays)
         latest_essay = engine.memory.get_latest_essay() if engine.memory.essays else ""
@@ -103,15 +287,15 @@ def log_phase_transition(phase: str, engine, extra_data: dict = None):
         reflection_q = ""
         reflection_a = ""
         if engine.memory.reflection_responses:
-            from passage_config import REFLECTION_PROMPTS
+            prompts = engine.bundle.reflection_prompts
             idx = len(engine.memory.reflection_responses) - 1
-            if idx < len(REFLECTION_PROMPTS):
-                reflection_q = REFLECTION_PROMPTS[idx]["question"]
+            if idx < len(prompts):
+                reflection_q = prompts[idx]["question"]
             reflection_a = engine.memory.reflection_responses[-1]
         
         extra = json.dumps(extra_data) if extra_data else ""
         
-        session_ws.append_row([
+        _emit("Session Log", SESSION_LOG_HEADERS, [
             session_id, timestamp, phase, essay_num,
             latest_essay[:5000],  # Truncate to stay within cell limits
             scores_json, coaching_msg[:5000],
@@ -127,20 +311,7 @@ def log_complete_session(engine):
     session_id = get_session_id()
     timestamp = datetime.now().isoformat()
     
-    spreadsheet = get_gsheets_connection()
-    if not spreadsheet:
-        return
-    
     try:
-        summary_ws = ensure_worksheet(spreadsheet, "Session Summary", [
-            "Session ID", "Completed At", "Total Revisions", "Coaching Turns",
-            "Essay Versions", "Reflection Turns",
-            "Initial Essay", "Final Essay",
-            "Initial Scores", "Final Scores",
-            "All Reflections JSON", "All Scores JSON",
-            "Session Complete"
-        ])
-        
         stats = engine.get_session_stats()
         
         initial_essay = engine.memory.essays[0] if engine.memory.essays else ""
@@ -165,13 +336,13 @@ def log_complete_session(engine):
                 })
         
         # Build reflection pairs
-        from passage_config import REFLECTION_PROMPTS
+        prompts = engine.bundle.reflection_prompts
         reflections = []
         for i, resp in enumerate(engine.memory.reflection_responses):
-            q = REFLECTION_PROMPTS[i]["question"] if i < len(REFLECTION_PROMPTS) else f"Q{i+1}"
+            q = prompts[i]["question"] if i < len(prompts) else f"Q{i+1}"
             reflections.append({"question": q, "response": resp})
         
-        summary_ws.append_row([
+        _emit("Session Summary", SESSION_SUMMARY_HEADERS, [
             session_id, timestamp, stats["revisions"], stats["coaching_turns"],
             stats["essay_versions"], stats["reflection_turns"],
             initial_essay[:5000], final_essay[:5000],
@@ -186,10 +357,11 @@ def log_complete_session(engine):
 
 def build_export_json(engine) -> str:
     """Build a complete session export as JSON string for local download."""
-    from passage_config import REFLECTION_PROMPTS
+    prompts = engine.bundle.reflection_prompts
     
     session_data = {
         "session_id": get_session_id(),
+        "passage_id": engine.bundle.passage_id,
         "export_timestamp": datetime.now().isoformat(),
         "session_stats": engine.get_session_stats(),
         "essays": [],
@@ -199,6 +371,7 @@ def build_export_json(engine) -> str:
         "messages": []
     }
     
+    # Full texts: the compact in-memory form stops at the export
     for i, essay in enumerate(engine.memory.essays):
         session_data["essays"].append({
             "version": i + 1,
@@ -217,7 +390,7 @@ def build_export_json(engine) -> str:
     
     for i, resp in enumerate(engine.memory.reflection_responses):
         session_data["reflection_responses"].append({
-            "question": REFLECTION_PROMPTS[i]["question"] if i < len(REFLECTION_PROMPTS) else f"Q{i+1}",
+            "question": prompts[i]["question"] if i < len(prompts) else f"Q{i+1}",
             "response": resp
         })
     
@@ -0,0 +1,395 @@
+"""
+Session Snapshots for Socratic Writing Tutor
+
+A server restart or a dropped websocket used to lose every in-flight
+SocraticEngine: the student started over, and redoing their work meant
+paying for the same model calls again.
+
+Each session's state (engine phase, essays, scores, coaching history,
+reflection progress, model_mode_used, token usage, plus the app's own UI
+state) is now checkpointed on every phase transition and restored when the
+session ID is presented again (?session=<id>).
+
+Format (version 1): a file is a 5-byte header (b"SWTS" + format version)
+followed by frames
+
+    length (u32) | crc32 (u32) | zlib(encode(frame))
+
+encode() is a small typed binary encoding (varints, length-prefixed UTF-8)
+of None/bool/int/float/str/list/dict. The first frame is a full state;
+later frames hold only what changed: {"set": {path: value}, "append":
+{path: [items]}} for the append-only lists (essays, scores, coaching,
+reflections, chat messages). Essays are stored in EssayVersions' delta form,
+so a revision costs roughly the size of the edit. After COMPACT_AFTER frames
+the file is rewritten as one full frame. Restoring replays the frames and
+skips a torn last frame.
+
+Settings (environment variables):
+- SESSION_SNAPSHOT_DIR   where snapshots are kept (default "session_snapshots")
+- SESSION_SNAPSHOT_TTL   days before an untouched snapshot is deleted (default 7)
+"""
+
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from core_engine import SocraticEngine
+from essay_versions import EssayVersions
+from token_budget import UsageLedger
+
+MAGIC = b"SWTS"
+FORMAT_VERSION = 1
+COMPACT_AFTER = 32
+
+_FRAME = struct.Struct(">II")
+_FLOAT = struct.Struct(">d")
+
+# Lists that only ever grow within a session; delta frames carry their new tail
+APPEND_ONLY = ("memory.essays", "memory.scores_history", "memory.coaching_history",
+               "memory.reflection_responses", "ui.messages")
+
+
+class SnapshotError(ValueError):
+    """Data that isn't a readable snapshot of a supported version."""
+
+
+# --- binary encoding --------------------------------------------------------
+
+def _varint(n: int, out: bytearray):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _encode(value, out: bytearray):
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    elif isinstance(value, int):
+        out += b"i"
+        _varint(value * 2 if value >= 0 else -value * 2 - 1, out)  # zigzag
+    elif isinstance(value, float):
+        out += b"f" + _FLOAT.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out += b"s"
+        _varint(len(data), out)
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out += b"l"
+        _varint(len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out += b"d"
+        _varint(len(value), out)
+        for key, item in value.items():
+            _encode(str(key), out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"can't snapshot {type(value).__name__}")
+
+
+def encode(value) -> bytes:
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def decode(data: bytes):
+    def varint(pos):
+        shift = result = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+
+    def value(pos):
+        tag = data[pos:pos + 1]
+        pos += 1
+        if tag == b"N":
+            return None, pos
+        if tag == b"T":
+            return True, pos
+        if tag == b"F":
+            return False, pos
+        if tag == b"i":
+            n, pos = varint(pos)
+            return (n >> 1) ^ -(n & 1), pos
+        if tag == b"f":
+            return _FLOAT.unpack_from(data, pos)[0], pos + 8
+        if tag == b"s":
+            n, pos = varint(pos)
+            return data[pos:pos + n].decode("utf-8"), pos + n
+        if tag in (b"l", b"d"):
+            n, pos = varint(pos)
+            items = []
+            for _ in range(n * (2 if tag == b"d" else 1)):
+                item, pos = value(pos)
+                items.append(item)
+            if tag == b"d":
+                return dict(zip(items[::2], items[1::2])), pos
+            return items, pos
+        raise SnapshotError(f"unknown tag {tag!r}")
+
+    try:
+        result, end = value(0)
+    except (IndexError, struct.error, UnicodeDecodeError) as exc:
+        raise SnapshotError(f"truncated snapshot: {exc}") from exc
+    if end != len(data):
+        raise SnapshotError("trailing bytes in snapshot")
+    return result
+
+
+def pack_frame(frame: dict) -> bytes:
+    payload = zlib.compress(encode(frame), 6)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_frames(data: bytes):
+    """Frames of a snapshot file; stops quietly at a torn or corrupt tail."""
+    if len(data) < 5 or data[:4] != MAGIC:
+        raise SnapshotError("not a session snapshot")
+    if data[4] != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot version {data[4]}")
+    pos = 5
+    while pos + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, pos)
+        payload = data[pos + _FRAME.size:pos + _FRAME.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        yield decode(zlib.decompress(payload))
+        pos += _FRAME.size + length
+
+
+def pack_snapshot(state: dict) -> bytes:
+    """One self-contained snapshot (header + a single full frame)."""
+    return MAGIC + bytes([FORMAT_VERSION]) + pack_frame({"full": state})
+
+
+def unpack_snapshot(data: bytes) -> dict:
+    """The state a snapshot file describes, after replaying every frame."""
+    state = None
+    for frame in iter_frames(data):
+        if "full" in frame:
+            state = frame["full"]
+        elif state is not None:
+            state = apply_delta(state, frame)
+    if state is None:
+        raise SnapshotError("snapshot has no full frame")
+    return state
+
+
+# --- state <-> engine -------------------------------------------------------
+
+def capture(engine: SocraticEngine, ui: dict = None) -> dict:
+    """Everything needed to resume a session, as plain data (copies, not live lists)."""
+    memory = engine.memory
+    return {
+        "passage_id": engine.bundle.passage_id,
+        "phase": engine.current_phase,
+        "saved_at": time.time(),
+        "memory": {
+            "essays": memory.essays.encode(),
+            "scores_history": list(memory.scores_history),
+            "coaching_history": list(memory.coaching_history),
+            "reflection_turn": memory.reflection_turn,
+            "reflection_responses": list(memory.reflection_responses),
+            "coaching_turns": memory.coaching_turns,
+            "max_coaching_turns": memory.max_coaching_turns,
+            "model_mode_used": sorted(memory.model_mode_used),
+            "previous_scores": dict(memory.previous_scores),
+        },
+        "usage": engine.usage.summary(),
+        "ui": {key: list(value) if isinstance(value, list) else value for key, value in (ui or {}).items()},
+    }
+
+
+def rebuild(state: dict) -> SocraticEngine:
+    """A SocraticEngine in the captured state (no model calls)."""
+    engine = SocraticEngine(state["passage_id"])
+    engine.current_phase = state["phase"]
+    saved = state["memory"]
+    memory = engine.memory
+    memory.essays = EssayVersions.decode(saved["essays"])
+    memory.scores_history = list(saved["scores_history"])
+    memory.coaching_history = list(saved["coaching_history"])
+    memory.reflection_turn = saved["reflection_turn"]
+    memory.reflection_responses = list(saved["reflection_responses"])
+    memory.coaching_turns = saved["coaching_turns"]
+    memory.max_coaching_turns = saved["max_coaching_turns"]
+    memory.model_mode_used = set(saved["model_mode_used"])
+    memory.previous_scores = dict(saved["previous_scores"])
+    if "usage" in state:  # snapshots from before token accounting have none
+        engine.usage = engine.validator.usage = UsageLedger.from_summary(state["usage"])
+    return engine
+
+
+# --- deltas -----------------------------------------------------------------
+
+def _get(state: dict, path: str):
+    for key in path.split("."):
+        state = state.get(key) if isinstance(state, dict) else None
+    return state
+
+
+def _flatten(state: dict) -> dict:
+    """path -> value, one level into "memory" and "ui"."""
+    flat = {}
+    for key, value in state.items():
+        if key in ("memory", "ui") and isinstance(value, dict):
+            for sub, item in value.items():
+                flat[f"{key}.{sub}"] = item
+        else:
+            flat[key] = value
+    return flat
+
+
+def make_delta(previous: dict, state: dict) -> dict:
+    """Frame turning previous into state (empty "set"/"append" if nothing changed)."""
+    old = _flatten(previous)
+    changed, appended = {}, {}
+    for path, value in _flatten(state).items():
+        before = old.get(path)
+        if path == "saved_at" or value == before:
+            continue
+        if (path in APPEND_ONLY and isinstance(before, list)
+                and len(value) > len(before) and value[:len(before)] == before):
+            appended[path] = value[len(before):]
+        else:
+            changed[path] = value
+    return {"set": changed, "append": appended, "saved_at": state.get("saved_at")}
+
+
+def apply_delta(state: dict, frame: dict) -> dict:
+    state = {k: dict(v) if isinstance(v, dict) else v for k, v in state.items()}
+    for path, value in frame.get("set", {}).items():
+        head, _, sub = path.partition(".")
+        if sub:
+            state.setdefault(head, {})[sub] = value
+        else:
+            state[head] = value
+    for path, items in frame.get("append", {}).items():
+        head, sub = path.split(".", 1)
+        state[head][sub] = list(state[head].get(sub) or []) + list(items)
+    if frame.get("saved_at") is not None:
+        state["saved_at"] = frame["saved_at"]
+    return state
+
+
+# --- local store ------------------------------------------------------------
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class SnapshotStore:
+    """One append-only snapshot file per session in a local directory."""
+
+    def __init__(self, directory: str = "session_snapshots", ttl_days: float = 7):
+        self.directory = directory
+        self.ttl = ttl_days * 86400
+        self._lock = threading.Lock()
+        self._last = {}  # session_id -> (state last written, frames in file)
+        self.stats = {"full_writes": 0, "delta_writes": 0, "skipped": 0, "bytes_written": 0,
+                      "restores": 0, "restore_ms": 0.0}
+        os.makedirs(directory, exist_ok=True)
+        self.prune()
+
+    def _path(self, session_id: str) -> str:
+        if not _SAFE_ID.match(session_id or ""):
+            raise KeyError(session_id)
+        return os.path.join(self.directory, f"{session_id}.snap")
+
+    def save(self, session_id: str, state: dict) -> int:
+        """Checkpoint state; returns bytes written (0 if nothing changed)."""
+        path = self._path(session_id)
+        with self._lock:
+            previous, frames = self._last.get(session_id, (None, 0))
+            if previous is not None and frames < COMPACT_AFTER:
+                delta = make_delta(previous, state)
+                if not delta["set"] and not delta["append"]:
+                    self.stats["skipped"] += 1
+                    return 0
+                data = pack_frame(delta)
+                with open(path, "ab") as f:
+                    f.write(data)
+                self.stats["delta_writes"] += 1
+                frames += 1
+            else:
+                # First write by this process, or time to compact: one full frame
+                data = pack_snapshot(state)
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                self.stats["full_writes"] += 1
+                frames = 1
+            self.stats["bytes_written"] += len(data)
+            self._last[session_id] = (state, frames)
+            return len(data)
+
+    def load(self, session_id: str):
+        """The saved state for session_id, or None."""
+        try:
+            path = self._path(session_id)
+            with open(path, "rb") as f:
+                data = f.read()
+        except (KeyError, OSError):
+            return None
+        started = time.perf_counter()
+        try:
+            state = unpack_snapshot(data)
+        except (SnapshotError, zlib.error):
+            return None
+        with self._lock:
+            self._last[session_id] = (state, COMPACT_AFTER)  # next save rewrites it compactly
+            self.stats["restores"] += 1
+            self.stats["restore_ms"] += (time.perf_counter() - started) * 1000
+        return state
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._last.pop(session_id, None)
+        try:
+            os.remove(self._path(session_id))
+        except (KeyError, OSError):
+            pass
+
+    def prune(self):
+        """Delete snapshots untouched for longer than the TTL."""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Process-wide store over SESSION_SNAPSHOT_DIR."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                ttl = float(os.environ.get("SESSION_SNAPSHOT_TTL", 7))
+            except ValueError:
+                ttl = 7
+            _store = SnapshotStore(os.environ.get("SESSION_SNAPSHOT_DIR", "session_snapshots"), ttl)
+        return _store
+
@@ -0,0 +1,236 @@
+"""
+Session State Store for Socratic Writing Tutor
+
+All tutoring state used to live only in st.session_state.engine, which pins a
+student to one Python process. The app now reads and writes each session's
+state through a SessionStateStore, so any replica behind a load balancer can
+serve any turn:
+
+- at the start of a run the app checks the stored version and, if another
+  replica (or another tab) moved the session on, rebuilds the engine from it
+- at the end of a run it saves the new state, expecting the version it
+  started from (optimistic versioning); if someone else saved in between,
+  VersionConflict is raised and the stored state wins
+
+State is the plain dict from session_snapshot.capture(), serialized with the
+snapshot format (session_snapshot.pack_snapshot).
+
+Backends:
+- RedisSessionStore     shared, for several replicas (any Redis-protocol
+                        server); the version check and write are one atomic
+                        Lua script
+- InProcessSessionStore same semantics in a dict; a fake for tests, or for
+                        several app instances in one process
+- LocalSessionStore     single box: session_snapshot's incremental files
+                        (the default)
+
+Settings (environment variables):
+- SESSION_STORE        "redis://host:6379/0", "memory", or unset for local files
+- SESSION_STORE_TTL    seconds a shared session is kept after its last save (default 7 days)
+"""
+
+import os
+import threading
+
+from session_snapshot import SnapshotError, get_snapshot_store, pack_snapshot, unpack_snapshot
+
+# Redis client - optional, only needed for a shared store
+try:
+    import redis
+    REDIS_AVAILABLE = True
+    STORE_ERRORS = (OSError, redis.RedisError)
+except ImportError:
+    REDIS_AVAILABLE = False
+    STORE_ERRORS = (OSError,)
+
+DEFAULT_TTL = 7 * 86400
+
+
+class VersionConflict(Exception):
+    """The session was saved by someone else since it was loaded."""
+
+    def __init__(self, session_id: str, expected: int, current: int):
+        super().__init__(f"session {session_id}: expected version {expected}, store has {current}")
+        self.session_id = session_id
+        self.expected = expected
+        self.current = current
+
+
+class SessionStateStore:
+    """Interface for session state backends. Versions start at 1; 0 means "new"."""
+
+    name = "store"
+    shared = False  # True if other processes may write the same sessions
+
+    def load(self, session_id: str):
+        """(version, state) for session_id, or None."""
+        raise NotImplementedError
+
+    def version(self, session_id: str) -> int:
+        """Current version (0 if unknown); cheaper than load() where possible."""
+        stored = self.load(session_id)
+        return stored[0] if stored else 0
+
+    def save(self, session_id: str, state: dict, expected_version: int) -> int:
+        """Store state if the stored version is still expected_version; returns the new version.
+
+        Raises VersionConflict otherwise.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class InProcessSessionStore(SessionStateStore):
+    """Dict-backed store with the same versioning as Redis (a fake for tests)."""
+
+    name = "memory"
+    shared = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> (version, packed snapshot)
+
+    def load(self, session_id: str):
+        with self._lock:
+            stored = self._sessions.get(session_id)
+        if stored is None:
+            return None
+        return stored[0], unpack_snapshot(stored[1])
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            return self._sessions.get(session_id, (0, None))[0]
+
+    def save(self, session_id: str, state: dict, expected_version: int) -> int:
+        data = pack_snapshot(state)
+        with self._lock:
+            current = self._sessions.get(session_id, (0, None))[0]
+            if current != expected_version:
+                raise VersionConflict(session_id, expected_version, current)
+            self._sessions[session_id] = (current + 1, data)
+            return current + 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+# Compare-and-set in one round trip: returns the new version, or -(current + 1) on conflict
+_SAVE_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then
+    return -(current + 1)
+end
+redis.call('HSET', KEYS[1], 'version', current + 1, 'state', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return current + 1
+"""
+
+
+class RedisSessionStore(SessionStateStore):
+    """Shared store on a Redis-protocol server: one hash per session."""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, ttl: int = DEFAULT_TTL, prefix: str = "swt:session:"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("SESSION_STORE is a redis:// URL but the redis package isn't installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._save = self.client.register_script(_SAVE_SCRIPT)
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def load(self, session_id: str):
+        version, data = self.client.hmget(self._key(session_id), "version", "state")
+        if version is None or data is None:
+            return None
+        try:
+            return int(version), unpack_snapshot(data)
+        except SnapshotError:
+            return None
+
+    def version(self, session_id: str) -> int:
+        return int(self.client.hget(self._key(session_id), "version") or 0)
+
+    def save(self, session_id: str, state: dict, expected_version: int) -> int:
+        result = int(self._save(keys=[self._key(session_id)],
+                                args=[expected_version, pack_snapshot(state), self.ttl]))
+        if result < 0:
+            raise VersionConflict(session_id, expected_version, -result - 1)
+        return result
+
+    def delete(self, session_id: str):
+        self.client.delete(self._key(session_id))
+
+
+class LocalSessionStore(SessionStateStore):
+    """Single-process store over session_snapshot's incremental snapshot files.
+
+    Versions are kept in the state itself; they're only checked against what
+    this process last saved or loaded.
+    """
+
+    name = "local"
+
+    def __init__(self, snapshots=None):
+        self.snapshots = snapshots or get_snapshot_store()
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def load(self, session_id: str):
+        state = self.snapshots.load(session_id)
+        if state is None:
+            return None
+        version = state.get("version", 0)
+        with self._lock:
+            self._versions[session_id] = version
+        return version, state
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            if session_id in self._versions:
+                return self._versions[session_id]
+        return super().version(session_id)
+
+    def save(self, session_id: str, state: dict, expected_version: int) -> int:
+        with self._lock:
+            current = self._versions.get(session_id, expected_version)
+            if current != expected_version:
+                raise VersionConflict(session_id, expected_version, current)
+            self._versions[session_id] = expected_version + 1
+        self.snapshots.save(session_id, dict(state, version=expected_version + 1))
+        return expected_version + 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._versions.pop(session_id, None)
+        self.snapshots.delete(session_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStateStore:
+    """Process-wide store chosen by SESSION_STORE."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            setting = os.environ.get("SESSION_STORE", "")
+            if setting.startswith(("redis://", "rediss://", "unix://")):
+                try:
+                    ttl = int(os.environ.get("SESSION_STORE_TTL", DEFAULT_TTL))
+                except ValueError:
+                    ttl = DEFAULT_TTL
+                _store = RedisSessionStore(setting, ttl)
+            elif setting == "memory":
+                _store = InProcessSessionStore()
+            else:
+                _store = LocalSessionStore()
+        return _store
@@ -0,0 +1,310 @@
+"""
+Structured Output for Socratic Writing Tutor
+
+Scoring and the AI draft check used to ask for "ONLY valid JSON" in free text
+and dig it out with find('{') / rfind('}'). Any slip silently became a flat
+score of 2 ("Unable to parse") — which also sent coaching to the wrong
+dimension, since every dimension then tied for lowest.
+
+Both calls now use tool use: the model must call record_scores /
+record_draft_check, whose input is constrained by a JSON schema, so the reply
+arrives already parsed. Every reply is still validated here against
+DIMENSION_ORDER, the score range and the check statuses. If a model answers
+in text anyway, repair_json() fixes the usual slips locally (code fences,
+prose around the object, trailing commas, smart quotes, Python literals,
+truncated closers), so a malformed reply never costs a second call. A reply
+that still can't be used raises SchemaError; scoring then answers with the
+same local estimate as during an outage, never a made-up score.
+
+get_parse_stats() reports, per task, how replies were obtained:
+tool (schema-constrained), text (clean JSON in text), repaired, failed.
+"""
+
+import json
+import re
+import threading
+
+from passage_config import DIMENSION_ORDER
+
+OBJECTIVES = ("POSITION", "EVIDENCE", "REASONING", "STRUCTURE", "TONE")
+STATUSES = ("present", "weak", "missing")
+
+
+class SchemaError(ValueError):
+    """A reply that can't be turned into a valid result."""
+
+
+SCORES_TOOL = {
+    "name": "record_scores",
+    "description": "Record the rubric score (1-4) and a brief rationale for every dimension.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            dim: {
+                "type": "object",
+                "properties": {
+                    "score": {"type": "integer", "minimum": 1, "maximum": 4},
+                    "rationale": {"type": "string"},
+                },
+                "required": ["score", "rationale"],
+            }
+            for dim in DIMENSION_ORDER
+        },
+        "required": list(DIMENSION_ORDER),
+    },
+}
+
+_CHECK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "objective": {"type": "string", "enum": list(OBJECTIVES)},
+        "status": {"type": "string", "enum": list(STATUSES)},
+        "tip": {"type": "string"},
+    },
+    "required": ["objective", "status", "tip"],
+}
+
+DRAFT_CHECK_TOOL = {
+    "name": "record_draft_check",
+    "description": "Record the readiness check for the student's draft.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "overall_ready": {"type": "boolean"},
+            "checks": {"type": "array", "items": _CHECK_SCHEMA},
+            "summary": {"type": "string"},
+            "mechanics": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"label": {"type": "string"}, "items": {"type": "array", "items": {"type": "string"}}},
+                },
+            },
+        },
+        "required": ["overall_ready", "checks", "summary"],
+    },
+}
+
+DRAFT_RECHECK_TOOL = {
+    "name": "record_draft_recheck",
+    "description": "Record updated checks for the objectives you were asked to re-check.",
+    "input_schema": {
+        "type": "object",
+        "properties": {"checks": {"type": "array", "items": _CHECK_SCHEMA}},
+        "required": ["checks"],
+    },
+}
+
+
+def tool_choice(tool: dict) -> dict:
+    """Force the model to answer through this tool."""
+    return {"type": "tool", "name": tool["name"]}
+
+
+# --- local repair -----------------------------------------------------------
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_DANGLING_KEY = re.compile(r',?\s*"[^"]*"\s*:\s*$')
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = "“”"
+
+
+def _outside_strings(text: str, fix) -> str:
+    """Apply fix to the text between string literals; string contents stay as they are.
+
+    Smart double quotes outside a string open one (and then close it too),
+    so they come out as plain quotes; inside a plain-quoted string they are
+    just text.
+    """
+    out = []
+    start = 0
+    closers = None  # quotes that end the current string, None outside one
+    escaped = False
+    for i, ch in enumerate(text):
+        if closers:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch in closers:
+                out.append(text[start:i] + '"')
+                start = i + 1
+                closers = None
+        elif ch == '"' or ch in _SMART_QUOTES:
+            out.append(fix(text[start:i]) + '"')
+            start = i + 1
+            closers = '"' if ch == '"' else '"' + _SMART_QUOTES
+    tail = text[start:]
+    out.append(tail if closers else fix(tail))
+    return "".join(out)
+
+
+def _fix_literals(segment: str) -> str:
+    return _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group(1)], segment)
+
+
+def _strip_trailing_commas(segment: str) -> str:
+    return _TRAILING_COMMA.sub(r"\1", segment)
+
+
+def _close_brackets(text: str) -> str:
+    """Cut text after its first complete top-level value, or close what's open."""
+    stack = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[:i + 1]
+    if in_string:
+        text += '"'
+    text = _DANGLING_KEY.sub("", text.rstrip()).rstrip().rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str):
+    """Parse a JSON object out of a text reply. Returns (obj, repaired).
+
+    Raises SchemaError if nothing usable is there.
+    """
+    cleaned = _FENCE.sub("", text.strip())
+    start = cleaned.find("{")
+    if start < 0:
+        raise SchemaError("no JSON object in reply")
+    cleaned = cleaned[start:]
+    try:
+        return json.JSONDecoder().raw_decode(cleaned)[0], False
+    except json.JSONDecodeError:
+        pass
+    fixed = _outside_strings(cleaned, _fix_literals)
+    fixed = _outside_strings(_close_brackets(fixed), _strip_trailing_commas)
+    try:
+        return json.JSONDecoder().raw_decode(fixed)[0], True
+    except json.JSONDecodeError as exc:
+        raise SchemaError(f"unrepairable JSON: {exc}") from exc
+
+
+# --- schema validation ------------------------------------------------------
+
+def validate_scores(data) -> dict:
+    """Normalize a scores object to {dim: {"score": 1-4, "rationale": str}}."""
+    if not isinstance(data, dict):
+        raise SchemaError("scores must be an object")
+    if isinstance(data.get("scores"), dict) and not any(dim in data for dim in DIMENSION_ORDER):
+        data = data["scores"]
+    scores = {}
+    for dim in DIMENSION_ORDER:
+        entry = data.get(dim)
+        if isinstance(entry, (int, float, str)):
+            entry = {"score": entry}
+        if not isinstance(entry, dict) or "score" not in entry:
+            raise SchemaError(f"missing score for {dim}")
+        try:
+            score = int(round(float(entry["score"])))
+        except (TypeError, ValueError) as exc:
+            raise SchemaError(f"non-numeric score for {dim}") from exc
+        scores[dim] = {"score": min(4, max(1, score)), "rationale": str(entry.get("rationale") or "").strip()}
+    return scores
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "1")
+    return bool(value)
+
+
+def validate_draft_check(data, partial: bool = False) -> dict:
+    """Normalize a draft check. partial=True accepts any subset of objectives."""
+    if not isinstance(data, dict) or not isinstance(data.get("checks"), list):
+        raise SchemaError("draft check needs a checks list")
+    checks = []
+    for check in data["checks"]:
+        if not isinstance(check, dict):
+            continue
+        objective = str(check.get("objective", "")).strip().upper()
+        status = str(check.get("status", "")).strip().lower()
+        if objective not in OBJECTIVES or status not in STATUSES:
+            continue
+        checks.append({"objective": objective, "status": status, "tip": str(check.get("tip") or "")})
+    result = {"checks": checks}
+    if partial:
+        return result
+    missing = set(OBJECTIVES) - {c["objective"] for c in checks}
+    if missing:
+        raise SchemaError(f"missing objectives: {', '.join(sorted(missing))}")
+    if "overall_ready" not in data:
+        raise SchemaError("missing overall_ready")
+    result["overall_ready"] = _as_bool(data["overall_ready"])
+    result["summary"] = str(data.get("summary") or "")
+    mechanics = data.get("mechanics")
+    if isinstance(mechanics, list):
+        result["mechanics"] = [
+            {"label": str(m.get("label", "")), "items": [str(i) for i in m.get("items") or []]}
+            for m in mechanics if isinstance(m, dict)
+        ]
+    return result
+
+
+# --- parse + metrics --------------------------------------------------------
+
+_stats_lock = threading.Lock()
+PARSE_STATS = {}  # task -> {"tool", "text", "repaired", "failed"}
+
+
+def _count(task: str, outcome: str):
+    with _stats_lock:
+        counts = PARSE_STATS.setdefault(task, {"tool": 0, "text": 0, "repaired": 0, "failed": 0})
+        counts[outcome] += 1
+
+
+def parse_reply(task: str, payload, validate, **kwargs) -> dict:
+    """Turn a reply (tool input dict or text) into a validated result.
+
+    Counts the outcome under task; raises SchemaError on failure.
+    """
+    try:
+        if isinstance(payload, dict):
+            outcome = "tool"
+            data = payload
+        else:
+            data, repaired = repair_json(payload or "")
+            outcome = "repaired" if repaired else "text"
+        result = validate(data, **kwargs)
+    except SchemaError:
+        _count(task, "failed")
+        raise
+    _count(task, outcome)
+    return result
+
+
+def reply_payload(message):
+    """A Messages reply as the tool input (if the model used a tool) or its text."""
+    for block in message.content:
+        if getattr(block, "type", None) == "tool_use":
+            return block.input
+    return "".join(getattr(block, "text", "") or "" for block in message.content)
+
+
+def get_parse_stats() -> dict:
+    """Per-task outcome counts plus failure rate."""
+    with _stats_lock:
+        stats = {task: dict(counts) for task, counts in PARSE_STATS.items()}
+    for counts in stats.values():
+        total = sum(counts.values())
+        counts["total"] = total
+        counts["failure_rate"] = round(counts["failed"] / total, 3) if total else 0.0
+    return stats
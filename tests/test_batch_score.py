@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import batch_score
+
+
+def write_lines(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+
+def test_only_scored_rows_count_as_done(tmp_path):
+    output = tmp_path / "scores.jsonl"
+    write_lines(output, [
+        {"id": "a", "scores": {}, "parse_failed": False},
+        {"id": "b", "error": "UpstreamUnavailable: retries_exhausted"},
+        {"id": "c", "error": "SchemaError: no JSON object in reply", "parse_failed": True},
+        {"id": 4, "scores": {}},
+    ])
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "torn", "sco')
+    assert batch_score.completed_ids(str(output)) == {"a", "4"}
+
+
+@pytest.mark.parametrize("batch_api", [False, True])
+def test_duplicate_ids_rejected_before_scoring(tmp_path, capsys, batch_api):
+    essays = tmp_path / "essays.jsonl"
+    write_lines(essays, [{"id": "s1", "essay": "First."}, {"id": "s2", "essay": "Second."},
+                         {"id": "s1", "essay": "Again."}])
+    output = tmp_path / "scores.jsonl"
+    argv = [str(essays), str(output)] + (["--batch-api"] if batch_api else [])
+    assert batch_score.main(argv) == 2
+    assert "duplicate essay IDs: s1" in capsys.readouterr().err
+    assert not output.exists()
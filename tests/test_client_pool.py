@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+
+import client_pool
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    for name in ("_client", "_client_key", "_async_client", "_async_client_key"):
+        monkeypatch.setattr(client_pool, name, None)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "key-one")
+
+
+def closed(client, wait=1.0):
+    """Whether client's connections are closed (async closes land on the shared loop)."""
+    deadline = time.monotonic() + wait
+    while not client._client.is_closed and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return client._client.is_closed
+
+
+def test_replaced_client_closes_after_its_last_lease(monkeypatch):
+    with client_pool.lease() as old:
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "key-two")
+        new = client_pool.get_client()
+        assert new is not old
+        assert not closed(old, wait=0)
+    assert closed(old) and not closed(new, wait=0)
+
+
+def test_replaced_async_client_closes_after_its_last_lease(monkeypatch):
+    before = client_pool.get_pool_metrics()["clients_closed"]
+
+    async def call_spanning_a_key_change():
+        async with client_pool.async_lease() as old:
+            monkeypatch.setenv("ANTHROPIC_API_KEY", "key-two")
+            new = client_pool.get_async_client()
+            await asyncio.sleep(0.02)
+            assert not old._client.is_closed
+        return old, new
+
+    old, new = client_pool.run_async(call_spanning_a_key_change())
+    assert new is not old
+    assert closed(old) and not closed(new, wait=0)
+    assert client_pool.get_pool_metrics()["clients_closed"] == before + 1
+
+
+def test_unleased_async_client_closes_when_replaced(monkeypatch):
+    old = client_pool.get_async_client()
+    assert client_pool.get_async_client() is old
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "key-two")
+    new = client_pool.get_async_client()
+    assert new is not old
+    assert closed(old) and not closed(new, wait=0)
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+import pytest
+
+import core_engine
+
+
+async def streaming(sink):
+    for text in ("Why ", "does ", "that ", "matter?"):
+        sink(text)
+        await asyncio.sleep(0.005)
+    return "reply"
+
+
+def test_shared_loop_hands_over_every_delta_in_order():
+    deltas = []
+    assert core_engine._run_on_shared_loop(streaming, deltas.append) == "reply"
+    assert deltas == ["Why ", "does ", "that ", "matter?"]
+
+
+def test_shared_loop_returns_as_soon_as_the_run_ends():
+    started = time.perf_counter()
+    for _ in range(5):
+        core_engine._run_on_shared_loop(streaming, lambda text: None)
+    # Four 5 ms sleeps per run; no polling interval on top
+    assert (time.perf_counter() - started) / 5 < 0.045
+
+
+def test_shared_loop_raises_the_run_error_after_its_deltas():
+    async def failing(sink):
+        sink("partial")
+        raise ValueError("upstream broke")
+
+    deltas = []
+    with pytest.raises(ValueError):
+        core_engine._run_on_shared_loop(failing, deltas.append)
+    assert deltas == ["partial"]
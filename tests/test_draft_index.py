@@ -0,0 +1,140 @@
+from collections import Counter
+
+import pytest
+
+from core_engine import PreSubmissionValidator
+from draft_index import DraftIndex, split_sentences
+from passage_registry import get_bundle
+
+# One student's "Check my draft" presses, in order
+DRAFTS = [
+    "Pineapple on pizza is a choice many people make. It tastes sweet and it is popular.",
+    "I believe pineapple belongs on pizza. Pineapple on pizza is a choice many people make. "
+    "It tastes sweet and it is popular.",
+    "I believe pineapple belongs on pizza. Pineapple on pizza is a choice many people make. "
+    "It tastes sweet and it is popular because the sugar balances the salty ham.",
+    "I believe pineapple belongs on pizza. Pineapple on pizza is a choice many people make.\n\n"
+    "It tastes sweet and it is popular because the sugar balances the salty ham. "
+    "Sam Panopoulos first served it in 1962.",
+    "I believe pineapple belongs on pizza. Sam Panopoulos first served it in 1962.\n\n"
+    "Pineapple on pizza is a choice many people make. It is popular lol.",
+    "I believe pineapple belongs on pizza. Sam Panopoulos first served it in 1962.\n\n"
+    "Pineapple on pizza is a choice many people make. It is popular lol. It is popular lol.",
+    "I believe pineapple belongs on pizza. Sam Panopoulos first served it in 1962 in Canada.\n\n"
+    "This shows that pineapple on pizza is a choice many people make. It is very popular.",
+    "I believe pineapple belongs on pizza. Sam Panopoulos first served it in 1962 in Canada.\n\n"
+    "This shows that pineapple on pizza is a choice many people make. It is very popular.",
+]
+
+
+def statuses(result: dict) -> dict:
+    return {c["objective"]: c["status"] for c in result["checks"]}
+
+
+def full_check(essay: str) -> dict:
+    """What a validator with no history says about essay."""
+    return PreSubmissionValidator()._heuristic_check(essay)
+
+
+def test_markers_from_the_index_match_a_full_scan():
+    lexicon = get_bundle().lexicon
+    index = DraftIndex(lexicon.found)
+    for draft in DRAFTS:
+        diff = index.update(draft)
+        found = lexicon.found(draft)
+        assert {k: set(v) for k, v in diff.markers.items() if v} == {k: set(v) for k, v in found.items() if v}
+
+
+def test_diff_reports_exactly_the_added_and_removed_sentences():
+    index = DraftIndex(get_bundle().lexicon.found)
+    previous = []
+    for draft in DRAFTS:
+        diff = index.update(draft)
+        current = split_sentences(draft)
+        assert Counter(s for s, _ in diff.added) == Counter(current) - Counter(previous)
+        assert Counter(s for s, _ in diff.removed) == Counter(previous) - Counter(current)
+        assert diff.first == (previous == [])
+        previous = current
+    assert not diff.changed and diff.change_ratio == 0.0  # the last draft is a resubmission
+
+
+def test_only_new_sentences_are_analysed():
+    calls = []
+    index = DraftIndex(lambda sentence: calls.append(sentence) or {})
+    index.update(DRAFTS[0])
+    index.update(DRAFTS[1])
+    assert calls == split_sentences(DRAFTS[0]) + ["I believe pineapple belongs on pizza"]
+    assert index.stats["sentences_reused"] == len(split_sentences(DRAFTS[0]))
+
+
+def test_structure_change_on_reorder_and_new_paragraph():
+    index = DraftIndex(lambda sentence: {})
+    index.update("One two. Three four.")
+    assert index.update("Three four. One two.").structure_changed
+    assert index.update("Three four.\n\nOne two.").structure_changed
+    assert not index.update("Three  four.\n\nOne two.").structure_changed
+
+
+def test_local_revalidation_matches_a_full_check(monkeypatch):
+    validator = PreSubmissionValidator()
+
+    def unavailable(essay):
+        raise RuntimeError("no model in tests")
+    monkeypatch.setattr(validator, "_ai_check", unavailable)
+    for draft in DRAFTS:
+        result = validator.validate(draft)
+        expected = full_check(draft)
+        assert result["tier"] in ("local", "repeat")
+        assert statuses(result) == statuses(expected)
+        assert result["overall_ready"] == expected["overall_ready"]
+        assert result["word_count"] == expected["word_count"]
+
+
+@pytest.mark.parametrize("reason", ["borderline", ""])
+def test_incremental_revalidation_matches_a_full_check(monkeypatch, reason):
+    # The "model" answers as the full heuristic would, so an incremental
+    # result that kept a stale objective shows up as a mismatch
+    validator = PreSubmissionValidator()
+    current = {}
+    rechecked = []
+
+    def ai_check(essay):
+        return dict(full_check(essay), used_ai=True)
+
+    def ai_recheck(diff, previous, objectives):
+        rechecked.append(objectives)
+        return {c["objective"]: c for c in full_check(current["essay"])["checks"] if c["objective"] in objectives}
+
+    monkeypatch.setattr(validator, "_ai_check", ai_check)
+    monkeypatch.setattr(validator, "_ai_recheck", ai_recheck)
+    monkeypatch.setattr(validator, "_escalation_reason", lambda heuristic, diff: "borderline" if diff.first else reason)
+
+    tiers = []
+    for draft in DRAFTS:
+        current["essay"] = draft
+        result = validator.validate(draft)
+        tiers.append(result["tier"])
+        expected = full_check(draft)
+        assert statuses(result) == statuses(expected), draft
+        assert result["overall_ready"] == expected["overall_ready"]
+        assert result["word_count"] == expected["word_count"]
+
+    assert tiers == ["ai"] + ["incremental"] * (len(DRAFTS) - 2) + ["repeat"]
+    assert bool(rechecked) == bool(reason)
+
+
+def test_neutral_edit_rechecks_only_what_it_could_change(monkeypatch):
+    validator = PreSubmissionValidator()
+
+    def unavailable(*args):
+        raise RuntimeError("no model in tests")
+    monkeypatch.setattr(validator, "_ai_check", unavailable)
+    monkeypatch.setattr(validator, "_ai_recheck", unavailable)
+    validator.validate(DRAFTS[6])
+    validator._last_result = dict(validator._last_result, tier="ai")
+    result = validator.validate(DRAFTS[6] + " Many people agree.")
+    assert result["tier"] == "incremental"
+    assert "POSITION" not in result["rechecked"]
+    assert "EVIDENCE" not in result["rechecked"]
+    assert {"STRUCTURE", "TONE"} <= set(result["rechecked"])
+    assert statuses(result) == statuses(full_check(DRAFTS[6] + " Many people agree."))
@@ -0,0 +1,87 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from essay_versions import EssayVersions, apply_ops, decode_versions, diff_ops, tokenize
+
+DRAFTS = [
+    "Pineapple belongs on pizza. It is sweet.\n\nMany people like it.",
+    "Pineapple belongs on pizza. Its sweetness balances the salty ham.\n\nMany people like it.",
+    "Pineapple belongs on pizza.  Its sweetness balances the salty ham.\n\nSurveys show many people like it.\n",
+    "Pineapple belongs on pizza.  Its sweetness balances the salty ham.\n\nSurveys show many people like it.\n",
+    "Honestly, I changed my mind: fruit has no place on a hot, cheesy slice of bread.",
+    "",
+    "Pineapple is fine.\tSometimes.",
+]
+
+
+def test_tokens_join_back_to_the_exact_text():
+    for text in DRAFTS:
+        assert "".join(tokenize(text)) == text
+
+
+def test_diff_then_apply_rebuilds_the_new_text():
+    for old, new in zip(DRAFTS, DRAFTS[1:]):
+        assert apply_ops(tokenize(old), diff_ops(tokenize(old), tokenize(new))) == new
+
+
+def test_versions_read_back_as_appended():
+    versions = EssayVersions(DRAFTS)
+    assert len(versions) == len(DRAFTS)
+    assert list(versions) == DRAFTS
+    assert [versions[i] for i in range(len(DRAFTS))] == DRAFTS
+    assert versions[-1] == DRAFTS[-1]
+    assert versions[1:4] == DRAFTS[1:4]
+    with pytest.raises(IndexError):
+        versions[len(DRAFTS)]
+
+
+def test_encode_decode_round_trip():
+    versions = EssayVersions(DRAFTS)
+    entries = json.loads(json.dumps(versions.encode()))
+    assert decode_versions(entries) == DRAFTS
+    decoded = EssayVersions.decode(entries)
+    assert list(decoded) == DRAFTS
+    assert decoded.encode() == versions.encode()
+    # Appending after a decode diffs against the right text
+    decoded.append(DRAFTS[0])
+    assert decoded[-1] == DRAFTS[0]
+    assert decode_versions(decoded.encode()) == DRAFTS + DRAFTS[:1]
+
+
+def test_small_edits_stored_as_deltas_rewrites_as_keyframes():
+    entries = EssayVersions(DRAFTS).encode()
+    kinds = ["text" if "text" in entry else "delta" for entry in entries]
+    assert kinds[0] == "text"
+    assert kinds[1:4] == ["delta"] * 3
+    assert kinds[4] == "text"  # full rewrite
+    assert entries[3] == {"delta": [len(tokenize(DRAFTS[2]))]}  # unchanged resubmission
+
+
+def test_stats_count_what_is_stored():
+    versions = EssayVersions(DRAFTS[:4])
+    stats = versions.stats()
+    assert stats["versions"] == 4
+    assert stats["keyframes"] == 1
+    assert stats["full_chars"] == sum(map(len, DRAFTS[:4]))
+    assert stats["stored_chars"] < stats["full_chars"] / 2
+
+
+def test_pickle_and_copy_keep_every_version():
+    versions = EssayVersions(DRAFTS)
+    versions[2]  # fill the memo; it isn't part of the pickled state
+    for restored in (pickle.loads(pickle.dumps(versions)), copy.deepcopy(versions)):
+        assert list(restored) == DRAFTS
+        assert restored[3] == DRAFTS[3]
+        restored.append("One more try.")
+        assert restored[-2:] == [DRAFTS[-1], "One more try."]
+
+
+def test_empty_history():
+    versions = EssayVersions()
+    assert not versions
+    assert list(versions) == []
+    assert pickle.loads(pickle.dumps(versions)).encode() == []
+    assert decode_versions([]) == []
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+
+import pytest
+
+import event_store
+from event_store import JsonlEventStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "events.jsonl")
+
+
+def seqs(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["seq"] for line in f]
+
+
+def test_concurrent_writes_share_fsyncs(path):
+    store = JsonlEventStore(path, commit_interval=0.05)
+
+    def writer(n):
+        for i in range(25):
+            store.write("phase", ["session", "i"], [n, i])
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    stats = store.get_stats()
+    assert seqs(path) == list(range(1, 201))
+    assert stats["events"] == 200
+    assert stats["fsyncs"] < 200
+    assert stats["largest_group"] > 1
+
+
+def test_read_events_by_stream_and_resume_numbering(path):
+    store = JsonlEventStore(path)
+    store.write("phase", ["session", "phase"], ["s1", "submit"])
+    store.write("complete", ["session", "score"], ["s1", 3])
+    store.write("phase", ["session", "phase"], ["s1", "reflect"])
+    assert [e["data"]["phase"] for e in store.read_events("phase")] == ["submit", "reflect"]
+    assert [e["stream"] for e in store.read_events()] == ["phase", "complete", "phase"]
+    store.close()
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 4, "stream": "pha')  # torn by a crash
+    reopened = JsonlEventStore(path)
+    reopened.write("phase", ["session", "phase"], ["s2", "submit"])
+    events = list(reopened.read_events())
+    reopened.close()
+    assert [e["seq"] for e in events] == [1, 2, 3, 4]
+    assert events[-1]["data"] == {"session": "s2", "phase": "submit"}
+
+
+def test_wait_for_commit_returns_once_on_disk(path):
+    store = JsonlEventStore(path, wait_for_commit=True)
+    store.write("phase", ["n"], [1])
+    assert seqs(path) == [1]  # no flush needed
+    store.close()
+
+
+def test_group_that_failed_to_commit_is_kept_and_retried(path, monkeypatch):
+    real_fsync = os.fsync
+    failures = [2]
+
+    def flaky_fsync(fd):
+        if failures[0]:
+            failures[0] -= 1
+            raise OSError("disk hiccup")
+        real_fsync(fd)
+
+    monkeypatch.setattr(event_store.os, "fsync", flaky_fsync)
+    store = JsonlEventStore(path, commit_interval=0.01)
+    for i in range(3):
+        store.write("phase", ["n"], [i])
+    store.flush()
+    store.write("phase", ["n"], [3])
+    store.close()
+    assert store.get_stats()["errors"] == 2
+    # The failed group was cut back each time and written once, ahead of newer events
+    assert seqs(path) == [1, 2, 3, 4]
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["data"]["n"] for line in f] == [0, 1, 2, 3]
@@ -0,0 +1,88 @@
+import re
+
+import pytest
+
+from lexicon import Lexicon
+from passage_registry import get_bundle
+
+LEXICON = get_bundle().lexicon
+
+# Drafts with none of the boundary traps below: the old scan agrees here
+PLAIN = [
+    "I believe pineapple belongs on pizza because Sam Panopoulos made it in 1962 in Ontario, Canada.",
+    "In my opinion it is acceptable. This shows the YouGov poll from 2019 matters; 12 percent agree.",
+    "Tbh it's just gross lol. Like, I'm gonna say no place for fruit, ngl.",
+    "The reason is simple: Hawaiian pizza, therefore, should stay. As a result, Iceland's ban failed.",
+    "Nothing relevant here at all.",
+    "",
+]
+
+# The old scan matched each of these inside another word
+TRAPS = [
+    ("Pizza stays the same everywhere.", "evidence", "sam"),
+    ("Putting fruit on pizza is imoral.", "casual", "imo"),
+    ("She was not tagged in the photo; the tagines were.", "evidence", "tagine"),
+    ("A 19620 entry is not a date.", "evidence", "1962"),
+    ("The Canadas of the world disagree.", "evidence", "canada"),
+    ("My position is unacceptable.", "position", "acceptable"),
+    ("This is the bloll of it.", "casual", "lol"),
+]
+
+
+def old_scan(text: str) -> dict:
+    """The validator's scan before the lexicon: a substring test per phrase."""
+    lower = text.lower()
+    return {name: [t for t in terms if t in lower] for name, terms in LEXICON.categories.items()}
+
+
+def bounded_scan(text: str) -> dict:
+    """The same scan with a regex word-boundary check on alphanumeric edges."""
+    folded = text.replace("’", "'").replace("‘", "'")
+    result = {}
+    for name, terms in LEXICON.categories.items():
+        result[name] = []
+        for term in terms:
+            left = r"(?<![^\W_])" if term[0].isalnum() else ""
+            right = r"(?![^\W_])" if term[-1].isalnum() else ""
+            if re.search(left + re.escape(term) + right, folded, re.IGNORECASE):
+                result[name].append(term)
+    return result
+
+
+def as_sets(found: dict) -> dict:
+    return {name: set(terms) for name, terms in found.items()}
+
+
+@pytest.mark.parametrize("text", PLAIN + [text for text, _, _ in TRAPS])
+def test_matches_a_word_bounded_regex_scan(text):
+    assert as_sets(LEXICON.found(text)) == as_sets(bounded_scan(text))
+
+
+@pytest.mark.parametrize("text", PLAIN)
+def test_agrees_with_the_old_scan_away_from_word_boundaries(text):
+    assert as_sets(LEXICON.found(text)) == as_sets(old_scan(text))
+
+
+@pytest.mark.parametrize("text, category, term", TRAPS)
+def test_phrases_inside_other_words_do_not_match(text, category, term):
+    assert term in old_scan(text)[category]
+    assert term not in LEXICON.found(text)[category]
+
+
+def test_boundaries_at_punctuation_and_text_edges():
+    found = LEXICON.found("sam, imo! (1962)")
+    assert found["evidence"] == ["sam", "1962"]
+    assert found["casual"] == ["imo"]
+    # A phrase ending in punctuation needs no boundary after it
+    assert LEXICON.found("like,totally")["casual"] == ["like,"]
+
+
+def test_case_and_curly_apostrophes_are_folded():
+    assert LEXICON.found("IT’S JUST pineapple")["casual"] == ["it's just"]
+    assert LEXICON.found("It Doesn’t Belong")["position"] == ["doesn't belong"]
+
+
+def test_overlapping_phrases_are_all_reported():
+    lexicon = Lexicon({"a": ["this shows", "shows the"], "b": ["the way"]})
+    hits = [(h.category, h.term, h.start, h.end) for h in lexicon.find_all("this shows the way")]
+    assert hits == [("a", "this shows", 0, 10), ("a", "shows the", 5, 14), ("b", "the way", 11, 18)]
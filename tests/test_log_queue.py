@@ -0,0 +1,54 @@
+import json
+import time
+
+from log_queue import BackgroundLogWriter
+
+
+def spill_line(worksheet, row):
+    return json.dumps({"worksheet": worksheet, "headers": ["a", "b"], "row": row}) + "\n"
+
+
+def wait_for(condition, timeout=5.0):
+    give_up = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < give_up
+        time.sleep(0.01)
+
+
+def test_leftover_replay_from_a_dead_process_is_resumed(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    (tmp_path / "spill.jsonl.replaying").write_text(spill_line("events", [1, "x"]), encoding="utf-8")
+    spill.write_text(spill_line("events", [2, "y"]), encoding="utf-8")
+    written = []
+    writer = BackgroundLogWriter(lambda ws, headers, rows: written.extend(rows), flush_interval=0.02,
+                                 spill_path=str(spill))
+    try:
+        wait_for(lambda: len(written) == 2)
+        assert written == [[1, "x"], [2, "y"]]  # the interrupted replay first, then the newer spill
+        wait_for(lambda: not writer.get_stats()["spill_pending"])
+        assert writer.get_stats()["replayed"] == 2
+    finally:
+        writer.close()
+
+
+def test_failed_rows_spill_and_replay_once_writes_succeed(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    failing = [True]
+    written = []
+
+    def sink(worksheet, headers, rows):
+        if failing[0]:
+            raise ConnectionError("sheets down")
+        written.extend(rows)
+
+    writer = BackgroundLogWriter(sink, flush_interval=0.02, spill_path=str(spill),
+                                 max_retries=0)
+    try:
+        writer.submit("events", ["a"], [1])
+        wait_for(lambda: writer.get_stats()["spilled"] == 1)
+        failing[0] = False
+        writer.submit("events", ["a"], [2])
+        wait_for(lambda: sorted(written) == [[1], [2]])
+        wait_for(lambda: not writer.get_stats()["spill_pending"])
+    finally:
+        writer.close()
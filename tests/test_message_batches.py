@@ -0,0 +1,98 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import batch_score
+import message_batches
+from passage_config import DIMENSION_ORDER
+
+
+def scores_reply(score=2):
+    block = SimpleNamespace(type="tool_use", input={dim: {"score": score, "rationale": "ok"} for dim in DIMENSION_ORDER})
+    usage = SimpleNamespace(input_tokens=10, output_tokens=5)
+    return SimpleNamespace(content=[block], usage=usage)
+
+
+class FakeBatches:
+    def __init__(self):
+        self.created = []  # custom_ids per created batch
+        self.jobs = {}
+
+    def create(self, requests):
+        batch_id = f"batch-{len(self.jobs) + 1}"
+        self.created.append([r["custom_id"] for r in requests])
+        self.jobs[batch_id] = [r["custom_id"] for r in requests]
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        counts = SimpleNamespace(processing=0, succeeded=len(self.jobs[batch_id]), errored=0)
+        return SimpleNamespace(processing_status="ended", request_counts=counts)
+
+    def results(self, batch_id):
+        for custom_id in self.jobs[batch_id]:
+            yield SimpleNamespace(custom_id=custom_id,
+                                  result=SimpleNamespace(type="succeeded", message=scores_reply()))
+
+
+class FakeClient:
+    def __init__(self, base_url=None):
+        self.messages = SimpleNamespace(batches=FakeBatches())
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(message_batches.anthropic, "Anthropic", lambda base_url=None: fake)
+    return fake
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    essays = tmp_path / "essays.jsonl"
+    essays.write_text("".join(json.dumps({"id": eid, "essay": f"Essay {eid} about pineapple."}) + "\n"
+                              for eid in "abc"), encoding="utf-8")
+    output = tmp_path / "scores.jsonl"
+    return str(essays), str(output)
+
+
+def run(corpus):
+    return batch_score.run_batch_api(*corpus, base_url="http://127.0.0.1:8765", poll_interval=0)
+
+
+def rows(output):
+    with open(output, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_only_pending_essays_are_submitted_and_the_client_is_closed(client, corpus):
+    essays, output = corpus
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "a", "scores": {}}) + "\n")
+    stats = run(corpus)
+    assert client.messages.batches.created == [["score-0", "score-1"]]
+    assert [row["id"] for row in rows(output)] == ["a", "b", "c"]
+    assert stats["scored"] == 2
+    assert client.closed
+
+
+def test_resume_polls_the_submitted_batches_instead_of_resubmitting(client, corpus):
+    essays, output = corpus
+    # The first run found "a" scored, submitted b and c, wrote b, then died
+    client.messages.batches.create([{"custom_id": "score-0"}, {"custom_id": "score-1"}])
+    with open(output + ".batches.json", "w", encoding="utf-8") as f:
+        json.dump({"essay_ids": ["b", "c"], "scoring": ["batch-1"]}, f)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "a", "scores": {}}) + "\n")
+        f.write(json.dumps({"id": "b", "scores": {}}) + "\n")
+
+    stats = run(corpus)
+    assert len(client.messages.batches.created) == 1  # nothing billed twice
+    assert [row["id"] for row in rows(output)] == ["a", "b", "c"]
+    assert stats["scored"] == 1
+    assert not os.path.exists(output + ".batches.json")
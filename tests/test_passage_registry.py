@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from passage_registry import DEFAULT_PASSAGE_ID, PassageRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    pack_dir = tmp_path / "volcanoes"
+    pack_dir.mkdir()
+    (pack_dir / "pack.json").write_text(json.dumps({
+        "title": "Living Near Volcanoes",
+        "writing_prompt": "Should towns be built near active volcanoes?",
+        "markers": {"evidence": ["1980", "mount st. helens"]},
+    }), encoding="utf-8")
+    (pack_dir / "passage.md").write_text("Mount St. Helens erupted in 1980.", encoding="utf-8")
+    return PassageRegistry(str(tmp_path))
+
+
+def test_pack_loads_with_its_passage_file(registry):
+    bundle = registry.get("volcanoes")
+    assert bundle.passage_id == "volcanoes"
+    assert bundle.title == "Living Near Volcanoes"
+    assert bundle.passage_text == "Mount St. Helens erupted in 1980."
+    assert "Mount St. Helens erupted in 1980." in bundle.scoring_system
+    assert "Should towns be built near active volcanoes?" in bundle.validation_system
+    assert list(bundle.markers["evidence"]) == ["1980", "mount st. helens"]
+    assert registry.ids() == [DEFAULT_PASSAGE_ID, "volcanoes"]
+
+
+def test_ids_naming_the_same_pack_share_one_bundle(registry):
+    bundle = registry.get("volcanoes")
+    assert registry.get("../volcanoes") is bundle
+    assert registry.get("x/volcanoes") is bundle
+    assert list(registry._bundles) == ["volcanoes"]
+
+
+def test_changed_pack_is_recompiled(registry):
+    bundle = registry.get("volcanoes")
+    pack_file = os.path.join(registry.directory, "volcanoes", "pack.json")
+    pack = json.load(open(pack_file, encoding="utf-8"))
+    pack["title"] = "Volcano Towns"
+    with open(pack_file, "w", encoding="utf-8") as f:
+        json.dump(pack, f)
+    os.utime(pack_file, (os.path.getmtime(pack_file) + 5,) * 2)
+    assert registry.get("volcanoes").title == "Volcano Towns"
+    assert registry.get("volcanoes") is not bundle
+
+
+def test_default_passage_needs_no_pack(registry):
+    assert registry.get().passage_id == DEFAULT_PASSAGE_ID
+    assert registry.get(None) is registry.get(DEFAULT_PASSAGE_ID)
+
+
+def test_unknown_or_broken_pack(registry, tmp_path):
+    with pytest.raises(KeyError):
+        registry.get("glaciers")
+    broken = tmp_path / "broken"
+    broken.mkdir()
+    (broken / "pack.json").write_text(json.dumps({"title": "No passage"}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        registry.get("broken")
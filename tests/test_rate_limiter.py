@@ -0,0 +1,113 @@
+import contextvars
+from contextlib import nullcontext
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def limiter():
+    # One request in the bucket, refilled so slowly that only the test grants more
+    limiter = RateLimiter(rpm=0.6, burst_seconds=1)
+    assert limiter.try_acquire("scoring")
+    return limiter
+
+
+def enqueue(limiter, task, session="-", cls=None):
+    """Queue a ticket as a call from session would, without blocking on it."""
+    context = contextvars.copy_context()
+    context.run(rate_limiter.set_session, session)
+
+    def queue():
+        with rate_limiter.priority(cls) if cls else nullcontext():
+            with limiter._lock:
+                return limiter._enqueue(task, 0, None)
+    ticket = context.run(queue)
+    assert ticket is not None and not ticket.granted
+    return ticket
+
+
+def grant_one(limiter):
+    """Put one request back in the bucket and return the ticket it goes to."""
+    with limiter._lock:
+        waiting = list(limiter._waiting())
+        bucket, _ = limiter._buckets[0]
+        bucket.level = bucket.capacity
+        limiter._dispatch(bucket.updated)
+    granted = [t for t in waiting if t.granted]
+    assert len(granted) == 1
+    return granted[0]
+
+
+def served_order(limiter, tickets):
+    return [tickets.index(grant_one(limiter)) for _ in tickets]
+
+
+def test_higher_class_served_first_whatever_the_arrival_order(limiter):
+    tickets = [
+        enqueue(limiter, "batch_scoring", cls="batch"),
+        enqueue(limiter, "validation"),
+        enqueue(limiter, "validation_incremental"),
+        enqueue(limiter, "scoring"),
+    ]
+    assert [t.cls for t in tickets] == ["batch", "validation", "validation", "interactive"]
+    with limiter._lock:
+        assert list(limiter._waiting()) == [tickets[3], tickets[1], tickets[2], tickets[0]]
+    assert served_order(limiter, tickets) == [3, 1, 2, 0]
+
+
+def test_sessions_take_turns_within_a_class(limiter):
+    tickets = [enqueue(limiter, "coaching", "alice") for _ in range(3)]
+    tickets += [enqueue(limiter, "coaching", "bob") for _ in range(2)]
+    tickets.append(enqueue(limiter, "coaching", "carol"))
+    # alice's burst doesn't hold bob and carol back until it is done
+    assert served_order(limiter, tickets) == [0, 3, 5, 1, 4, 2]
+
+
+def test_waiting_order_matches_service_order(limiter):
+    tickets = [
+        enqueue(limiter, "coaching", "alice"),
+        enqueue(limiter, "validation", "bob"),
+        enqueue(limiter, "coaching", "alice"),
+        enqueue(limiter, "coaching", "bob"),
+        enqueue(limiter, "validation", "alice"),
+    ]
+    with limiter._lock:
+        expected = [tickets.index(t) for t in limiter._waiting()]
+    assert served_order(limiter, tickets) == expected == [0, 3, 2, 1, 4]
+
+
+def test_lower_class_never_overtakes_a_waiting_higher_one(limiter):
+    interactive = enqueue(limiter, "scoring")
+    assert not limiter.try_acquire("validation")
+    assert not limiter.try_acquire("scoring")
+    assert grant_one(limiter) is interactive
+
+
+def test_call_refused_when_expected_wait_exceeds_its_limit(limiter):
+    assert limiter.acquire("scoring", limit=1) is False
+    assert limiter.get_stats()["classes"]["interactive"]["rejected"] == 1
+    assert limiter.get_stats()["classes"]["interactive"]["queued"] == 0
+
+
+def test_pause_holds_every_queue(limiter):
+    ticket = enqueue(limiter, "scoring")
+    limiter.pause(60)
+    with limiter._lock:
+        bucket, _ = limiter._buckets[0]
+        bucket.level = bucket.capacity
+        limiter._dispatch(bucket.updated)
+    assert not ticket.granted
+    assert limiter.expected_wait("scoring") > 50
+    assert limiter.get_stats()["pauses"] == 1
+
+
+def test_disabled_limiter_admits_everything_but_honours_a_pause():
+    limiter = RateLimiter()
+    assert limiter.acquire("scoring", limit=0)
+    assert limiter.try_acquire("validation")
+    limiter.pause(60)
+    assert limiter.acquire("scoring", limit=1) is False
+    assert not limiter.try_acquire("validation")
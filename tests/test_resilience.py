@@ -0,0 +1,229 @@
+import asyncio
+import time
+
+import anthropic
+import httpx
+import pytest
+
+import model_routing
+import rate_limiter
+import resilience
+from resilience import UpstreamUnavailable
+
+
+def api_error(status):
+    response = httpx.Response(status, request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+    return anthropic.APIStatusError(f"status {status}", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_BREAKER_FAILURES", "2")
+    monkeypatch.setenv("ANTHROPIC_BREAKER_COOLDOWN", "0")
+    monkeypatch.setenv("ANTHROPIC_MAX_RETRIES", "0")
+    monkeypatch.setattr(resilience, "BREAKER", resilience.CircuitBreaker())
+    monkeypatch.setattr(rate_limiter, "_limiter", rate_limiter.RateLimiter())
+
+
+def open_breaker():
+    for _ in range(2):
+        resilience.BREAKER.record_failure()
+    assert resilience.BREAKER.state == "open"
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = resilience.BREAKER
+    assert breaker.acquire() == "closed"
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_stays_open_during_cooldown(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_BREAKER_COOLDOWN", "60")
+    open_breaker()
+    assert resilience.BREAKER.blocked()
+    assert resilience.BREAKER.acquire() == ""
+
+
+def test_half_open_lets_one_trial_through_and_success_closes():
+    open_breaker()
+    breaker = resilience.BREAKER
+    assert breaker.acquire() == "trial"
+    assert breaker.state == "half_open"
+    assert breaker.acquire() == ""  # one trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.acquire() == "closed"
+
+
+def test_failed_trial_reopens():
+    open_breaker()
+    breaker = resilience.BREAKER
+    assert breaker.acquire() == "trial"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_lost_trial_expires(monkeypatch):
+    open_breaker()
+    breaker = resilience.BREAKER
+    assert breaker.acquire() == "trial"
+    monkeypatch.setattr(breaker, "_trial_started", time.monotonic() - 3600)
+    assert breaker.acquire() == "trial"
+
+
+def raising(exc):
+    def attempt(timeout):
+        raise exc
+    return attempt
+
+
+@pytest.mark.parametrize("status, reason", [(429, "retries_exhausted"), (400, "error")])
+def test_trial_released_when_call_ends_without_verdict(status, reason):
+    open_breaker()
+    with pytest.raises(UpstreamUnavailable) as caught:
+        resilience.call("scoring", raising(api_error(status)))
+    assert caught.value.reason == reason
+    assert resilience.BREAKER.state == "half_open"
+    assert resilience.BREAKER.acquire() == "trial"
+
+
+def test_trial_released_when_attempt_raises_a_bug():
+    open_breaker()
+    with pytest.raises(KeyError):
+        resilience.call("scoring", raising(KeyError("oops")))
+    assert resilience.BREAKER.acquire() == "trial"
+
+
+def test_trial_not_taken_when_limiter_refuses(monkeypatch):
+    limiter = rate_limiter.RateLimiter(rpm=60, burst_seconds=1)
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    assert limiter.acquire("scoring")  # empties the one-request bucket
+    open_breaker()
+    with resilience.deadline_at(time.monotonic() + 0.3):
+        with pytest.raises(UpstreamUnavailable) as caught:
+            resilience.call("scoring", raising(AssertionError("not called")))
+    assert caught.value.reason == "overloaded"
+    assert resilience.BREAKER.acquire() == "trial"
+
+
+def test_trial_not_taken_past_the_deadline():
+    open_breaker()
+    with resilience.deadline_at(time.monotonic()):
+        with pytest.raises(UpstreamUnavailable) as caught:
+            resilience.call("scoring", raising(AssertionError("not called")))
+    assert caught.value.reason == "deadline"
+    assert resilience.BREAKER.acquire() == "trial"
+
+
+def test_trial_released_when_cancelled():
+    open_breaker()
+    started = asyncio.Event()
+
+    async def attempt(timeout):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def run():
+        call = asyncio.ensure_future(resilience.acall("scoring", attempt))
+        await started.wait()
+        assert resilience.BREAKER.acquire() == ""  # the cancelled call holds the trial
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(run())
+    assert resilience.BREAKER.acquire() == "trial"
+
+
+def test_server_error_in_trial_reopens():
+    open_breaker()
+    with pytest.raises(UpstreamUnavailable):
+        resilience.call("scoring", raising(api_error(503)))
+    assert resilience.BREAKER.state == "open"
+
+
+class Reply:
+    usage = None
+
+
+def slow_attempt(calls):
+    def attempt(timeout):
+        calls.append(timeout)
+        time.sleep(0.2)
+        return Reply()
+    return attempt
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_HEDGE", "1")
+    monkeypatch.setattr(resilience, "_latencies", {"scoring": [0.01] * resilience.HEDGE_MIN_SAMPLES})
+
+
+@pytest.mark.parametrize("rpm, sent, stat", [(600, 2, "hedges"), (60, 1, "hedges_skipped")])
+def test_hedge_needs_its_own_permit(monkeypatch, hedging, rpm, sent, stat):
+    limiter = rate_limiter.RateLimiter(rpm=rpm, burst_seconds=1)  # 10 permits, or just 1
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    before = resilience.get_resilience_stats()[stat]
+    calls = []
+    resilience.call("scoring", slow_attempt(calls))
+    assert len(calls) == sent
+    assert limiter.get_stats()["classes"]["interactive"]["admitted"] == sent
+    assert resilience.get_resilience_stats()[stat] == before + 1
+
+
+def test_no_hedge_when_disabled_by_caller(hedging):
+    calls = []
+    resilience.call("scoring", slow_attempt(calls), hedge=False)
+    assert len(calls) == 1
+
+
+def routed_attempt(choice, outcomes):
+    """attempt(timeout) that fails as outcomes says (None = success), moving choice along."""
+    def attempt(timeout):
+        exc = outcomes.pop(0)
+        if exc is None:
+            return Reply()
+        choice.failed(exc)
+        raise exc
+    return attempt
+
+
+def slow_reply():
+    return anthropic.APITimeoutError(httpx.Request("POST", "https://api.anthropic.com/v1/messages"))
+
+
+@pytest.fixture
+def one_retry(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_MAX_RETRIES", "1")
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, exc=None, cap=None: 0.0)
+
+
+def test_failure_that_moves_to_the_fallback_model_spares_the_breaker(one_retry):
+    for _ in range(3):
+        choice = model_routing.ModelChoice("validation", {"model": "fast"})
+        resilience.call("validation", routed_attempt(choice, [slow_reply(), None]), spared=choice.moved_on)
+        assert choice.fell_back
+    assert resilience.BREAKER.state == "closed"
+
+
+def test_fallback_model_failures_still_count(one_retry):
+    for _ in range(2):
+        choice = model_routing.ModelChoice("validation", {"model": "fast"})
+        with pytest.raises(UpstreamUnavailable):
+            resilience.call("validation", routed_attempt(choice, [slow_reply(), api_error(503)]),
+                            spared=choice.moved_on)
+    assert resilience.BREAKER.state == "open"
+
+
+def test_failure_without_a_fallback_model_counts(one_retry):
+    for _ in range(2):
+        choice = model_routing.ModelChoice("scoring", {"model": "strong"})
+        with pytest.raises(UpstreamUnavailable):
+            resilience.call("scoring", routed_attempt(choice, [slow_reply(), slow_reply()]),
+                            spared=choice.moved_on)
+        assert not choice.fell_back
+    assert resilience.BREAKER.state == "open"
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import model_routing
+from score_cache import ScoreCache, fingerprint, make_key, normalize_essay
+
+ESSAY = "Pineapple belongs on pizza.\n\nIts sweetness balances the salty ham."
+CONTEXT = fingerprint("1.4", "scoring system prompt")
+
+
+def test_key_ignores_whitespace_and_unicode_form():
+    key = make_key(ESSAY, CONTEXT)
+    assert make_key("  Pineapple belongs  on pizza.\n \n\nIts sweetness\tbalances the\nsalty ham.\n", CONTEXT) == key
+    # Decomposed vs. composed accent, as different keyboards type it
+    assert make_key(ESSAY.replace("salty", "sa\u0301lty"), CONTEXT) == make_key(ESSAY.replace("salty", "s\u00e1lty"), CONTEXT)
+    assert normalize_essay(" a \n\n b ") == "a\n\nb"
+    assert normalize_essay("\n\n a  b \r\n\t\r\n\n c\nd \n\n") == "a b\n\nc d"
+
+
+def test_key_keeps_paragraph_breaks():
+    # STRUCTURE is scored on paragraphing, so re-paragraphing is a new essay
+    assert make_key(ESSAY.replace("\n\n", " "), CONTEXT) != make_key(ESSAY, CONTEXT)
+    assert make_key(ESSAY.replace("\n\n", "\n"), CONTEXT) != make_key(ESSAY, CONTEXT)
+
+
+def test_key_changes_with_the_text_or_the_context():
+    key = make_key(ESSAY, CONTEXT)
+    assert make_key(ESSAY + " Really.", CONTEXT) != key
+    assert make_key(ESSAY.lower(), CONTEXT) != key
+    assert make_key(ESSAY, fingerprint("1.5", "scoring system prompt")) != key
+    assert make_key(ESSAY, fingerprint("1.4", "scoring system prompt.")) != key
+
+
+def test_fingerprint_keeps_part_boundaries():
+    assert fingerprint("ab", "c") != fingerprint("a", "bc")
+    assert fingerprint("a", "b") == fingerprint("a", "b")
+
+
+def test_key_is_the_same_in_another_process():
+    # Keys are shared through the disk tier, so they can't depend on hash seeds
+    code = "import sys; from score_cache import make_key; print(make_key(sys.argv[1], sys.argv[2]))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONHASHSEED="12345", PYTHONPATH=root)
+    out = subprocess.run([sys.executable, "-c", code, ESSAY, CONTEXT], env=env,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == make_key(ESSAY, CONTEXT)
+
+
+def test_scoring_model_settings_are_part_of_the_context(monkeypatch):
+    before = model_routing.score_fingerprint(CONTEXT)
+    assert model_routing.score_fingerprint(CONTEXT) == before
+    monkeypatch.setenv("MODEL_ROUTES", json.dumps({"scoring": {"temperature": 0.3}}))
+    model_routing.configure()
+    try:
+        assert model_routing.score_fingerprint(CONTEXT) != before
+    finally:
+        monkeypatch.delenv("MODEL_ROUTES")
+        model_routing.configure()
+    assert model_routing.score_fingerprint(CONTEXT) == before
+
+
+def test_cache_serves_a_resubmission_with_only_whitespace_changes():
+    cache = ScoreCache()
+    cache.put(make_key(ESSAY, CONTEXT), {"claim": 3})
+    scores = cache.get(make_key(ESSAY.replace(" ", "  ") + "\n", CONTEXT))
+    assert scores == {"claim": 3}
+    scores["claim"] = 1  # callers get a copy
+    assert cache.get(make_key(ESSAY, CONTEXT)) == {"claim": 3}
+    assert cache.get(make_key(ESSAY, fingerprint("other"))) is None
+    assert cache.get_stats()["memory_hits"] == 2
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "scores.db")
+    ScoreCache(db_path=path).put(make_key(ESSAY, CONTEXT), {"claim": 4})
+    cache = ScoreCache(db_path=path)
+    assert cache.get(make_key(ESSAY, CONTEXT)) == {"claim": 4}
+    assert cache.get_stats()["disk_hits"] == 1
+
+
+@pytest.mark.parametrize("ttl, expected", [(3600, {"claim": 2}), (-1, None)])
+def test_expired_entries_are_misses(ttl, expected):
+    cache = ScoreCache(ttl_seconds=ttl)
+    cache.put("key", {"claim": 2})
+    assert cache.get("key") == expected
@@ -0,0 +1,80 @@
+import pytest
+
+from core_engine import SocraticEngine
+from passage_config import DIMENSION_ORDER
+from session_snapshot import (
+    MAGIC, SnapshotError, SnapshotStore, capture, decode, encode, pack_frame, pack_snapshot,
+    rebuild, unpack_snapshot,
+)
+
+
+def scores(n):
+    return {dim: {"score": n, "rationale": f"level {n}"} for dim in DIMENSION_ORDER}
+
+
+def engine_after(essays):
+    engine = SocraticEngine()
+    for n, essay in enumerate(essays, start=1):
+        engine.memory.add_essay(essay, scores(min(n, 4)))
+    engine.memory.coaching_history.append(f"coaching after {len(essays)}")
+    engine.memory.model_mode_used.add(DIMENSION_ORDER[0])
+    engine.current_phase = "revision"
+    return engine
+
+
+ESSAYS = [
+    "Pineapple belongs on pizza. It is sweet.",
+    "I believe pineapple belongs on pizza. It is sweet, and it balances the ham.",
+    "I believe pineapple belongs on pizza.\n\nIts sweetness balances the salty ham.",
+]
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, 1, -1, 127, 128, -129, 2 ** 70, -(2 ** 70), 0.0, -2.5, 1e300,
+    "", "plain", "naïve “quotes” 🍍", [], [1, "two", [3.0, None]], {},
+    {"a": {"b": [True, False]}, "": "empty key"},
+])
+def test_encode_decode_round_trip(value):
+    assert decode(encode(value)) == value
+
+
+def test_tuples_come_back_as_lists():
+    assert decode(encode((1, (2, 3)))) == [1, [2, 3]]
+
+
+def test_full_and_delta_frames_round_trip(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    states = []
+    for n in range(1, len(ESSAYS) + 1):
+        state = capture(engine_after(ESSAYS[:n]), ui={"messages": [f"m{i}" for i in range(n)], "page": n})
+        store.save("s1", state)
+        states.append(state)
+    assert store.stats["full_writes"] == 1
+    assert store.stats["delta_writes"] == len(ESSAYS) - 1
+
+    with open(tmp_path / "s1.snap", "rb") as f:
+        data = f.read()
+    assert unpack_snapshot(data) == states[-1]
+    assert SnapshotStore(str(tmp_path)).load("s1") == states[-1]
+
+    engine = rebuild(states[-1])
+    assert list(engine.memory.essays) == ESSAYS
+    assert engine.memory.scores_history == [scores(1), scores(2), scores(3)]
+    assert engine.memory.model_mode_used == {DIMENSION_ORDER[0]}
+    assert engine.current_phase == "revision"
+
+
+def test_torn_last_frame_is_skipped():
+    first = {"phase": "submit", "memory": {"essays": [{"text": "One."}]}}
+    delta = {"set": {"phase": "revision"}, "append": {"memory.essays": [{"delta": [1, " Two."]}]}}
+    data = pack_snapshot(first) + pack_frame(delta)
+    assert unpack_snapshot(data)["memory"]["essays"] == [{"text": "One."}, {"delta": [1, " Two."]}]
+    assert unpack_snapshot(data[:-3]) == first
+
+
+@pytest.mark.parametrize("data", [b"", b"SW", MAGIC, b"NOPE\x01", MAGIC + b"\x09"])
+def test_short_or_foreign_data_is_a_snapshot_error(tmp_path, data):
+    with pytest.raises(SnapshotError):
+        unpack_snapshot(data)
+    (tmp_path / "bad.snap").write_bytes(data)
+    assert SnapshotStore(str(tmp_path)).load("bad") is None
@@ -0,0 +1,69 @@
+import pytest
+
+from core_engine import SocraticEngine
+from passage_config import DIMENSION_ORDER
+from session_snapshot import SnapshotStore, capture, rebuild
+from session_store import InProcessSessionStore, LocalSessionStore, VersionConflict
+
+
+def state_with(essays):
+    engine = SocraticEngine()
+    for essay in essays:
+        engine.memory.add_essay(essay, {dim: {"score": 2, "rationale": ""} for dim in DIMENSION_ORDER})
+    return capture(engine)
+
+
+@pytest.fixture(params=["memory", "local"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InProcessSessionStore()
+    return LocalSessionStore(SnapshotStore(str(tmp_path)))
+
+
+def test_versions_count_up_from_one(store):
+    assert store.version("s1") == 0
+    assert store.load("s1") is None
+    assert store.save("s1", state_with(["One."]), 0) == 1
+    assert store.save("s1", state_with(["One.", "Two."]), 1) == 2
+    version, state = store.load("s1")
+    assert version == 2
+    assert list(rebuild(state).memory.essays) == ["One.", "Two."]
+
+
+def test_stale_save_is_rejected_and_the_stored_state_wins(store):
+    store.save("s1", state_with(["One."]), 0)
+    # Two tabs (or replicas) start from version 1; the second one to save loses
+    store.save("s1", state_with(["One.", "Tab A."]), 1)
+    with pytest.raises(VersionConflict) as caught:
+        store.save("s1", state_with(["One.", "Tab B."]), 1)
+    assert (caught.value.expected, caught.value.current) == (1, 2)
+    version, state = store.load("s1")
+    assert version == 2
+    assert list(rebuild(state).memory.essays) == ["One.", "Tab A."]
+
+
+def test_newer_stored_version_is_reloaded(store):
+    # What app.sync_session does at the start of each run
+    mine = store.save("s1", state_with(["One."]), 0)
+    store.save("s1", state_with(["One.", "Elsewhere."]), mine)
+    assert store.version("s1") != mine
+    version, state = store.load("s1")
+    assert list(rebuild(state).memory.essays) == ["One.", "Elsewhere."]
+    # Saving on top of the reloaded version works again
+    assert store.save("s1", state_with(["One.", "Elsewhere.", "Here."]), version) == version + 1
+
+
+def test_delete_starts_over(store):
+    store.save("s1", state_with(["One."]), 0)
+    store.delete("s1")
+    assert store.version("s1") == 0
+    assert store.save("s1", state_with(["Again."]), 0) == 1
+
+
+def test_local_files_keep_the_version_across_a_restart(tmp_path):
+    LocalSessionStore(SnapshotStore(str(tmp_path))).save("s1", state_with(["One."]), 0)
+    restarted = LocalSessionStore(SnapshotStore(str(tmp_path)))
+    assert restarted.version("s1") == 1
+    with pytest.raises(VersionConflict):
+        restarted.save("s1", state_with(["Stale."]), 0)
+    assert restarted.save("s1", state_with(["One.", "Two."]), 1) == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from structured_output import SchemaError, repair_json
+
+
+@pytest.mark.parametrize("reply, expected", [
+    # Words that look like Python literals, inside a string
+    ('{"a": {"score": 2, "rationale": "None of the True facts are cited",}}',
+     {"a": {"score": 2, "rationale": "None of the True facts are cited"}}),
+    # Curly quotes inside a string
+    ('{"a": {"score": 1, "rationale": "Calling it “gross” is not a reason",}}',
+     {"a": {"score": 1, "rationale": "Calling it “gross” is not a reason"}}),
+    # Brackets and commas inside a string
+    ('{"a": {"score": 3, "rationale": "Lists [1962, Canada, ] and {ham, }",},}',
+     {"a": {"score": 3, "rationale": "Lists [1962, Canada, ] and {ham, }"}}),
+    ('{"a": {"rationale": "She said \\"True, }\\" twice", "ok": True,}}',
+     {"a": {"rationale": 'She said "True, }" twice', "ok": True}}),
+])
+def test_string_contents_survive_unchanged(reply, expected):
+    assert repair_json(reply) == (expected, True)
+
+
+def test_clean_json_is_not_repaired():
+    assert repair_json('{"score": 3, "note": "None, True"}') == ({"score": 3, "note": "None, True"}, False)
+
+
+def test_trailing_commas_and_python_literals():
+    reply = '{"checks": [{"objective": "TONE", "ok": True, "tip": None,},], "ready": False,}'
+    assert repair_json(reply) == (
+        {"checks": [{"objective": "TONE", "ok": True, "tip": None}], "ready": False}, True)
+
+
+def test_smart_quotes_used_as_json_quotes():
+    reply = '{“score”: 2, “rationale”: “Says ‘maybe’, no reason”,}'
+    assert repair_json(reply) == ({"score": 2, "rationale": "Says ‘maybe’, no reason"}, True)
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ('{"a": {"score": 2, "rationale": "Cut off mid', {"a": {"score": 2, "rationale": "Cut off mid"}}),
+    ('{"a": {"score": 2}, "b": {"score":', {"a": {"score": 2}, "b": {}}),
+    ('{"checks": [{"objective": "TONE"},', {"checks": [{"objective": "TONE"}]}),
+    ('{"a": {"rationale": "ends with ] and }", "score": 3', {"a": {"rationale": "ends with ] and }", "score": 3}}),
+])
+def test_truncated_brackets_are_closed(reply, expected):
+    assert repair_json(reply) == (expected, True)
+
+
+def test_json_inside_a_text_reply():
+    reply = ('Here are the scores:\n```json\n{"a": {"score": 4, "rationale": "Uses {braces} well"}}\n```\n'
+             'Let me know if you need more.')
+    assert repair_json(reply) == ({"a": {"score": 4, "rationale": "Uses {braces} well"}}, False)
+
+
+@pytest.mark.parametrize("reply", ["I can't score this essay.", "", '{"a": [1, 2} oops'])
+def test_unusable_reply_raises(reply):
+    with pytest.raises(SchemaError):
+        repair_json(reply)
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+import token_budget
+from resilience import UpstreamUnavailable
+
+
+def usage(tokens):
+    return SimpleNamespace(input_tokens=tokens, output_tokens=0,
+                           cache_read_input_tokens=0, cache_creation_input_tokens=0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setenv("CLASS_TOKEN_BUDGET", "1000")
+    monkeypatch.setenv("BUDGET_LOW_SHARE", "0.2")
+    now = [10 * 86400.0 + 3600]  # 01:00 UTC on some day
+    monkeypatch.setattr(token_budget, "time", SimpleNamespace(time=lambda: now[0]))
+    token_budget.reset_class()
+    yield now
+    token_budget.reset_class()
+
+
+def charge(tokens, class_id="class-a"):
+    # A fresh session each time: only the class budget is in play
+    with token_budget.metering(token_budget.UsageLedger(), class_id, "submit"):
+        token_budget.record("scoring", "claude-sonnet-4-20250514", usage(tokens))
+
+
+def level(class_id="class-a"):
+    with token_budget.metering(token_budget.UsageLedger(), class_id, "submit"):
+        return token_budget.level()
+
+
+def test_class_budget_degrades_as_it_is_used(clock):
+    assert level() == "ok"
+    charge(700)
+    assert level() == "ok"
+    charge(150)
+    assert level() == "low"
+    charge(150)
+    assert level() == "exhausted"
+    assert level("class-b") == "ok"  # other classes are unaffected
+    with token_budget.metering(token_budget.UsageLedger(), "class-a", "submit"):
+        with pytest.raises(UpstreamUnavailable):
+            token_budget.admit("scoring", {"max_tokens": 100, "messages": []})
+
+
+def test_class_budget_recovers_in_the_next_window(clock):
+    charge(1000)
+    clock[0] += 22 * 3600  # 23:00, same day
+    assert level() == "exhausted"
+    clock[0] += 3600  # midnight UTC
+    assert level() == "ok"
+    assert token_budget.class_tokens("class-a") == 0
+    charge(300)
+    assert token_budget.class_tokens("class-a") == 300
+
+
+def test_window_length_is_configurable(clock, monkeypatch):
+    monkeypatch.setenv("CLASS_BUDGET_WINDOW", "1")
+    charge(1000)
+    assert level() == "exhausted"
+    clock[0] += 3600
+    assert level() == "ok"
+
+
+def test_reset_class_recovers_at_once(clock):
+    charge(1000, "class-a")
+    charge(1000, "class-b")
+    token_budget.reset_class("class-a")
+    assert level("class-a") == "ok"
+    assert level("class-b") == "exhausted"
+    token_budget.reset_class()
+    assert level("class-b") == "ok"
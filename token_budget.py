@@ -0,0 +1,334 @@
+"""
+Token Accounting and Budgets for Socratic Writing Tutor
+
+CALL_LOG only keeps the last 1000 calls of the whole process, so nobody could
+say what one tutoring session cost or which phase used the most tokens. Every
+model call's usage is now also charged to the session it ran for:
+
+- UsageLedger: one per engine (saved with the session snapshot), with totals
+  and roll-ups by phase (validate, submit, revise, reflect), by task
+  (scoring, coaching, ...) and by rubric dimension for coaching and model
+  examples; scoring covers every dimension at once, so it has no dimension
+- cost estimates from PRICES (USD per million tokens), with cache writes and
+  reads priced relative to input
+
+Engine phase methods run under metered(phase), which makes the engine's
+ledger and the phase current for every call they make, including calls run
+on client_pool's event loop.
+
+Budgets cap the spend. Tokens count as they do against the rate limit
+(input, cache writes and output; cache reads are nearly free). While less
+than BUDGET_LOW_SHARE of a session's or class's budget is left, the engine
+saves tokens:
+
+- free-text replies get max_tokens cut to BUDGET_LOW_MAX_TOKENS of normal
+  (structured replies keep theirs, a cut-off tool call can't be parsed)
+- "Check my draft" stays on the local heuristics instead of escalating
+- MODEL examples are reused from earlier sessions on the same assignment
+- slow calls get no hedged duplicate (resilience.py)
+
+A call that won't fit in what is left is refused with
+UpstreamUnavailable("budget_exhausted"), so the engine answers from the same
+local fallbacks it uses during an outage.
+
+A class is everyone working on the same assignment (passage ID). Class
+totals are kept per process, so with several replicas each one enforces
+the class budget on its own share of the traffic. The class budget is per
+window (a day by default, starting at midnight UTC): a new window starts
+from zero, so a class that used up its budget recovers without a restart.
+reset_class() starts a class (or every class) over right away.
+
+Settings (environment variables):
+- SESSION_TOKEN_BUDGET   tokens one session may use (default 0 = unlimited)
+- CLASS_TOKEN_BUDGET     tokens all sessions on one assignment may use per window (default 0 = unlimited)
+- CLASS_BUDGET_WINDOW    hours in a class budget window (default 24)
+- BUDGET_LOW_SHARE       share of a budget left when saving starts (default 0.2)
+- BUDGET_LOW_MAX_TOKENS  max_tokens factor while saving (default 0.6)
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import rate_limiter
+from resilience import UpstreamUnavailable
+
+# USD per million tokens: (input, output)
+PRICES = {
+    "claude-sonnet-4-20250514": (3.00, 15.00),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+}
+DEFAULT_PRICE = (3.00, 15.00)
+CACHE_WRITE_FACTOR = 1.25  # of the input price
+CACHE_READ_FACTOR = 0.1
+
+FIELDS = ("calls", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+# Tasks whose replies don't depend on the student's own words beyond the
+# prompt, so an earlier reply to the same prompt can be shown again
+REUSABLE_TASKS = ("model_example",)
+
+
+def settings() -> dict:
+    def env(name, default, cast=float):
+        try:
+            return cast(os.environ.get(name, default))
+        except ValueError:
+            return default
+    return {
+        "session_budget": env("SESSION_TOKEN_BUDGET", 0, int),
+        "class_budget": env("CLASS_TOKEN_BUDGET", 0, int),
+        "class_window": env("CLASS_BUDGET_WINDOW", 24.0),
+        "low_share": env("BUDGET_LOW_SHARE", 0.2),
+        "low_max_tokens": env("BUDGET_LOW_MAX_TOKENS", 0.6),
+    }
+
+
+def cost_usd(model: str, input_tokens: int, output_tokens: int,
+             cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> float:
+    input_price, output_price = PRICES.get(model, DEFAULT_PRICE)
+    return (input_tokens * input_price
+            + cache_write_tokens * input_price * CACHE_WRITE_FACTOR
+            + cache_read_tokens * input_price * CACHE_READ_FACTOR
+            + output_tokens * output_price) / 1_000_000
+
+
+def _bucket() -> dict:
+    return dict(dict.fromkeys(FIELDS, 0), cost_usd=0.0)
+
+
+def _add(bucket: dict, entry: dict):
+    for field in FIELDS:
+        bucket[field] += entry[field]
+    bucket["cost_usd"] += entry["cost_usd"]
+
+
+class UsageLedger:
+    """One session's model usage, rolled up by phase, task and dimension."""
+
+    def __init__(self):
+        # Speculative calls record from client_pool's loop thread
+        self._lock = threading.Lock()
+        self.total = _bucket()
+        self.by_phase = {}
+        self.by_task = {}
+        self.by_dimension = {}
+        self.savings = {}  # what the budget made the engine do instead -> count
+
+    @property
+    def tokens(self) -> int:
+        """Tokens charged against budgets."""
+        return self.total["input_tokens"] + self.total["cache_write_tokens"] + self.total["output_tokens"]
+
+    def record(self, task: str, model: str, usage, phase: str = None, dimension: str = None) -> dict:
+        entry = {
+            "calls": 1,
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        }
+        entry["cost_usd"] = cost_usd(model, entry["input_tokens"], entry["output_tokens"],
+                                     entry["cache_read_tokens"], entry["cache_write_tokens"])
+        with self._lock:
+            _add(self.total, entry)
+            _add(self.by_phase.setdefault(phase or "other", _bucket()), entry)
+            _add(self.by_task.setdefault(task, _bucket()), entry)
+            if dimension:
+                _add(self.by_dimension.setdefault(dimension, _bucket()), entry)
+        return entry
+
+    def note_saving(self, what: str):
+        with self._lock:
+            self.savings[what] = self.savings.get(what, 0) + 1
+
+    def summary(self) -> dict:
+        """Plain-data copy (also what the session snapshot stores)."""
+        def rounded(bucket):
+            return dict(bucket, cost_usd=round(bucket["cost_usd"], 6))
+        with self._lock:
+            return {
+                "total": rounded(self.total),
+                "by_phase": {key: rounded(b) for key, b in self.by_phase.items()},
+                "by_task": {key: rounded(b) for key, b in self.by_task.items()},
+                "by_dimension": {key: rounded(b) for key, b in self.by_dimension.items()},
+                "savings": dict(self.savings),
+            }
+
+    @classmethod
+    def from_summary(cls, summary: dict) -> "UsageLedger":
+        ledger = cls()
+        ledger.total = dict(_bucket(), **summary.get("total", {}))
+        for name in ("by_phase", "by_task", "by_dimension"):
+            setattr(ledger, name, {key: dict(_bucket(), **b) for key, b in summary.get(name, {}).items()})
+        ledger.savings = dict(summary.get("savings", {}))
+        return ledger
+
+
+# --- class totals -------------------------------------------------------------
+
+_class_tokens = {}  # passage ID -> (window, tokens used in it by every session on it, this process)
+_class_lock = threading.Lock()
+
+
+def _window() -> int:
+    hours = settings()["class_window"]
+    return int(time.time() // (hours * 3600)) if hours > 0 else 0
+
+
+def class_tokens(class_id: str) -> int:
+    """Tokens the class has used in the current window."""
+    window = _window()
+    with _class_lock:
+        used_in, tokens = _class_tokens.get(class_id, (window, 0))
+        return tokens if used_in == window else 0
+
+
+def reset_class(class_id: str = None):
+    """Start a class's budget window over now (every class if class_id is None)."""
+    with _class_lock:
+        if class_id is None:
+            _class_tokens.clear()
+        else:
+            _class_tokens.pop(class_id, None)
+
+
+# --- metering -----------------------------------------------------------------
+
+_scope = contextvars.ContextVar("token_budget_scope", default=None)  # (ledger, class ID, phase)
+_dimension = contextvars.ContextVar("token_budget_dimension", default=None)
+
+
+@contextmanager
+def metering(ledger: UsageLedger, class_id: str, phase: str):
+    """Charge the block's model calls to ledger and class_id, under phase."""
+    token = _scope.set((ledger, class_id, phase))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def metered(phase: str):
+    """Decorator for (sync or async) methods of objects with .usage and .bundle."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(self, *args, **kwargs):
+                with metering(self.usage, self.bundle.passage_id, phase):
+                    return await fn(self, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with metering(self.usage, self.bundle.passage_id, phase):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def dimension(name: str):
+    """Attribute the block's calls to a rubric dimension (None: no dimension)."""
+    token = _dimension.set(name)
+    try:
+        yield
+    finally:
+        _dimension.reset(token)
+
+
+def record(task: str, model: str, usage):
+    """Charge one finished call to the current session and class (if any)."""
+    scope = _scope.get()
+    if scope is None:
+        return
+    ledger, class_id, phase = scope
+    ledger.record(task, model, usage, phase, _dimension.get())
+    window = _window()
+    with _class_lock:
+        used_in, tokens = _class_tokens.get(class_id, (window, 0))
+        if used_in != window:
+            tokens = 0
+        _class_tokens[class_id] = (window, tokens + rate_limiter.usage_tokens(usage))
+
+
+# --- budgets ------------------------------------------------------------------
+
+def remaining() -> dict:
+    """Tokens left in the current session's and class's budgets (None = unlimited)."""
+    scope = _scope.get()
+    config = settings()
+    left = {"session": None, "class": None}
+    if scope is None:
+        return left
+    ledger, class_id, _ = scope
+    if config["session_budget"] > 0:
+        left["session"] = config["session_budget"] - ledger.tokens
+    if config["class_budget"] > 0:
+        left["class"] = config["class_budget"] - class_tokens(class_id)
+    return left
+
+
+def level() -> str:
+    """"ok", "low" (saving tokens) or "exhausted", for the tighter of the two budgets."""
+    config = settings()
+    worst = "ok"
+    for name, left in remaining().items():
+        if left is None:
+            continue
+        if left <= 0:
+            return "exhausted"
+        if left < config[f"{name}_budget"] * config["low_share"]:
+            worst = "low"
+    return worst
+
+
+def should_save(what: str) -> bool:
+    """True while a budget is low or spent; counts what is being skipped (e.g. "validation")."""
+    if level() == "ok":
+        return False
+    scope = _scope.get()
+    if scope is not None:
+        scope[0].note_saving(what)
+    return True
+
+
+def admit(task: str, request: dict) -> dict:
+    """Fit a Messages request into what is left of the budgets.
+
+    Returns the request, with a smaller max_tokens while saving; raises
+    UpstreamUnavailable("budget_exhausted") if even that won't fit.
+    """
+    state = level()
+    if state == "ok":
+        return request
+    ledger = _scope.get()[0]
+    shortened = request
+    if "tools" not in request:
+        max_tokens = max(64, int(request["max_tokens"] * settings()["low_max_tokens"]))
+        shortened = dict(request, max_tokens=min(max_tokens, request["max_tokens"]))
+    left = min(value for value in remaining().values() if value is not None)
+    if state == "exhausted" or rate_limiter.estimate_tokens(shortened) > left:
+        ledger.note_saving(f"{task}_refused")
+        raise UpstreamUnavailable("budget_exhausted")
+    if shortened["max_tokens"] < request["max_tokens"]:
+        ledger.note_saving("max_tokens")
+    return shortened
+
+
+def status(ledger: UsageLedger, class_id: str) -> dict:
+    """Budgets, what is left and the saving level, for a session's stats."""
+    with metering(ledger, class_id, None):
+        config = settings()
+        left = remaining()
+        return {
+            "session_budget": config["session_budget"] or None,
+            "session_remaining": left["session"],
+            "class_budget": config["class_budget"] or None,
+            "class_remaining": left["class"],
+            "level": level(),
+        }
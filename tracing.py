@@ -0,0 +1,304 @@
+"""
+Tracing for Socratic Writing Tutor
+
+When a student says "it hung", the app has no timings to look at. This
+module records a span tree for each sampled student action. The draft check,
+a submission, a revision or a reflection is the root. Its children are the
+engine phase, scoring, every generation and every model call (prompt size,
+output tokens, latency, time to first token), then the log write. The rerun
+that renders the result joins the same trace. Sheets writes happen later on
+the background writer, so they are traced as spans of their own.
+
+Spans follow OpenTelemetry's data model: 128-bit trace and 64-bit span IDs,
+parent, start/end in unix nanoseconds, attributes and status. A background
+thread exports them in batches, either as JSON lines (one span per line,
+OTLP field names, attributes as a plain object) or as OTLP/HTTP JSON to a
+local collector, e.g. an OpenTelemetry Collector or Jaeger listening on
+port 4318.
+
+    with tracing.span("score_essay", essay_chars=len(essay)) as span:
+        ...
+        span.set(cache_hit=True)
+
+A span entered with `with` becomes the current span, so spans opened inside
+it, including on client_pool's event loop, become its children. Spans that
+can't be entered (e.g. across a generator's yields) are ended with
+span.end(). With sampling off (the default), span() returns a shared no-op
+object after one ContextVar lookup, so instrumented code costs next to
+nothing.
+
+Settings (environment variables):
+- TRACE_SAMPLE_RATE   share of student actions traced, 0-1 (default 0 = off)
+- TRACE_EXPORT        "jsonl:<path>" (default jsonl:traces.jsonl), or an OTLP
+                      endpoint such as http://localhost:4318/v1/traces
+- TRACE_SERVICE_NAME  service.name of the exported spans (default socratic-writing-tutor)
+"""
+
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+BATCH_SIZE = 256
+QUEUE_SIZE = 10000
+
+
+def settings() -> dict:
+    try:
+        rate = min(1.0, max(0.0, float(os.environ.get("TRACE_SAMPLE_RATE", 0))))
+    except ValueError:
+        rate = 0.0
+    return {
+        "sample_rate": rate,
+        "export": os.environ.get("TRACE_EXPORT", "jsonl:traces.jsonl"),
+        "service": os.environ.get("TRACE_SERVICE_NAME", "socratic-writing-tutor"),
+    }
+
+
+_settings = settings()
+_stats = {"spans": 0, "traces": 0, "exported": 0, "dropped": 0, "export_errors": 0}
+_stats_lock = threading.Lock()
+
+
+def configure(**overrides):
+    """Re-read the environment, then apply overrides (sample_rate, export, service)."""
+    global _settings
+    _settings = dict(settings(), **overrides)
+
+
+class _NoopSpan:
+    """What span() returns when the action isn't sampled: accepts everything, records nothing."""
+
+    __slots__ = ()
+    sampled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def context(self):
+        return None
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed operation in a trace."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes: dict = None):
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if isinstance(exc, asyncio.CancelledError):
+            self.attributes["cancelled"] = True  # e.g. a speculative call that wasn't needed
+        # Streamlit's rerun/stop are BaseExceptions: control flow, not failures
+        self.end(exc if isinstance(exc, Exception) else None)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _export(self)
+
+    def context(self) -> tuple:
+        """(trace_id, span_id), for continuing the trace elsewhere (see span(parent=...))."""
+        return self.trace_id, self.span_id
+
+
+def span(name: str, parent: tuple = None, **attributes):
+    """A child of the current span, or a new root sampled at TRACE_SAMPLE_RATE.
+
+    parent, a Span.context() from earlier (e.g. the previous script run),
+    continues that trace instead. Returns NOOP when nothing is recorded.
+    """
+    current = _current.get()
+    if current is not None:
+        return Span(name, current.trace_id, current.span_id, attributes)
+    if parent is not None:
+        return Span(name, parent[0], parent[1], attributes)
+    rate = _settings["sample_rate"]
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return NOOP
+    with _stats_lock:
+        _stats["traces"] += 1
+    return Span(name, "%032x" % random.getrandbits(128), None, attributes)
+
+
+def current_span():
+    """The span code is running under (NOOP if none), for adding attributes."""
+    return _current.get() or NOOP
+
+
+def traced(name: str):
+    """Decorator: run the function (sync or async) inside span(name)."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- export -----------------------------------------------------------------
+
+def _value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(span_: Span, plain_attributes: bool = False) -> dict:
+    """A finished span in OTLP JSON form."""
+    attributes = span_.attributes if plain_attributes else [
+        {"key": key, "value": _value(value)} for key, value in span_.attributes.items()
+    ]
+    status = {"code": 2, "message": span_.error} if span_.error else {"code": 0}
+    return {
+        "traceId": span_.trace_id,
+        "spanId": span_.span_id,
+        "parentSpanId": span_.parent_id or "",
+        "name": span_.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span_.start_ns),
+        "endTimeUnixNano": str(span_.end_ns),
+        "attributes": attributes,
+        "status": status,
+    }
+
+
+class _Exporter:
+    """Background thread writing finished spans in batches; never blocks the app."""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span_: Span):
+        try:
+            self.queue.put_nowait(span_)
+        except queue.Full:
+            _count("dropped")
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, batch: list):
+        target = _settings["export"]
+        try:
+            if target.startswith(("http://", "https://")):
+                body = {"resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": _value(_settings["service"])}]},
+                    "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [to_otlp(s) for s in batch]}],
+                }]}
+                request = urllib.request.Request(target, data=json.dumps(body).encode("utf-8"),
+                                                 headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=5).close()
+            else:
+                path = target[len("jsonl:"):] if target.startswith("jsonl:") else target
+                lines = [json.dumps(dict(to_otlp(s, plain_attributes=True), service=_settings["service"]),
+                                    default=str) for s in batch]
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            _count("exported", len(batch))
+        except (OSError, ValueError):
+            _count("export_errors")
+
+    def flush(self, timeout: float = 5.0):
+        """Wait (up to timeout) until every queued span has been written."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _export(span_: Span):
+    global _exporter
+    _count("spans")
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = _Exporter()
+    _exporter.submit(span_)
+
+
+def flush(timeout: float = 5.0):
+    if _exporter is not None:
+        _exporter.flush(timeout)
+
+
+def get_tracing_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats, sample_rate=_settings["sample_rate"], export=_settings["export"])